@@ -0,0 +1,283 @@
+"""Agregados de paradas para Pareto e MTBF/MTTR.
+
+``retornar_producao`` chama ``registrar_parada_fechada`` na mesma transação
+em que fecha a parada, e os contadores são somados em duas tabelas:
+
+* ``paradas_diario``: por dia e máquina, para consultas em um período;
+* ``paradas_total``: por máquina, para a visão de todo o histórico.
+
+Dimensões: ``motivo``, ``operador``, ``hora`` (hora do dia, com a duração
+repartida entre as horas que a parada atravessa) e ``tipo`` (planejada ou
+não planejada). As telas nunca fazem GROUP BY sobre ``paradas_log``.
+"""
+from datetime import datetime, timedelta
+
+DIMENSOES = ("motivo", "operador", "hora", "tipo")
+
+
+def criar_tabelas_analise(cursor):
+    """Cria as tabelas; retorna True se acabaram de ser criadas (precisam de carga inicial)."""
+    existia = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'paradas_diario'").fetchone()
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS paradas_diario (
+        dia TEXT NOT NULL,
+        maquina TEXT NOT NULL,
+        dimensao TEXT NOT NULL,
+        chave TEXT NOT NULL,
+        quantidade INTEGER NOT NULL DEFAULT 0,
+        total_seg REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (dia, maquina, dimensao, chave)
+    )""")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_paradas_diario_dim ON paradas_diario (dimensao, dia)")
+    # recalcular_totais de uma máquina (recálculo) sem varrer todo o histórico.
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_paradas_diario_maquina ON paradas_diario (maquina, dimensao, chave)")
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS paradas_total (
+        maquina TEXT NOT NULL,
+        dimensao TEXT NOT NULL,
+        chave TEXT NOT NULL,
+        quantidade INTEGER NOT NULL DEFAULT 0,
+        total_seg REAL NOT NULL DEFAULT 0,
+        primeiro_dia TEXT,
+        PRIMARY KEY (maquina, dimensao, chave)
+    )""")
+    return not existia
+
+
+def _contribuicoes(maquina, motivo, operador, inicio, fim, planejada):
+    """Linhas (dia, maquina, dimensao, chave, quantidade, segundos) de uma parada fechada."""
+    linhas = []
+    dia_inicio = inicio.strftime("%Y-%m-%d")
+    tipo = "Planejada" if planejada else "Não planejada"
+
+    # Repartição por hora do dia; quantidade só conta na hora/dia em que a parada começou.
+    por_dia = {}
+    cursor_tempo = inicio
+    primeira = True
+    while cursor_tempo < fim:
+        proxima_hora = cursor_tempo.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+        trecho_fim = min(proxima_hora, fim)
+        segundos = (trecho_fim - cursor_tempo).total_seconds()
+        dia = cursor_tempo.strftime("%Y-%m-%d")
+        linhas.append((dia, maquina, "hora", f"{cursor_tempo.hour:02d}", 1 if primeira else 0, segundos))
+        por_dia[dia] = por_dia.get(dia, 0.0) + segundos
+        primeira = False
+        cursor_tempo = trecho_fim
+
+    if not por_dia:
+        por_dia[dia_inicio] = 0.0
+        linhas.append((dia_inicio, maquina, "hora", f"{inicio.hour:02d}", 1, 0.0))
+
+    for dia, segundos in por_dia.items():
+        quantidade = 1 if dia == dia_inicio else 0
+        linhas.append((dia, maquina, "motivo", motivo, quantidade, segundos))
+        linhas.append((dia, maquina, "operador", operador or "(sem operador)", quantidade, segundos))
+        linhas.append((dia, maquina, "tipo", tipo, quantidade, segundos))
+    return linhas
+
+
+def somar_diario(cursor, linhas):
+    """Soma linhas (dia, maquina, dimensao, chave, quantidade, segundos) a ``paradas_diario`` (não faz commit)."""
+    cursor.executemany("""
+        INSERT INTO paradas_diario (dia, maquina, dimensao, chave, quantidade, total_seg)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (dia, maquina, dimensao, chave) DO UPDATE SET
+            quantidade = quantidade + excluded.quantidade,
+            total_seg = total_seg + excluded.total_seg
+    """, linhas)
+
+
+def _somar(cursor, linhas, primeiro_dia):
+    somar_diario(cursor, linhas)
+    cursor.executemany("""
+        INSERT INTO paradas_total (maquina, dimensao, chave, quantidade, total_seg, primeiro_dia)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (maquina, dimensao, chave) DO UPDATE SET
+            quantidade = quantidade + excluded.quantidade,
+            total_seg = total_seg + excluded.total_seg,
+            primeiro_dia = MIN(COALESCE(primeiro_dia, excluded.primeiro_dia), excluded.primeiro_dia)
+    """, [(m, dim, chave, qtd, seg, primeiro_dia) for _, m, dim, chave, qtd, seg in linhas])
+
+
+def registrar_parada_fechada(cursor, maquina, motivo, operador, inicio, fim, planejada=False):
+    """Soma uma parada recém-fechada aos agregados (não faz commit)."""
+    _somar(cursor, _contribuicoes(maquina, motivo, operador, inicio, fim, planejada), inicio.strftime("%Y-%m-%d"))
+
+
+def estornar_parada_fechada(cursor, maquina, motivo, operador, inicio, fim, planejada=False):
+    """Retira dos agregados uma parada que foi estornada ou teve o motivo corrigido (não faz commit)."""
+    linhas = [(dia, m, dim, chave, -qtd, -seg)
+              for dia, m, dim, chave, qtd, seg in _contribuicoes(maquina, motivo, operador, inicio, fim, planejada)]
+    _somar(cursor, linhas, inicio.strftime("%Y-%m-%d"))
+
+
+def _paradas_fechadas(cursor, maquinas=None, dia_inicio=None, dia_fim=None):
+    sql = """
+    SELECT o.maquina, p.motivo, p.operador, p.inicio, p.fim, COALESCE(m.planejada, 0) AS planejada
+    FROM paradas_log p
+    JOIN ordens_producao o ON o.op = p.op
+    LEFT JOIN motivos_parada m ON m.motivo = p.motivo
+    WHERE p.fim IS NOT NULL
+    """
+    params = []
+    if maquinas is not None:
+        sql += f" AND o.maquina IN ({','.join('?' * len(maquinas))})"
+        params += list(maquinas)
+    # Uma parada pode atravessar a meia-noite: pega as que terminam no período ou começam nele.
+    if dia_inicio:
+        sql += " AND p.fim >= ?"
+        params.append(datetime.strptime(dia_inicio, "%Y-%m-%d"))
+    if dia_fim:
+        sql += " AND p.inicio < ?"
+        params.append(datetime.strptime(dia_fim, "%Y-%m-%d") + timedelta(days=1))
+    return cursor.execute(sql, params).fetchall()
+
+
+def linhas_diario(cursor, maquinas=None, dia_inicio=None, dia_fim=None):
+    """Linhas de ``paradas_diario`` das paradas fechadas do escopo, só as dos dias do escopo."""
+    linhas = []
+    for row in _paradas_fechadas(cursor, maquinas, dia_inicio, dia_fim):
+        for linha in _contribuicoes(row["maquina"], row["motivo"], row["operador"], row["inicio"],
+                                    row["fim"], row["planejada"]):
+            if (dia_inicio is None or linha[0] >= dia_inicio) and (dia_fim is None or linha[0] <= dia_fim):
+                linhas.append(linha)
+    return linhas
+
+
+def reconstruir_agregados(conexao, maquinas=None, dia_inicio=None, dia_fim=None):
+    """Recalcula do zero os agregados do escopo a partir de ``paradas_log``."""
+    cursor = conexao.cursor()
+    criar_tabelas_analise(cursor)
+
+    filtro, params = [], []
+    if maquinas is not None:
+        filtro.append(f"maquina IN ({','.join('?' * len(maquinas))})")
+        params += list(maquinas)
+    if dia_inicio:
+        filtro.append("dia >= ?")
+        params.append(dia_inicio)
+    if dia_fim:
+        filtro.append("dia <= ?")
+        params.append(dia_fim)
+    where = f" WHERE {' AND '.join(filtro)}" if filtro else ""
+    cursor.execute(f"DELETE FROM paradas_diario{where}", params)
+
+    linhas = linhas_diario(cursor, maquinas, dia_inicio, dia_fim)
+    somar_diario(cursor, linhas)
+
+    recalcular_totais(cursor, maquinas)
+    conexao.commit()
+    return len(linhas)
+
+
+def recalcular_totais(cursor, maquinas=None):
+    """Refaz ``paradas_total`` a partir de ``paradas_diario`` (não faz commit)."""
+    filtro, params = "", []
+    if maquinas is not None:
+        filtro = f" WHERE maquina IN ({','.join('?' * len(maquinas))})"
+        params = list(maquinas)
+    cursor.execute(f"DELETE FROM paradas_total{filtro}", params)
+    cursor.execute(f"""
+        INSERT INTO paradas_total (maquina, dimensao, chave, quantidade, total_seg, primeiro_dia)
+        SELECT maquina, dimensao, chave, SUM(quantidade), SUM(total_seg), MIN(dia)
+        FROM paradas_diario{filtro} GROUP BY maquina, dimensao, chave
+    """, params)
+
+
+def _consultar(conexao, dimensao, dia_inicio, dia_fim, agrupar_por_maquina=False):
+    coluna = "maquina" if agrupar_por_maquina else "chave"
+    if dia_inicio is None and dia_fim is None:
+        sql = f"SELECT {coluna} AS chave, SUM(quantidade) AS quantidade, SUM(total_seg) AS total_seg FROM paradas_total WHERE dimensao = ?"
+        params = [dimensao]
+    else:
+        sql = f"SELECT {coluna} AS chave, SUM(quantidade) AS quantidade, SUM(total_seg) AS total_seg FROM paradas_diario WHERE dimensao = ?"
+        params = [dimensao]
+        if dia_inicio:
+            sql += " AND dia >= ?"
+            params.append(dia_inicio)
+        if dia_fim:
+            sql += " AND dia <= ?"
+            params.append(dia_fim)
+    sql += f" GROUP BY {coluna}"
+    return conexao.execute(sql, params).fetchall()
+
+
+def pareto(conexao, dimensao, dia_inicio=None, dia_fim=None):
+    """Pareto por ``dimensao`` ("motivo", "operador", "hora", "tipo" ou "maquina").
+
+    Ordenado por tempo parado, com percentual e percentual acumulado. A
+    dimensão "hora" volta em ordem de hora do dia.
+    """
+    if dimensao == "maquina":
+        linhas = _consultar(conexao, "motivo", dia_inicio, dia_fim, agrupar_por_maquina=True)
+    else:
+        linhas = _consultar(conexao, dimensao, dia_inicio, dia_fim)
+
+    resultado = [{"chave": r["chave"], "quantidade": r["quantidade"], "total_seg": r["total_seg"]} for r in linhas]
+    if dimensao == "hora":
+        resultado.sort(key=lambda r: r["chave"])
+    else:
+        resultado.sort(key=lambda r: r["total_seg"], reverse=True)
+
+    total = sum(r["total_seg"] for r in resultado) or 1
+    acumulado = 0.0
+    for r in resultado:
+        acumulado += r["total_seg"]
+        r["pct"] = r["total_seg"] / total * 100
+        r["pct_acumulado"] = acumulado / total * 100
+    return resultado
+
+
+def mtbf_mttr(conexao, dia_inicio=None, dia_fim=None, agora=None):
+    """MTBF e MTTR (em horas) por máquina, só com paradas não planejadas.
+
+    O tempo entre falhas é o período considerado menos todo o tempo parado;
+    sem período, conta a partir do primeiro dia com parada registrada.
+    """
+    agora = agora or datetime.now()
+
+    if dia_inicio is None and dia_fim is None:
+        sql = "SELECT maquina, chave, quantidade, total_seg, primeiro_dia FROM paradas_total WHERE dimensao = 'tipo'"
+        rows = conexao.execute(sql).fetchall()
+    else:
+        sql = """SELECT maquina, chave, SUM(quantidade) AS quantidade, SUM(total_seg) AS total_seg, MIN(dia) AS primeiro_dia
+                 FROM paradas_diario WHERE dimensao = 'tipo'"""
+        params = []
+        if dia_inicio:
+            sql += " AND dia >= ?"
+            params.append(dia_inicio)
+        if dia_fim:
+            sql += " AND dia <= ?"
+            params.append(dia_fim)
+        rows = conexao.execute(sql + " GROUP BY maquina, chave", params).fetchall()
+
+    por_maquina = {}
+    for r in rows:
+        dados = por_maquina.setdefault(r["maquina"], {"falhas": 0, "reparo_seg": 0.0, "parado_seg": 0.0, "primeira": None})
+        dados["parado_seg"] += r["total_seg"]
+        if r["chave"] == "Não planejada":
+            dados["falhas"] += r["quantidade"]
+            dados["reparo_seg"] += r["total_seg"]
+        primeira = datetime.strptime(r["primeiro_dia"], "%Y-%m-%d") if r["primeiro_dia"] else None
+        if primeira and (dados["primeira"] is None or primeira < dados["primeira"]):
+            dados["primeira"] = primeira
+
+    inicio_periodo = datetime.strptime(dia_inicio, "%Y-%m-%d") if dia_inicio else None
+    fim_periodo = datetime.strptime(dia_fim, "%Y-%m-%d") + timedelta(days=1) if dia_fim else agora
+    fim_periodo = min(fim_periodo, agora)
+
+    resultado = []
+    for maquina, dados in sorted(por_maquina.items()):
+        inicio = inicio_periodo or dados["primeira"] or agora
+        operando_seg = max((fim_periodo - inicio).total_seconds() - dados["parado_seg"], 0.0)
+        falhas = dados["falhas"]
+        resultado.append({
+            "maquina": maquina,
+            "falhas": falhas,
+            "mtbf_h": operando_seg / falhas / 3600 if falhas else None,
+            "mttr_h": dados["reparo_seg"] / falhas / 3600 if falhas else None,
+        })
+    return resultado
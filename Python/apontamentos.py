@@ -0,0 +1,281 @@
+"""Diário de apontamentos: registro só de inserções de toda ação do operador.
+
+Cada transição de ``transicoes`` grava uma linha em ``apontamentos`` (quem,
+o quê, quando, de qual terminal) na mesma transação em que muda
+``ordens_producao``/``paradas_log``; essas tabelas são a projeção corrente do
+diário. Nada no diário é alterado ou apagado (gatilhos abortam): um erro
+se corrige com um lançamento de compensação que aponta para o original em
+``corrige``:
+
+* ``estorno`` de peças: subtrai as peças do apontamento original;
+* ``estorno`` de parada: remove a parada da projeção (e dos agregados de
+  ``analise_paradas``); se ela ainda estava aberta, a máquina volta a produzir;
+* ``corrigir_motivo``: troca o motivo de uma parada.
+
+``produzido`` de cada OP é sempre a soma das peças do diário (incluindo o
+saldo de ``abertura`` das OPs que já tinham produção quando o diário foi
+criado); ``verificar_projecao`` aponta divergências e ``reconstruir_produzido``
+refaz a coluna a partir do diário. ``paradas_log`` também sai do diário,
+repassado em ordem: ``parar`` (ou a ``recuperacao`` com motivo) abre a
+parada ``parada_id`` no ``momento``; ``retomar``, a ``recuperacao`` sem
+motivo e o ``finalizar``/``cancelar`` em lote a fecham; ``corrigir_motivo``
+troca o motivo e o ``estorno`` do ``parar`` a remove. ``verificar_paradas``
+e ``reconstruir_paradas`` comparam e refazem as paradas que o diário conhece
+(as anteriores a ele ficam como estão).
+
+Sem o diário local, cada ação do operador grava a sua linha na própria
+transação da transição (``transicoes.iniciar``, ``apontar_producao``...):
+um terminal faz uma ação por vez, então não há o que agrupar. Os lotes
+sincronizados do diário local já vão numa transação só.
+"""
+from datetime import datetime
+
+import transicoes
+from analise_paradas import estornar_parada_fechada, reconstruir_agregados, registrar_parada_fechada
+from transicoes import TransicaoInvalida
+
+
+def criar_diario_apontamentos(cursor):
+    """Cria a tabela e os gatilhos; devolve True se a tabela é nova."""
+    nova = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'apontamentos'").fetchone() is None
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS apontamentos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        uuid TEXT UNIQUE,
+        momento TIMESTAMP NOT NULL,
+        registrado_em TIMESTAMP NOT NULL,
+        terminal TEXT,
+        operador TEXT,
+        acao TEXT NOT NULL,
+        op TEXT NOT NULL,
+        pecas INTEGER,
+        motivo TEXT,
+        parada_id INTEGER,
+        corrige INTEGER REFERENCES apontamentos (id),
+        observacao TEXT
+    )""")
+    # (op, id): último apontamento da OP sem ordenar, com ou sem filtro de ação.
+    cursor.execute("DROP INDEX IF EXISTS idx_apontamentos_op")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_apontamentos_op_id ON apontamentos (op, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_apontamentos_corrige ON apontamentos (corrige) WHERE corrige IS NOT NULL")
+    cursor.execute("""
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_apontamentos_estorno_unico ON apontamentos (corrige)
+    WHERE acao = 'estorno'""")
+
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_apontamentos_sem_update BEFORE UPDATE ON apontamentos
+    BEGIN SELECT RAISE(ABORT, 'apontamentos aceita apenas inserções'); END""")
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_apontamentos_sem_delete BEFORE DELETE ON apontamentos
+    BEGIN SELECT RAISE(ABORT, 'apontamentos aceita apenas inserções'); END""")
+
+    if nova:
+        registrar_saldos_iniciais(cursor)
+    return nova
+
+
+def registrar_saldos_iniciais(cursor):
+    """Lança ``abertura`` com o produzido das OPs que ainda não têm nenhum apontamento."""
+    cursor.execute("""
+        INSERT INTO apontamentos (momento, registrado_em, acao, op, pecas, observacao)
+        SELECT :agora, :agora, 'abertura', op, produzido, 'saldo anterior ao diário' FROM ordens_producao o
+        WHERE produzido != 0 AND NOT EXISTS (SELECT 1 FROM apontamentos a WHERE a.op = o.op)
+    """, {"agora": datetime.now()})
+
+
+def _original(cursor, id_apontamento):
+    original = cursor.execute("SELECT * FROM apontamentos WHERE id = ?", (id_apontamento,)).fetchone()
+    if original is None:
+        raise TransicaoInvalida(f"O apontamento {id_apontamento} não existe.")
+    if cursor.execute("SELECT 1 FROM apontamentos WHERE corrige = ? AND acao = 'estorno'",
+                      (id_apontamento,)).fetchone():
+        raise TransicaoInvalida(f"O apontamento {id_apontamento} já foi estornado.")
+    return original
+
+
+def _parada(cursor, original):
+    parada = cursor.execute("""
+        SELECT p.id, p.motivo, p.operador, p.inicio AS "inicio [timestamp]", p.fim AS "fim [timestamp]",
+               o.maquina, COALESCE(m.planejada, 0) AS planejada
+        FROM paradas_log p
+        JOIN ordens_producao o ON o.op = p.op
+        LEFT JOIN motivos_parada m ON m.motivo = p.motivo
+        WHERE p.id = ?
+    """, (original["parada_id"],)).fetchone()
+    if parada is None:
+        raise TransicaoInvalida(f"A parada do apontamento {original['id']} não está mais registrada.")
+    return parada
+
+
+def estornar(conexao, id_apontamento, operador, terminal=None, observacao=None):
+    """Compensa um apontamento de peças ou de parada. Devolve o id do estorno."""
+    agora = datetime.now()
+    with transicoes.transacao(conexao, "estornar") as cursor:
+        original = _original(cursor, id_apontamento)
+        pecas = None
+        if original["acao"] == "apontar_producao":
+            pecas = -original["pecas"]
+            cursor.execute("UPDATE ordens_producao SET produzido = produzido + ? WHERE op = ?",
+                           (pecas, original["op"]))
+        elif original["acao"] == "parar":
+            parada = _parada(cursor, original)
+            if parada["fim"] is None:
+                cursor.execute("UPDATE maquinas_status SET status = 'PRODUZINDO' WHERE maquina = ? AND status = 'PARADA'",
+                               (parada["maquina"],))
+            else:
+                estornar_parada_fechada(cursor, parada["maquina"], parada["motivo"], parada["operador"],
+                                        parada["inicio"], parada["fim"], parada["planejada"])
+            cursor.execute("DELETE FROM paradas_log WHERE id = ?", (parada["id"],))
+        else:
+            raise TransicaoInvalida("Só apontamentos de peças e de parada podem ser estornados.")
+        return transicoes.anotar(cursor, "estorno", original["op"], agora, pecas=pecas, motivo=original["motivo"],
+                                 operador=operador, terminal=terminal, corrige=id_apontamento, observacao=observacao)
+
+
+def corrigir_motivo(conexao, id_apontamento, motivo, operador, terminal=None, observacao=None):
+    """Troca o motivo da parada aberta pelo apontamento ``id_apontamento``. Devolve o id da correção."""
+    agora = datetime.now()
+    with transicoes.transacao(conexao, "corrigir_motivo") as cursor:
+        original = _original(cursor, id_apontamento)
+        if original["acao"] != "parar":
+            raise TransicaoInvalida("Só apontamentos de parada têm motivo para corrigir.")
+        parada = _parada(cursor, original)
+        if parada["fim"] is not None:
+            estornar_parada_fechada(cursor, parada["maquina"], parada["motivo"], parada["operador"],
+                                    parada["inicio"], parada["fim"], parada["planejada"])
+            planejada = cursor.execute("SELECT COALESCE(MAX(planejada), 0) FROM motivos_parada WHERE motivo = ?",
+                                       (motivo,)).fetchone()[0]
+            registrar_parada_fechada(cursor, parada["maquina"], motivo, parada["operador"],
+                                     parada["inicio"], parada["fim"], planejada)
+        cursor.execute("UPDATE paradas_log SET motivo = ? WHERE id = ?", (motivo, parada["id"]))
+        return transicoes.anotar(cursor, "corrigir_motivo", original["op"], agora, motivo=motivo, operador=operador,
+                                 terminal=terminal, parada_id=parada["id"], corrige=id_apontamento,
+                                 observacao=observacao)
+
+
+def listar(conexao, op=None, limite=200):
+    """Últimos apontamentos (mais recentes primeiro), com a marca de estornado."""
+    sql = """
+        SELECT a.id, a.momento AS "momento [timestamp]", a.terminal, a.operador, a.acao, a.op, a.pecas,
+               a.motivo, a.corrige,
+               EXISTS (SELECT 1 FROM apontamentos e WHERE e.corrige = a.id AND e.acao = 'estorno') AS estornado
+        FROM apontamentos a
+    """
+    parametros = []
+    if op:
+        sql += " WHERE a.op = ?"
+        parametros.append(op)
+    sql += " ORDER BY a.id DESC LIMIT ?"
+    parametros.append(limite)
+    return [dict(r) for r in conexao.execute(sql, parametros)]
+
+
+_SOMA_DIARIO = "SELECT op, SUM(pecas) AS pecas FROM apontamentos WHERE pecas IS NOT NULL GROUP BY op"
+
+
+def verificar_projecao(conexao):
+    """OPs cujo ``produzido`` difere da soma do diário: [(op, produzido, soma do diário)]."""
+    return [tuple(r) for r in conexao.execute(f"""
+        SELECT o.op, o.produzido, COALESCE(d.pecas, 0) FROM ordens_producao o
+        LEFT JOIN ({_SOMA_DIARIO}) d ON d.op = o.op
+        WHERE o.produzido != COALESCE(d.pecas, 0)
+    """)]
+
+
+def reconstruir_produzido(conexao):
+    """Refaz ``ordens_producao.produzido`` a partir do diário; devolve quantas OPs mudaram."""
+    with transicoes.transacao(conexao, "reconstruir_produzido") as cursor:
+        return cursor.execute(f"""
+            UPDATE ordens_producao SET produzido = COALESCE((SELECT d.pecas FROM ({_SOMA_DIARIO}) d
+                                                            WHERE d.op = ordens_producao.op), 0)
+            WHERE produzido != COALESCE((SELECT d.pecas FROM ({_SOMA_DIARIO}) d WHERE d.op = ordens_producao.op), 0)
+        """).rowcount
+
+
+def _paradas_do_diario(cursor):
+    """Repassa o diário: ({id: (op, motivo, operador, inicio, fim)}, ids estornados)."""
+    paradas, estornadas, abertura = {}, set(), {}
+    for row in cursor.execute("""
+        SELECT id, acao, op, operador, motivo, parada_id, corrige, momento AS "momento [timestamp]"
+        FROM apontamentos
+        WHERE parada_id IS NOT NULL OR acao IN ('retomar', 'finalizar', 'cancelar', 'estorno')
+        ORDER BY id
+    """):
+        acao, parada_id = row["acao"], row["parada_id"]
+        abre = acao == "parar" or (acao == "recuperacao" and row["motivo"] is not None)
+        if abre and parada_id is not None:
+            paradas[parada_id] = [row["op"], row["motivo"], row["operador"], row["momento"], None]
+            abertura[row["id"]] = parada_id
+            continue
+        if acao == "estorno":
+            parada_id = abertura.get(row["corrige"])
+            if parada_id in paradas:
+                del paradas[parada_id]
+                estornadas.add(parada_id)
+            continue
+        if acao == "corrigir_motivo":
+            if parada_id in paradas:
+                paradas[parada_id][1] = row["motivo"]
+            continue
+
+        if acao in ("finalizar", "cancelar"):
+            fechar = [i for i, p in paradas.items() if p[0] == row["op"] and p[4] is None]
+        elif acao == "retomar" and parada_id is None:
+            # Linhas de antes de ``retomar`` anotar a parada: a última aberta da OP.
+            fechar = [max((i for i, p in paradas.items() if p[0] == row["op"] and p[4] is None), default=None)]
+        else:
+            fechar = [parada_id]
+        for i in fechar:
+            if i in paradas and paradas[i][4] is None:
+                paradas[i][4] = row["momento"]
+    return {i: tuple(p) for i, p in paradas.items()}, estornadas
+
+
+def _paradas_gravadas(cursor, ids):
+    gravadas = {}
+    for row in cursor.execute("""
+        SELECT id, op, motivo, operador, inicio AS "inicio [timestamp]", fim AS "fim [timestamp]"
+        FROM paradas_log
+    """):
+        if row["id"] in ids:
+            gravadas[row["id"]] = tuple(row)[1:]
+    return gravadas
+
+
+def verificar_paradas(conexao):
+    """Paradas que diferem do diário: [(id, gravada, diário)], com None onde a parada não existe."""
+    cursor = conexao.cursor()
+    esperadas, estornadas = _paradas_do_diario(cursor)
+    gravadas = _paradas_gravadas(cursor, esperadas.keys() | estornadas)
+    return [(i, gravadas.get(i), esperadas.get(i)) for i in sorted(esperadas.keys() | gravadas.keys())
+            if gravadas.get(i) != esperadas.get(i)]
+
+
+def reconstruir_paradas(conexao):
+    """Refaz ``paradas_log`` (e os agregados das máquinas afetadas) a partir do diário; devolve quantas mudaram."""
+    with transicoes.transacao(conexao, "reconstruir_paradas") as cursor:
+        esperadas, estornadas = _paradas_do_diario(cursor)
+        gravadas = _paradas_gravadas(cursor, esperadas.keys() | estornadas)
+        divergentes = [i for i in esperadas.keys() | gravadas.keys() if gravadas.get(i) != esperadas.get(i)]
+        ops = set()
+        for i in divergentes:
+            if i not in esperadas:
+                ops.add(gravadas[i][0])
+                cursor.execute("DELETE FROM paradas_log WHERE id = ?", (i,))
+                continue
+            op, motivo, operador, inicio, fim = esperadas[i]
+            ops.add(op)
+            cursor.execute("""
+                INSERT INTO paradas_log (id, op, motivo, inicio, fim, duracao_seg, operador)
+                VALUES (:id, :op, :motivo, :inicio, :fim,
+                        COALESCE(CAST(ROUND((julianday(:fim) - julianday(:inicio)) * 86400) AS INTEGER), 0), :operador)
+                ON CONFLICT (id) DO UPDATE SET op = excluded.op, motivo = excluded.motivo, inicio = excluded.inicio,
+                    fim = excluded.fim, duracao_seg = excluded.duracao_seg, operador = excluded.operador
+            """, {"id": i, "op": op, "motivo": motivo, "inicio": inicio, "fim": fim, "operador": operador})
+        maquinas = sorted({r[0] for r in cursor.execute(
+            f"SELECT DISTINCT maquina FROM ordens_producao WHERE op IN ({','.join('?' * len(ops))})", list(ops))})
+    if maquinas:
+        reconstruir_agregados(conexao, maquinas)
+    return len(divergentes)
@@ -0,0 +1,92 @@
+"""Onde o banco de produção mora: arquivo em disco ou memória compartilhada.
+
+``BancoProducao("producao.db")`` é o modo normal. ``BancoProducao("memoria:demo")``
+usa a URI ``file:demo?mode=memory&cache=shared``: todas as conexões do
+processo (telas, job de KPI, sincronizador) enxergam o mesmo banco, nada vai
+para o disco e nada sobra depois da execução. Um banco em memória some
+quando a última conexão fecha, então o objeto segura uma conexão âncora até
+``fechar()``.
+
+Para demos e testes, ``carregar`` semeia o banco copiando um snapshot pronto
+(arquivo ou outro banco em memória) com a API de backup, página a página,
+em vez de refazer o ``inicializar_db`` e os INSERTs linha a linha. Com
+``isolado()`` cada cenário ganha um banco em memória com nome próprio.
+
+Em memória compartilhada o SQLite trava por tabela e devolve "database
+table is locked" na hora, sem esperar o ``timeout``; serve para demo e
+testes, não para vários terminais de produção.
+"""
+import itertools
+import os
+import sqlite3
+
+PREFIXO_MEMORIA = "memoria:"
+
+_sequencia = itertools.count(1)
+
+
+def uri_memoria(nome):
+    return f"file:{nome}?mode=memory&cache=shared"
+
+
+class BancoProducao:
+    def __init__(self, destino="producao.db"):
+        self.destino = destino
+        self.memoria = destino[len(PREFIXO_MEMORIA):] if destino.startswith(PREFIXO_MEMORIA) else None
+        self._ancora = self.conectar() if self.memoria else None
+
+    @classmethod
+    def isolado(cls, prefixo="teste", origem=None):
+        """Banco em memória com nome único (um por cenário de teste), opcionalmente já semeado."""
+        banco = cls(f"{PREFIXO_MEMORIA}{prefixo}_{os.getpid()}_{next(_sequencia)}")
+        if origem is not None:
+            banco.carregar(origem)
+        return banco
+
+    @property
+    def alvo(self):
+        """Caminho ou URI para ``sqlite3.connect``."""
+        return uri_memoria(self.memoria) if self.memoria else self.destino
+
+    def derivado(self, sufixo, caminho):
+        """Banco auxiliar (diário local, réplica) no mesmo modo deste: ``caminho`` em disco ou memória."""
+        if self.memoria:
+            return BancoProducao(f"{PREFIXO_MEMORIA}{self.memoria}_{sufixo}")
+        return BancoProducao(caminho)
+
+    def conectar(self):
+        conexao = sqlite3.connect(
+            self.alvo,
+            uri=self.memoria is not None,
+            detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES
+        )
+        conexao.row_factory = sqlite3.Row
+        return conexao
+
+    def carregar(self, origem):
+        """Substitui o conteúdo pelo de ``origem`` (caminho de arquivo ou outro ``BancoProducao``)."""
+        fonte = origem.conectar() if isinstance(origem, BancoProducao) else sqlite3.connect(f"file:{origem}?mode=ro", uri=True)
+        destino = self.conectar()
+        try:
+            fonte.backup(destino)
+        finally:
+            fonte.close()
+            destino.close()
+
+    def salvar(self, caminho):
+        """Grava uma cópia em ``caminho`` (para virar snapshot de fixtures)."""
+        fonte = self.conectar()
+        destino = sqlite3.connect(caminho)
+        try:
+            fonte.backup(destino)
+        finally:
+            fonte.close()
+            destino.close()
+
+    def fechar(self):
+        if self._ancora:
+            self._ancora.close()
+            self._ancora = None
+
+    def __repr__(self):
+        return f"BancoProducao({self.destino!r})"
@@ -0,0 +1,99 @@
+"""Busca incremental de OPs por número e produto, para os campos de digitação.
+
+Usa o índice FTS5 ``ops_fts`` (com índice de prefixo), mantido por
+gatilhos sobre ``ordens_producao``. O status também é indexado, então o
+filtro "só pendentes" é resolvido dentro do FTS: só as OPs que casam com o
+termo são lidas e ordenadas por prazo antes do LIMIT, qualquer que seja o
+tamanho da carteira. Se o SQLite não tiver FTS5, a busca cai para prefixo
+na chave primária ``op`` ou no ``produto`` (``idx_ordens_produto``).
+
+``ops_fts`` aponta para o rowid de ``ordens_producao``, que o VACUUM pode
+renumerar: depois de um VACUUM chame ``reconstruir_indice_busca``.
+"""
+import re
+import sqlite3
+
+LIMITE_PADRAO = 20
+
+
+def criar_indice_busca(cursor):
+    """Cria o índice e os gatilhos; devolve False se o SQLite não tem FTS5."""
+    existia = cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'ops_fts'").fetchone()
+    try:
+        cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS ops_fts USING fts5(
+            op, produto, status,
+            content='ordens_producao', content_rowid='rowid',
+            tokenize='unicode61 remove_diacritics 2', prefix='1 2 3'
+        )""")
+    except sqlite3.OperationalError:
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_ordens_produto ON ordens_producao (produto COLLATE NOCASE)")
+        return False
+
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_ops_fts_insert AFTER INSERT ON ordens_producao BEGIN
+        INSERT INTO ops_fts (rowid, op, produto, status) VALUES (NEW.rowid, NEW.op, NEW.produto, NEW.status);
+    END""")
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_ops_fts_delete AFTER DELETE ON ordens_producao BEGIN
+        INSERT INTO ops_fts (ops_fts, rowid, op, produto, status) VALUES ('delete', OLD.rowid, OLD.op, OLD.produto, OLD.status);
+    END""")
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_ops_fts_update AFTER UPDATE OF op, produto, status ON ordens_producao BEGIN
+        INSERT INTO ops_fts (ops_fts, rowid, op, produto, status) VALUES ('delete', OLD.rowid, OLD.op, OLD.produto, OLD.status);
+        INSERT INTO ops_fts (rowid, op, produto, status) VALUES (NEW.rowid, NEW.op, NEW.produto, NEW.status);
+    END""")
+
+    if not existia:
+        cursor.execute("INSERT INTO ops_fts (ops_fts) VALUES ('rebuild')")
+    return True
+
+
+def reconstruir_indice_busca(conexao):
+    if not _tem_fts(conexao):
+        return
+    conexao.execute("INSERT INTO ops_fts (ops_fts) VALUES ('rebuild')")
+    conexao.commit()
+
+
+def _tem_fts(conexao):
+    return conexao.execute("SELECT 1 FROM sqlite_master WHERE name = 'ops_fts'").fetchone() is not None
+
+
+def _expressao_fts(termo, status):
+    # Cada palavra digitada vira um prefixo; aspas evitam que hífen ou dois-pontos virem operadores.
+    palavras = re.findall(r"\w+", termo)
+    if not palavras:
+        return None
+    expressao = "{op produto}: (" + " AND ".join(f'"{p}"*' for p in palavras) + ")"
+    if status:
+        expressao = f'status: "{status}" AND ' + expressao
+    return expressao
+
+
+def buscar_ops(conexao, termo, status=None, limite=LIMITE_PADRAO):
+    """OPs cujo número ou produto começam com as palavras digitadas (ordem: prazo, OP)."""
+    termo = termo.strip()
+    if not termo:
+        return []
+
+    if _tem_fts(conexao):
+        expressao = _expressao_fts(termo, status)
+        if expressao is None:
+            return []
+        rows = conexao.execute("""
+            SELECT o.op, o.produto, o.maquina, o.status, o.prazo
+            FROM ops_fts f JOIN ordens_producao o ON o.rowid = f.rowid
+            WHERE ops_fts MATCH ? ORDER BY o.prazo IS NULL, o.prazo, o.op LIMIT ?
+        """, (expressao, limite)).fetchall()
+    else:
+        sql = """
+            SELECT op, produto, maquina, status, prazo FROM ordens_producao
+            WHERE ((op >= :de AND op < :ate) OR (produto >= :de COLLATE NOCASE AND produto < :ate COLLATE NOCASE))
+        """
+        parametros = {"de": termo, "ate": termo + "\uffff", "status": status, "limite": limite}
+        if status:
+            sql += " AND status = :status"
+        rows = conexao.execute(sql + " ORDER BY prazo IS NULL, prazo, op LIMIT :limite", parametros).fetchall()
+
+    return [dict(r) for r in rows]
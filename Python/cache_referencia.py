@@ -0,0 +1,178 @@
+"""Cache em memória dos cadastros: motivos, máquinas, usuários e cabeçalhos de OP.
+
+Cada cadastro tem um contador em ``versoes_cadastro``, incrementado por
+gatilho a cada escrita, venha de qualquer processo ou terminal. O cache só
+consulta esses contadores quando ``PRAGMA data_version`` indica que o banco
+mudou, e descarta apenas os cadastros cujo contador andou. Escritas feitas
+pela própria aplicação passam por ``apos_escrita``, que atualiza o cache na
+hora em vez de recarregar a tabela inteira.
+
+Se o banco ficar inacessível, o cache continua servindo a última versão lida.
+"""
+import sqlite3
+
+# Colunas que formam o cabeçalho da OP; produzido/status mudam o tempo todo e não invalidam o cache.
+COLUNAS_CABECALHO_OP = ("produto", "planejado", "maquina", "meta_hora", "prazo")
+
+
+def criar_versoes_cadastro(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS versoes_cadastro (
+        tabela TEXT PRIMARY KEY,
+        versao INTEGER NOT NULL
+    )""")
+
+    gatilhos = [
+        ("motivos_parada", "motivos_parada", "INSERT"),
+        ("motivos_parada", "motivos_parada", "UPDATE"),
+        ("motivos_parada", "motivos_parada", "DELETE"),
+        ("usuarios", "usuarios", "INSERT"),
+        ("usuarios", "usuarios", "UPDATE"),
+        ("usuarios", "usuarios", "DELETE"),
+        ("maquinas", "maquinas_status", "INSERT"),
+        ("maquinas", "maquinas_status", "DELETE"),
+        ("ordens_producao", "ordens_producao", "INSERT"),
+        ("ordens_producao", "ordens_producao", "UPDATE OF " + ", ".join(COLUNAS_CABECALHO_OP)),
+        ("ordens_producao", "ordens_producao", "DELETE"),
+    ]
+    for cadastro, tabela, evento in gatilhos:
+        nome = f"trg_versao_{tabela}_{evento.split()[0].lower()}"
+        cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {nome} AFTER {evento} ON {tabela}
+        BEGIN
+            INSERT INTO versoes_cadastro (tabela, versao) VALUES ('{cadastro}', 1)
+            ON CONFLICT (tabela) DO UPDATE SET versao = versao + 1;
+        END""")
+
+
+class _Registro:
+    __slots__ = ()
+
+    def __init__(self, *valores):
+        for campo, valor in zip(self.__slots__, valores):
+            setattr(self, campo, valor)
+
+    def __repr__(self):
+        campos = ", ".join(f"{c}={getattr(self, c)!r}" for c in self.__slots__)
+        return f"{type(self).__name__}({campos})"
+
+
+class Motivo(_Registro):
+    __slots__ = ("motivo", "planejada")
+
+
+class Usuario(_Registro):
+    __slots__ = ("usuario", "senha", "perfil")
+
+
+class Maquina(_Registro):
+    __slots__ = ("maquina",)
+
+
+class CabecalhoOP(_Registro):
+    __slots__ = ("op",) + COLUNAS_CABECALHO_OP
+
+
+# cadastro -> (consulta, tipo do registro); a primeira coluna é a chave.
+CONSULTAS = {
+    "motivos_parada": ("SELECT motivo, planejada FROM motivos_parada ORDER BY motivo", Motivo),
+    "usuarios": ("SELECT usuario, senha, perfil FROM usuarios", Usuario),
+    "maquinas": ("SELECT maquina FROM maquinas_status ORDER BY maquina", Maquina),
+    "ordens_producao": ("SELECT op, " + ", ".join(COLUNAS_CABECALHO_OP) + " FROM ordens_producao", CabecalhoOP),
+}
+
+
+class CacheReferencia:
+    def __init__(self, conectar):
+        self.conectar = conectar
+        self.conexao = None
+        self.data_version = None
+        self.versoes = {}
+        self.dados = {}
+
+    def _versoes_atuais(self, conexao):
+        return dict(conexao.execute("SELECT tabela, versao FROM versoes_cadastro").fetchall())
+
+    def _validar(self):
+        """Descarta os cadastros alterados desde a última leitura; devolve a conexão ou None."""
+        try:
+            if self.conexao is None:
+                self.conexao = self.conectar()
+                if not self.conexao:
+                    return None
+            data_version = self.conexao.execute("PRAGMA data_version").fetchone()[0]
+            if data_version != self.data_version:
+                self.data_version = data_version
+                atuais = self._versoes_atuais(self.conexao)
+                for cadastro in [c for c in self.dados if atuais.get(c, 0) != self.versoes.get(c)]:
+                    del self.dados[cadastro]
+            return self.conexao
+        except sqlite3.Error as e:
+            print(f"Cache de cadastros usando dados antigos: {e}")
+            self.fechar()
+            return None
+
+    def _cadastro(self, cadastro):
+        conexao = self._validar()
+        registros = self.dados.get(cadastro)
+        if registros is not None or conexao is None:
+            return registros or {}
+        try:
+            # A versão é lida antes dos dados: no pior caso recarrega à toa, nunca guarda dado velho.
+            versao = self._versoes_atuais(conexao).get(cadastro, 0)
+            consulta, tipo = CONSULTAS[cadastro]
+            registros = {row[0]: tipo(*row) for row in conexao.execute(consulta)}
+        except sqlite3.Error as e:
+            print(f"Erro ao carregar o cadastro '{cadastro}': {e}")
+            return {}
+        self.dados[cadastro] = registros
+        self.versoes[cadastro] = versao
+        return registros
+
+    def motivos(self):
+        return list(self._cadastro("motivos_parada").values())
+
+    def usuario(self, usuario):
+        return self._cadastro("usuarios").get(usuario)
+
+    def maquinas(self):
+        return list(self._cadastro("maquinas"))
+
+    def cabecalho_op(self, op):
+        return self._cadastro("ordens_producao").get(op)
+
+    def apos_escrita(self, cadastro, registro=None):
+        """Aplica uma escrita já confirmada pela aplicação (write-through).
+
+        Se o contador avançou exatamente uma vez desde a leitura, a escrita foi a
+        nossa e o registro entra no cache; senão o cadastro é descartado.
+        """
+        registros = self.dados.get(cadastro)
+        if registros is None:
+            return
+        versao = None
+        if self.conexao:
+            try:
+                versao = self._versoes_atuais(self.conexao).get(cadastro, 0)
+            except sqlite3.Error:
+                pass
+        if registro is not None and versao == self.versoes[cadastro] + 1:
+            chave = getattr(registro, registro.__slots__[0])
+            registros[chave] = registro
+            if cadastro in ("motivos_parada", "maquinas"):
+                self.dados[cadastro] = dict(sorted(registros.items()))
+            self.versoes[cadastro] = versao
+        else:
+            del self.dados[cadastro]
+
+    def invalidar(self, cadastro=None):
+        if cadastro is None:
+            self.dados.clear()
+        else:
+            self.dados.pop(cadastro, None)
+
+    def fechar(self):
+        if self.conexao:
+            self.conexao.close()
+        self.conexao = None
+        self.data_version = None
@@ -0,0 +1,294 @@
+"""Calendário de turnos e de paradas planejadas.
+
+Turnos e janelas recorrentes (refeição, ginástica laboral, ...) são
+definidos por hora do dia e dias da semana; como se repetem toda semana,
+o índice guarda uma única semana e consultas sobre meses de operação são
+resolvidas com semanas inteiras + dois pedaços, em O(log n). Paradas
+programadas pontuais (manutenção preventiva, feriado) ficam em um índice
+próprio por máquina. Nenhuma consulta percorre a lista de intervalos.
+"""
+import bisect
+from datetime import datetime, timedelta
+
+SEMANA_SEG = 7 * 24 * 3600
+DIA_SEG = 24 * 3600
+# Segunda-feira qualquer, usada como origem da semana do índice.
+ORIGEM = datetime(2000, 1, 3)
+TODOS_OS_DIAS = "0123456"
+
+
+def criar_tabelas_calendario(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS turnos (
+        nome TEXT PRIMARY KEY,
+        hora_inicio TEXT NOT NULL,
+        hora_fim TEXT NOT NULL,
+        dias_semana TEXT NOT NULL DEFAULT '0123456'
+    )""")
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS janelas_planejadas (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        descricao TEXT NOT NULL,
+        hora_inicio TEXT NOT NULL,
+        hora_fim TEXT NOT NULL,
+        dias_semana TEXT NOT NULL DEFAULT '0123456'
+    )""")
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS paradas_programadas (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        descricao TEXT NOT NULL,
+        maquina TEXT,
+        inicio TIMESTAMP NOT NULL,
+        fim TIMESTAMP NOT NULL
+    )""")
+
+
+def _segundos(quando):
+    return (quando - ORIGEM).total_seconds()
+
+
+def _hora_para_seg(hora):
+    horas, minutos = hora.split(":")
+    return int(horas) * 3600 + int(minutos) * 60
+
+
+def _expandir_semana(hora_inicio, hora_fim, dias_semana):
+    """Converte uma janela diária em intervalos dentro da semana [0, SEMANA_SEG).
+
+    Cada intervalo vem com o início real da janela: no pedaço que passa de
+    domingo para segunda ele é negativo (a janela começou na semana anterior).
+    """
+    inicio, fim = _hora_para_seg(hora_inicio), _hora_para_seg(hora_fim)
+    if fim <= inicio:
+        fim += DIA_SEG
+    intervalos = []
+    for dia in dias_semana:
+        base = int(dia) * DIA_SEG
+        a, b = base + inicio, base + fim
+        if b <= SEMANA_SEG:
+            intervalos.append(((a, b), a))
+        else:
+            intervalos.append(((a, SEMANA_SEG), a))
+            intervalos.append(((0, b - SEMANA_SEG), a - SEMANA_SEG))
+    return intervalos
+
+
+class IndiceIntervalos:
+    """Intervalos disjuntos e ordenados com soma acumulada para consultas O(log n)."""
+
+    def __init__(self, intervalos, rotulos=None):
+        pares = sorted(zip(intervalos, rotulos or [None] * len(intervalos)))
+        self.inicios, self.fins, self.rotulos = [], [], []
+        for (a, b), rotulo in pares:
+            if b <= a:
+                continue
+            if self.fins and a <= self.fins[-1]:
+                self.fins[-1] = max(self.fins[-1], b)
+                if rotulo and not self.rotulos[-1]:
+                    self.rotulos[-1] = rotulo
+                elif rotulo and rotulo not in self.rotulos[-1]:
+                    self.rotulos[-1] = f"{self.rotulos[-1]} / {rotulo}"
+                continue
+            self.inicios.append(a)
+            self.fins.append(b)
+            self.rotulos.append(rotulo)
+
+        self.acumulado = [0.0]
+        for a, b in zip(self.inicios, self.fins):
+            self.acumulado.append(self.acumulado[-1] + (b - a))
+
+    def total(self):
+        return self.acumulado[-1]
+
+    def em(self, t):
+        i = bisect.bisect_right(self.inicios, t) - 1
+        if i >= 0 and t < self.fins[i]:
+            return self.rotulos[i] or True
+        return None
+
+    def _coberto_ate(self, x):
+        i = bisect.bisect_right(self.inicios, x) - 1
+        if i < 0:
+            return 0.0
+        return self.acumulado[i] + min(x, self.fins[i]) - self.inicios[i]
+
+    def sobreposicao(self, a, b):
+        if b <= a:
+            return 0.0
+        return self._coberto_ate(b) - self._coberto_ate(a)
+
+    def dentro(self, a, b):
+        """Intervalos (recortados) que tocam [a, b)."""
+        i = max(bisect.bisect_right(self.inicios, a) - 1, 0)
+        j = bisect.bisect_left(self.inicios, b)
+        return [(max(self.inicios[k], a), min(self.fins[k], b), self.rotulos[k])
+                for k in range(i, j) if self.fins[k] > a]
+
+
+class IndiceSemanal:
+    """IndiceIntervalos sobre uma semana, consultado em datas arbitrárias."""
+
+    def __init__(self, janelas):
+        intervalos, rotulos = [], []
+        for rotulo, hora_inicio, hora_fim, dias in janelas:
+            for intervalo, _ in _expandir_semana(hora_inicio, hora_fim, dias):
+                intervalos.append(intervalo)
+                rotulos.append(rotulo)
+        self.indice = IndiceIntervalos(intervalos, rotulos)
+
+    def em(self, quando):
+        return self.indice.em(_segundos(quando) % SEMANA_SEG)
+
+    def sobreposicao(self, a, b):
+        """Segundos cobertos em [a, b) (datas)."""
+        return self._sobreposicao_seg(_segundos(a), _segundos(b))
+
+    def _sobreposicao_seg(self, a, b):
+        if b <= a:
+            return 0.0
+        semana_a, resto_a = divmod(a, SEMANA_SEG)
+        semana_b, resto_b = divmod(b, SEMANA_SEG)
+        semanas = semana_b - semana_a
+        return (semanas * self.indice.total()
+                + self.indice.sobreposicao(0, resto_b)
+                - self.indice.sobreposicao(0, resto_a))
+
+
+class IndiceTurnos:
+    """Turnos da semana, que podem se sobrepor (passagem de turno).
+
+    A semana é cortada nas fronteiras de todos os turnos; cada trecho guarda
+    os turnos que o cobrem com o início de cada um, então uma consulta é um
+    bisect e olha todos os candidatos do trecho, não só o último que começou.
+    """
+
+    def __init__(self, turnos):
+        pedacos = []
+        for nome, hora_inicio, hora_fim, dias in turnos:
+            for (a, b), inicio in _expandir_semana(hora_inicio, hora_fim, dias):
+                if b > a:
+                    pedacos.append((a, b, inicio, nome))
+        fronteiras = sorted({x for a, b, _, _ in pedacos for x in (a, b)})
+        self.inicios, self.fins = fronteiras[:-1], fronteiras[1:]
+        self.cobertos = [[] for _ in self.inicios]
+        for a, b, inicio, nome in pedacos:
+            for k in range(bisect.bisect_left(fronteiras, a), bisect.bisect_left(fronteiras, b)):
+                self.cobertos[k].append((inicio, nome))
+        for cobertos in self.cobertos:
+            cobertos.sort()
+
+    def em(self, quando):
+        """(nome, inicio) dos turnos que cobrem ``quando``, do que começou antes ao mais recente."""
+        semana, resto = divmod(_segundos(quando), SEMANA_SEG)
+        i = bisect.bisect_right(self.inicios, resto) - 1
+        if i < 0 or resto >= self.fins[i]:
+            return []
+        base = semana * SEMANA_SEG
+        return [(nome, ORIGEM + timedelta(seconds=base + inicio)) for inicio, nome in self.cobertos[i]]
+
+
+class Calendario:
+    def __init__(self, turnos=(), janelas=(), programadas=()):
+        self.turnos = IndiceTurnos(turnos)
+        self._turnos_brutos = list(turnos)
+        self.janelas = IndiceSemanal(janelas)
+        self._programadas = {}
+        self._programadas_brutas = list(programadas)
+
+    @classmethod
+    def carregar(cls, conexao):
+        cursor = conexao.cursor()
+        turnos = [(r["nome"], r["hora_inicio"], r["hora_fim"], r["dias_semana"])
+                  for r in cursor.execute("SELECT * FROM turnos")]
+        janelas = [(r["descricao"], r["hora_inicio"], r["hora_fim"], r["dias_semana"])
+                   for r in cursor.execute("SELECT * FROM janelas_planejadas")]
+        programadas = [(r["descricao"], r["maquina"], r["inicio"], r["fim"])
+                       for r in cursor.execute("SELECT * FROM paradas_programadas")]
+        return cls(turnos, janelas, programadas)
+
+    def _indice_programadas(self, maquina):
+        indice = self._programadas.get(maquina)
+        if indice is None:
+            selecionadas = [(_segundos(inicio), _segundos(fim), descricao)
+                            for descricao, m, inicio, fim in self._programadas_brutas
+                            if m is None or m == maquina]
+            indice = IndiceIntervalos([(a, b) for a, b, _ in selecionadas], [d for _, _, d in selecionadas])
+            self._programadas[maquina] = indice
+        return indice
+
+    def turno_em(self, quando):
+        """Nome do turno que cobre ``quando``; na passagem de turno, o que entrou por último."""
+        turnos = self.turnos.em(quando)
+        return turnos[-1][0] if turnos else None
+
+    def janela_planejada_em(self, quando, maquina=None):
+        rotulo = self.janelas.em(quando)
+        if rotulo:
+            return rotulo
+        return self._indice_programadas(maquina).em(_segundos(quando))
+
+    def segundos_planejados(self, a, b, maquina=None):
+        """Tempo planejado (janelas recorrentes ∪ paradas programadas) em [a, b)."""
+        sa, sb = _segundos(a), _segundos(b)
+        if sb <= sa:
+            return 0.0
+        programadas = self._indice_programadas(maquina)
+        total = self.janelas._sobreposicao_seg(sa, sb) + programadas.sobreposicao(sa, sb)
+        # Desconta o que as duas fontes cobrem ao mesmo tempo, para não contar em dobro.
+        for x, y, _ in programadas.dentro(sa, sb):
+            total -= self.janelas._sobreposicao_seg(x, y)
+        return total
+
+    def intervalos_planejados(self, a, b, maquina=None):
+        """(inicio, fim) do tempo planejado em [a, b), unidos e em ordem (uma volta por semana do período)."""
+        sa, sb = _segundos(a), _segundos(b)
+        pedacos = [(x, y) for x, y, _ in self._indice_programadas(maquina).dentro(sa, sb)]
+        semana = sa // SEMANA_SEG * SEMANA_SEG
+        while semana < sb:
+            pedacos += [(semana + x, semana + y)
+                        for x, y, _ in self.janelas.indice.dentro(max(sa - semana, 0), min(sb - semana, SEMANA_SEG))]
+            semana += SEMANA_SEG
+        unidos = IndiceIntervalos(pedacos)
+        return [(ORIGEM + timedelta(seconds=x), ORIGEM + timedelta(seconds=y))
+                for x, y in zip(unidos.inicios, unidos.fins)]
+
+    def minutos_planejados(self, a, b, maquina=None):
+        return self.segundos_planejados(a, b, maquina) / 60
+
+    def turnos_do_dia(self, dia):
+        """(nome, inicio, fim) dos turnos que começam em ``dia``; o fim pode cair no dia seguinte."""
+        dia = datetime(dia.year, dia.month, dia.day)
+        turnos = []
+        for nome, hora_inicio, hora_fim, dias_semana in self._turnos_brutos:
+            if str(dia.weekday()) not in dias_semana:
+                continue
+            inicio = dia + timedelta(seconds=_hora_para_seg(hora_inicio))
+            fim = dia + timedelta(seconds=_hora_para_seg(hora_fim))
+            if fim <= inicio:
+                fim += timedelta(days=1)
+            turnos.append((nome, inicio, fim))
+        return sorted(turnos, key=lambda t: t[1])
+
+    def inicio_turno(self, quando):
+        """Início do turno que cobre ``quando`` (o mesmo de ``turno_em``; None fora de turno)."""
+        turnos = self.turnos.em(quando)
+        return turnos[-1][1] if turnos else None
+
+
+def tempo_excluido_seg(calendario, inicio, fim, paradas, maquina=None):
+    """Tempo não disponível em [inicio, fim): paradas apontadas ∪ tempo planejado.
+
+    ``paradas`` é uma lista de (inicio, fim) já recortada ou não; a parte de
+    cada parada que cai em janela planejada não é contada duas vezes.
+    """
+    total = calendario.segundos_planejados(inicio, fim, maquina) if calendario else 0.0
+    for p_inicio, p_fim in paradas:
+        a, b = max(p_inicio, inicio), min(p_fim, fim)
+        if b <= a:
+            continue
+        total += (b - a).total_seconds()
+        if calendario:
+            total -= calendario.segundos_planejados(a, b, maquina)
+    return total
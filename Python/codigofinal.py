@@ -1,28 +1,97 @@
+import time
+# Início da partida, antes dos imports pesados (tkinter): o tempo até o login é medido a partir daqui.
+INICIO_PARTIDA = time.perf_counter()
 import tkinter as tk
-from tkinter import ttk, messagebox
+from tkinter import ttk, messagebox, simpledialog
+import os
+import socket
 import sqlite3
+import threading
 from datetime import datetime, timedelta
-
-DB_NAME = "producao.db"
+from analise_paradas import criar_tabelas_analise, mtbf_mttr, pareto, reconstruir_agregados
+from apontamentos import (corrigir_motivo, criar_diario_apontamentos, estornar, listar,
+                          registrar_saldos_iniciais)
+from banco import BancoProducao
+from busca_op import buscar_ops, criar_indice_busca
+from cache_referencia import CabecalhoOP, CacheReferencia, Motivo, criar_versoes_cadastro
+from calendario import TODOS_OS_DIAS, Calendario, criar_tabelas_calendario
+from contagem import criar_tabela_contagem
+from diario_local import DiarioLocal, SincronizadorDiario, criar_tabela_sincronizacao
+from kpi_compartilhado import LeitorKPI, PublicadorKPI, nome_segmento
+from kpi_snapshot import AtualizadorKPI, calcular_oee, criar_tabela_kpi, formatar_oee, ler_kpi, tempo_indisponivel_seg
+from linha_tempo import criar_historico_status, linha_do_tempo
+from partida import (SESSAO_RENOVACAO_SEG, Cronometro, abrir_sessao, criar_tabela_terminais, encerrar_sessao,
+                     recuperar, registrar_partida, renovar_sessao)
+from manutencao import ManutencaoBanco, criar_tabela_manutencao, preparar_banco_novo, saude
+from memoria import TelemetriaMemoria, criar_tabela_memoria, historico as historico_memoria
+import operacoes_lote
+from recalculo import criar_tabelas_recalculo
+from replica import ReplicadorLeitura, conectar_replica
+from sequenciador import Sequenciador, criar_tabela_sequenciador
+from sites import LeituraFederada, RegistroSites, kpi_corporativo, pareto_corporativo, resumo_sites
+from taxa import EstimadorTaxa, formatar_previsao, formatar_taxa
+from tendencias import TendenciaMaquina
+import transicoes
+from transicoes import TransicaoInvalida
+
+# Registro de sites (plantas); sem o arquivo, um único site com producao.db.
+ARQUIVO_SITES = "sites.json"
+REGISTRO_SITES = RegistroSites.carregar(ARQUIVO_SITES, caminho_padrao="producao.db")
+# Os apontamentos gravam sempre no banco do site local; outros sites só são lidos.
+# PRODUCAO_DB=memoria:<nome> roda num banco em memória compartilhada (demos e testes).
+DB_NAME = os.environ.get("PRODUCAO_DB") or REGISTRO_SITES.local.caminho
+# Só em memória: semeia o banco copiando este arquivo (API de backup) antes do inicializar_db.
+SNAPSHOT_INICIAL = os.environ.get("PRODUCAO_SNAPSHOT")
+BANCO = BancoProducao(DB_NAME)
+DB_REPLICA = "producao_replica.db"
+# Painéis e relatórios leem da réplica local; os apontamentos continuam no DB_NAME.
+USAR_REPLICA = False
+# WAL permite que leitores (réplica, relatórios) não bloqueiem quem grava.
+# Desligar se o producao.db estiver em um compartilhamento de rede sem suporte a WAL.
+USAR_WAL = True
+# Terminais de operador gravam num diário local e sincronizam com o DB_NAME em segundo plano.
+USAR_DIARIO_LOCAL = True
+DB_DIARIO = "diario_terminal.db"
+# tracemalloc + contagem de widgets/after() + RSS, gravados em memoria_terminal a cada 10 minutos.
+TELEMETRIA_MEMORIA = True
+# Publica o kpi_snapshot em memória compartilhada para outros painéis deste PC (sala de controle).
+# Os painéis leem de lá sempre que houver um publicador ativo, com ou sem esta opção.
+PUBLICAR_KPI_LOCAL = False
+# Gravada em PRAGMA user_version; com o banco já nesta versão a partida pula todo o DDL.
+# Suba sempre que mudar o esquema (aqui ou nos criar_* dos módulos).
+VERSAO_ESQUEMA = 5
 
 def conectar_db():
     try:
-        conexao = sqlite3.connect(
-            DB_NAME, 
-            detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES
-        )
-        conexao.row_factory = sqlite3.Row 
-        return conexao
+        return BANCO.conectar()
     except sqlite3.Error as e:
         print(f"Erro ao conectar ao banco de dados: {e}")
         return None
 
+def conectar_db_leitura():
+    if not USAR_REPLICA or not os.path.exists(DB_REPLICA):
+        return conectar_db()
+    try:
+        return conectar_replica(DB_REPLICA)
+    except sqlite3.Error as e:
+        print(f"Réplica indisponível, lendo do banco principal: {e}")
+        return conectar_db()
+
 def inicializar_db():
+    if SNAPSHOT_INICIAL and BANCO.memoria:
+        BANCO.carregar(SNAPSHOT_INICIAL)
     conexao = conectar_db()
     if not conexao:
         return
+    if conexao.execute("PRAGMA user_version").fetchone()[0] == VERSAO_ESQUEMA:
+        conexao.close()
+        return
 
     cursor = conexao.cursor()
+
+    preparar_banco_novo(cursor)
+    if USAR_WAL:
+        cursor.execute("PRAGMA journal_mode=WAL")
     
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS usuarios (
@@ -64,9 +133,42 @@ def inicializar_db():
         maquina TEXT PRIMARY KEY,
         status TEXT NOT NULL
     )""")
+
+    colunas_op = {r['name'] for r in cursor.execute("PRAGMA table_info(ordens_producao)").fetchall()}
+    if "prazo" not in colunas_op:
+        cursor.execute("ALTER TABLE ordens_producao ADD COLUMN prazo TIMESTAMP")
+
+    colunas_motivo = {r['name'] for r in cursor.execute("PRAGMA table_info(motivos_parada)").fetchall()}
+    if "planejada" not in colunas_motivo:
+        cursor.execute("ALTER TABLE motivos_parada ADD COLUMN planejada INTEGER NOT NULL DEFAULT 0")
+        cursor.execute("UPDATE motivos_parada SET planejada = 1 WHERE motivo = 'Horário de Refeição'")
+
+    criar_tabelas_calendario(cursor)
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_paradas_op ON paradas_log (op, fim)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_paradas_abertas ON paradas_log (id) WHERE fim IS NULL")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ordens_status ON ordens_producao (status, maquina)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ordens_maquina_inicio ON ordens_producao (maquina, inicio_producao)")
+
+    criar_tabela_kpi(cursor)
+    criar_historico_status(cursor)
+    criar_tabela_sincronizacao(cursor)
+    criar_versoes_cadastro(cursor)
+    criar_indice_busca(cursor)
+    criar_diario_apontamentos(cursor)
+    criar_tabela_manutencao(cursor)
+    criar_tabela_terminais(cursor)
+    criar_tabela_memoria(cursor)
+    criar_tabela_contagem(cursor)
+    criar_tabelas_recalculo(cursor)
+    criar_tabela_sequenciador(cursor)
+    analise_nova = criar_tabelas_analise(cursor)
     
     conexao.commit()
 
+    if analise_nova:
+        reconstruir_agregados(conexao)
+
     cursor.execute("SELECT 1 FROM usuarios LIMIT 1")
     if not cursor.fetchone():
         
@@ -82,6 +184,18 @@ def inicializar_db():
             ("Troca de ferramenta",), ("Ajuste de máquina",), ("Outros",)
         ]
         cursor.executemany("INSERT OR IGNORE INTO motivos_parada (motivo) VALUES (?)", motivos_iniciais)
+        cursor.execute("INSERT OR IGNORE INTO motivos_parada (motivo, planejada) VALUES (?, 1)", ("Horário de Refeição",))
+
+        turnos_iniciais = [
+            ("Turno 1", "06:00", "14:00"), ("Turno 2", "14:00", "22:00"), ("Turno 3", "22:00", "06:00")
+        ]
+        cursor.executemany("INSERT OR IGNORE INTO turnos (nome, hora_inicio, hora_fim) VALUES (?, ?, ?)", turnos_iniciais)
+
+        refeicoes = [
+            ("Horário de Refeição", "10:00", "10:30"), ("Horário de Refeição", "18:00", "18:30"),
+            ("Horário de Refeição", "02:00", "02:30")
+        ]
+        cursor.executemany("INSERT INTO janelas_planejadas (descricao, hora_inicio, hora_fim) VALUES (?, ?, ?)", refeicoes)
         
         inicio_op1 = datetime.now() - timedelta(hours=3, minutes=30)
         inicio_op2 = datetime.now() - timedelta(hours=1, minutes=15)
@@ -98,13 +212,18 @@ def inicializar_db():
         cursor.execute("INSERT OR REPLACE INTO maquinas_status (maquina, status) VALUES (?, ?)", ("Linha 1", "PRODUZINDO"))
         cursor.execute("INSERT OR REPLACE INTO maquinas_status (maquina, status) VALUES (?, ?)", ("Linha 2", "LIVRE"))
         cursor.execute("INSERT OR REPLACE INTO maquinas_status (maquina, status) VALUES (?, ?)", ("Linha 3", "LIVRE"))
+        registrar_saldos_iniciais(cursor)
         
         conexao.commit()
-    
+
+    cursor.execute(f"PRAGMA user_version = {VERSAO_ESQUEMA}")
+    conexao.commit()
     conexao.close()
 
 class AplicacaoProducao(tk.Tk):
     def __init__(self):
+        self.cronometro = Cronometro(INICIO_PARTIDA)
+        self.cronometro.etapa("módulos")
         super().__init__()
         self.title("Sistema de Controle de Produção Industrial (AriLine)")
         self.geometry("800x600")
@@ -112,22 +231,160 @@ class AplicacaoProducao(tk.Tk):
         style = ttk.Style()
         style.configure("Header.TFrame", background="#2C3E50")
         style.configure("Footer.TFrame", background="#BDC3C7")
+        self.cronometro.etapa("janela")
 
         inicializar_db()
+        self.cronometro.etapa("esquema")
+        self.cache = CacheReferencia(conectar_db)
+
+        self.atualizador_kpi = AtualizadorKPI(conectar_db)
+        self.atualizador_kpi.start()
+
+        self.manutencao = ManutencaoBanco(conectar_db)
+        self.manutencao.start()
+
+        self.segmento_kpi = nome_segmento(BANCO.alvo)
+        self.leitor_kpi = None
+        self.publicador_kpi = None
+        if PUBLICAR_KPI_LOCAL:
+            self.publicador_kpi = PublicadorKPI(conectar_db, self.segmento_kpi)
+            self.publicador_kpi.start()
+
+        self.replicador = None
+        if USAR_REPLICA:
+            self.replicador = ReplicadorLeitura(conectar_db, DB_REPLICA)
+            self.replicador.start()
+        
+        self.diario = None
+        self.sincronizador = None
+        self.terminal = terminal = socket.gethostname()
+        self._job_sessao = None
+        if USAR_DIARIO_LOCAL:
+            self.banco_diario = BANCO.derivado("diario", DB_DIARIO)
+            self.diario = DiarioLocal(self.banco_diario.alvo, terminal)
+        self._recuperar_sessao()
+
+        if USAR_DIARIO_LOCAL:
+            self.sincronizador = SincronizadorDiario(self.banco_diario.alvo, conectar_db, terminal)
+            self.diario.ao_registrar = self.sincronizador.notificar
+            self.sincronizador.start()
+
+        self.telemetria = None
+        if TELEMETRIA_MEMORIA:
+            self.telemetria = TelemetriaMemoria(self, terminal, conectar_db)
+            self.telemetria.iniciar()
         
         self.protocol("WM_DELETE_WINDOW", self._on_closing)
 
         self.usuario_logado = None
         self.perfil_usuario = None
+        self.sequenciador = Sequenciador()
+        self.federacao = LeituraFederada(REGISTRO_SITES) if REGISTRO_SITES.federado() else None
         
         self.container = ttk.Frame(self)
         self.container.pack(fill="both", expand=True)
         
         self.mostrar_tela_login()
-        
+        self.cronometro.etapa("serviços e login")
+        self.after_idle(self._partida_concluida)
+
+    def _recuperar_sessao(self):
+        """Marca a sessão do terminal e, se a anterior caiu, reconcilia paradas e máquinas."""
+        conexao = conectar_db()
+        if not conexao: return
+        try:
+            sessao_caiu = abrir_sessao(conexao, self.terminal)
+            # Eventos ainda no diário local corrigem o estado sozinhos quando sincronizarem.
+            if sessao_caiu and self.diario and self.diario.pendentes():
+                sessao_caiu = False
+            for acao in recuperar(conexao, self.terminal, sessao_caiu):
+                print(f"Recuperação: {acao}")
+        except sqlite3.Error as e:
+            print(f"Recuperação da partida não concluída: {e}")
+        finally:
+            conexao.close()
+        self.cronometro.etapa("recuperação")
+
+    def _partida_concluida(self):
+        self.cronometro.etapa("primeiro desenho")
+        print(self.cronometro.resumo())
+        conexao = conectar_db()
+        if not conexao: return
+        try:
+            registrar_partida(conexao, self.terminal, self.cronometro.total_ms())
+        except sqlite3.Error as e:
+            print(f"Erro ao registrar a partida: {e}")
+        finally:
+            conexao.close()
+        self._job_sessao = self.after(SESSAO_RENOVACAO_SEG * 1000, self._renovar_sessao)
+
+    def _renovar_sessao(self):
+        """Mostra aos outros terminais que esta sessão continua rodando (ver ``partida.recuperar``)."""
+        conexao = conectar_db()
+        if conexao:
+            try:
+                renovar_sessao(conexao, self.terminal)
+            except sqlite3.Error as e:
+                print(f"Erro ao renovar a sessão do terminal: {e}")
+            finally:
+                conexao.close()
+        self._job_sessao = self.after(SESSAO_RENOVACAO_SEG * 1000, self._renovar_sessao)
+
     def _on_closing(self):
+        if self._job_sessao:
+            self.after_cancel(self._job_sessao)
+        self.atualizador_kpi.parar()
+        self.manutencao.parar()
+        if self.replicador:
+            self.replicador.parar()
+        if self.sincronizador:
+            self.sincronizador.parar()
+            self.diario.fechar()
+            self.banco_diario.fechar()
+        if self.telemetria:
+            self.telemetria.parar()
+        if self.publicador_kpi:
+            self.publicador_kpi.parar()
+            self.publicador_kpi.join(timeout=2)
+        if self.leitor_kpi:
+            self.leitor_kpi.fechar()
+        self.cache.fechar()
+        if self.federacao:
+            self.federacao.fechar()
+        conexao = conectar_db()
+        if conexao:
+            try:
+                encerrar_sessao(conexao, self.terminal)
+            except sqlite3.Error as e:
+                print(f"Erro ao encerrar a sessão do terminal: {e}")
+            conexao.close()
         self.destroy()
 
+    def transicao(self, nome, *args, operador=None):
+        """Executa uma transição do apontamento no diário local ou direto no banco."""
+        extras = {} if operador is None else {"operador": operador}
+        if self.diario:
+            return getattr(self.diario, nome)(*args, **extras)
+        conexao = conectar_db()
+        if not conexao:
+            raise sqlite3.OperationalError("não foi possível conectar ao banco de dados")
+        try:
+            return getattr(transicoes, nome)(conexao, *args, terminal=self.terminal, **extras)
+        finally:
+            conexao.close()
+
+    def ler_kpi(self, conexao, agora):
+        """KPIs do snapshot compartilhado deste PC quando há publicador; senão do banco."""
+        if self.leitor_kpi is None:
+            self.leitor_kpi = LeitorKPI.abrir(self.segmento_kpi)
+        if self.leitor_kpi:
+            linhas = self.leitor_kpi.ler(agora)
+            if linhas is not None:
+                return linhas
+            self.leitor_kpi.fechar()
+            self.leitor_kpi = None
+        return ler_kpi(conexao, agora)
+
     def limpar_tela(self):
         for widget in self.container.winfo_children():
             widget.destroy()
@@ -148,20 +405,24 @@ class AplicacaoProducao(tk.Tk):
         self.limpar_tela()
         TelaCadastro(self.container, self).pack(fill="both", expand=True)
 
+    def mostrar_analise_paradas(self):
+        self.limpar_tela()
+        TelaAnaliseParadas(self.container, self).pack(fill="both", expand=True)
+
+    def mostrar_apontamentos(self):
+        self.limpar_tela()
+        TelaApontamentos(self.container, self).pack(fill="both", expand=True)
+
+    def mostrar_visao_corporativa(self):
+        self.limpar_tela()
+        TelaCorporativa(self.container, self).pack(fill="both", expand=True)
+
     def realizar_login(self, usuario, senha):
-        conexao = conectar_db()
-        if not conexao: return False
-        cursor = conexao.cursor()
-        
-        sql = "SELECT perfil, senha FROM usuarios WHERE usuario = ?"
-        cursor.execute(sql, (usuario,))
-        resultado = cursor.fetchone()
-        
-        conexao.close()
+        resultado = self.cache.usuario(usuario)
 
-        if resultado and resultado['senha'] == senha:
+        if resultado and resultado.senha == senha:
             self.usuario_logado = usuario
-            self.perfil_usuario = resultado['perfil']
+            self.perfil_usuario = resultado.perfil
             messagebox.showinfo("Sucesso", f"Bem-vindo(a), {usuario} ({self.perfil_usuario})")
             
             if self.perfil_usuario == "OPERADOR":
@@ -224,6 +485,10 @@ class TelaLogin(ttk.Frame):
         senha = self.pass_entry.get()
         self.app_controller.realizar_login(usuario, senha)
 
+# Sugestões exibidas no campo de OP e espera após a última tecla antes de buscar.
+LIMITE_SUGESTOES_OP = 20
+ATRASO_BUSCA_MS = 150
+
 class TelaOperador(ttk.Frame):
     def __init__(self, master, app_controller, operador):
         super().__init__(master, padding="20")
@@ -232,11 +497,15 @@ class TelaOperador(ttk.Frame):
         
         self.op_atual = self._encontrar_op_ativa()
         self.status_maquina = self._get_maquina_status_db(self.op_atual)
+        self.estimador = None
+        self.estimador_op = None
         
         self.criar_widgets()
         self.atualizar_interface()
 
     def _get_op_data_db(self, op):
+        if self.app_controller.diario:
+            return self.app_controller.diario.op(op) if op else None
         conexao = conectar_db()
         if not conexao:
             return None
@@ -250,6 +519,8 @@ class TelaOperador(ttk.Frame):
         return dict(resultado) if resultado else None 
 
     def _get_status_by_maquina_name(self, maquina_nome):
+        if self.app_controller.diario:
+            return self.app_controller.diario.status_maquina(maquina_nome)
         conexao = conectar_db()
         if not conexao:
             return "LIVRE"
@@ -263,6 +534,9 @@ class TelaOperador(ttk.Frame):
         return resultado['status'] if resultado else "LIVRE"
 
     def _get_maquina_status_db(self, op_atual):
+        if self.app_controller.diario:
+            op_data = self._get_op_data_db(op_atual)
+            return self._get_status_by_maquina_name(op_data['maquina']) if op_data else "LIVRE"
         conexao = conectar_db()
         if not conexao: return "LIVRE"
         cursor = conexao.cursor()
@@ -281,6 +555,8 @@ class TelaOperador(ttk.Frame):
         return status
 
     def _encontrar_op_ativa(self):
+        if self.app_controller.diario:
+            return self.app_controller.diario.op_ativa()
         conexao = conectar_db()
         if not conexao:
             return None
@@ -293,18 +569,33 @@ class TelaOperador(ttk.Frame):
         conexao.close()
         return resultado['op'] if resultado else None
 
-    def _get_op_pendentes(self):
+    def _get_op_pendentes(self, termo="", limite=LIMITE_SUGESTOES_OP):
+        if self.app_controller.diario:
+            return self.app_controller.diario.ops_pendentes(termo, limite)
         conexao = conectar_db()
         if not conexao:
             return []
-        cursor = conexao.cursor()
-        
-        sql = "SELECT op FROM ordens_producao WHERE status = 'PENDENTE'"
-        cursor.execute(sql)
-        resultados = cursor.fetchall()
-        
+
+        if termo:
+            ops = [r['op'] for r in buscar_ops(conexao, termo, "PENDENTE", limite)]
+            conexao.close()
+            return ops
+
+        sequenciador = self.app_controller.sequenciador
+        sequenciador.sincronizar(conexao)
         conexao.close()
-        return [r['op'] for r in resultados]
+        return [s.op for s in sequenciador.ordem_global(limite)]
+
+    def _agendar_busca_op(self, event=None):
+        if self.busca_agendada:
+            self.after_cancel(self.busca_agendada)
+        self.busca_agendada = self.after(ATRASO_BUSCA_MS, self._buscar_op)
+
+    def _buscar_op(self):
+        self.busca_agendada = None
+        if self.op_atual:
+            return
+        self.op_dropdown['values'] = self._get_op_pendentes(self.op_var.get().strip())
 
     def criar_widgets(self):
         ttk.Label(self, text=f"Terminal de Apontamento", font=("Arial", 18, "bold")).pack(pady=10)
@@ -328,15 +619,26 @@ class TelaOperador(ttk.Frame):
         
         self.lbl_progresso = ttk.Label(status_frame, text="Progresso: 0 / 0 (0%)", font=("Arial", 12))
         self.lbl_progresso.grid(row=2, column=0, padx=5, pady=5, sticky="w", columnspan=2)
+
+        self.lbl_taxa = ttk.Label(status_frame, text="Ritmo atual: --", font=("Arial", 12))
+        self.lbl_taxa.grid(row=3, column=0, padx=5, pady=5, sticky="w")
+
+        self.lbl_previsao = ttk.Label(status_frame, text="Previsão de término: --", font=("Arial", 12))
+        self.lbl_previsao.grid(row=3, column=1, padx=5, pady=5, sticky="w")
+
+        self.lbl_sync = ttk.Label(status_frame, text="", font=("Arial", 9), foreground="gray")
+        self.lbl_sync.grid(row=4, column=0, padx=5, pady=2, sticky="w", columnspan=2)
     
 
         op_frame = ttk.LabelFrame(self, text="Iniciar Nova OP", padding="10")
         op_frame.pack(fill="x", pady=10)
         
         ttk.Label(op_frame, text="Selecione a OP:").pack(side="left", padx=5)
-        self.op_dropdown = ttk.Combobox(op_frame, textvariable=self.op_var, state="readonly", width=25)
+        self.op_dropdown = ttk.Combobox(op_frame, textvariable=self.op_var, width=25)
         self.op_dropdown['values'] = self._get_op_pendentes()
         self.op_dropdown.pack(side="left", padx=5)
+        self.op_dropdown.bind("<KeyRelease>", self._agendar_busca_op)
+        self.busca_agendada = None
         
         self.btn_iniciar = ttk.Button(op_frame, text="Iniciar Produção", command=self.iniciar_op)
         self.btn_iniciar.pack(side="left", padx=10)
@@ -356,6 +658,9 @@ class TelaOperador(ttk.Frame):
                                        font=("Arial", 14, "bold"), bg="#F44336", fg="white", height=3, width=25)
         self.btn_finalizar.grid(row=1, column=0, columnspan=2, padx=10, pady=10, sticky="ew")
 
+        self.btn_desfazer = ttk.Button(acoes_frame, text="Desfazer Último Apontamento", command=self.desfazer_producao)
+        self.btn_desfazer.grid(row=2, column=0, columnspan=2, pady=5)
+
         ttk.Button(self, text="Sair / Voltar para Login", command=self.app_controller.mostrar_tela_login).pack(pady=20)
 
 
@@ -363,40 +668,13 @@ class TelaOperador(ttk.Frame):
         if op_data["status"] != "PRODUZINDO" or op_data.get("inicio_producao") is None:
             return "N/A"
 
-        produzido = op_data["produzido"]
-        meta_hora = op_data["meta_hora"]
-        inicio_producao = op_data["inicio_producao"]
-        tempo_decorrido = (datetime.now() - inicio_producao).total_seconds() / 3600
-
         conexao = conectar_db()
         if not conexao: return "0.0%"
-        cursor = conexao.cursor()
-
-        sql_paradas = "SELECT SUM(duracao_seg) AS total_parado FROM paradas_log WHERE op = ? AND fim IS NOT NULL"
-        cursor.execute(sql_paradas, (op_data['op'],))
-        resultado_parada = cursor.fetchone()
-        tempo_parado_seg = resultado_parada['total_parado'] or 0
-
-        sql_parada_aberta = "SELECT inicio FROM paradas_log WHERE op = ? AND fim IS NULL ORDER BY id DESC LIMIT 1"
-        cursor.execute(sql_parada_aberta, (op_data['op'],))
-        parada_aberta = cursor.fetchone()
-        if parada_aberta:
-            tempo_parado_seg += (datetime.now() - parada_aberta['inicio']).total_seconds()
-
+        agora = datetime.now()
+        tempo_indisponivel = tempo_indisponivel_seg(conexao.cursor(), op_data, agora, Calendario.carregar(conexao))
         conexao.close()
 
-        tempo_operacional_hr = (tempo_decorrido * 3600 - tempo_parado_seg) / 3600
-
-        if tempo_operacional_hr <= 0:
-            return "0.0%"
-
-        quantidade_esperada = tempo_operacional_hr * meta_hora
-        
-        performance = (produzido / quantidade_esperada) if quantidade_esperada > 0 else 0
-        
-        oee = performance * 100
-        
-        return f"{min(oee, 100):.1f}%"
+        return formatar_oee(calcular_oee(op_data, tempo_indisponivel, agora))
 
     def atualizar_interface(self):
         self.op_atual = self._encontrar_op_ativa()
@@ -414,6 +692,15 @@ class TelaOperador(ttk.Frame):
             
             progresso_percent = (op_data['produzido'] / op_data['planejado']) * 100
             self.lbl_progresso.config(text=f"Progresso: {op_data['produzido']} / {op_data['planejado']} ({progresso_percent:.1f}%)")
+
+            agora = datetime.now()
+            if self.estimador_op != self.op_atual:
+                self.estimador = EstimadorTaxa()
+                self.estimador_op = self.op_atual
+            self.estimador.observar(op_data['produzido'], self.status_maquina == "PARADA", agora)
+            previsao = self.estimador.previsao_termino(op_data['planejado'] - op_data['produzido'], agora)
+            self.lbl_taxa.config(text=f"Ritmo atual: {formatar_taxa(self.estimador.taxa_hora(agora))} (meta {op_data['meta_hora']}/h)")
+            self.lbl_previsao.config(text=f"Previsão de término: {formatar_previsao(previsao, agora)}")
         
             self.op_var.set(self.op_atual)
             self.op_dropdown.config(state='disabled', values=[self.op_atual])
@@ -427,16 +714,22 @@ class TelaOperador(ttk.Frame):
             self.lbl_maquina.config(text=f"Máquina: {maquina_livre}")
             self.lbl_status.config(text="Status: LIVRE", foreground="blue")
             self.lbl_progresso.config(text="Progresso: 0 / 0 (0%)")
+            self.lbl_taxa.config(text="Ritmo atual: --")
+            self.lbl_previsao.config(text="Previsão de término: --")
+            if self.estimador_op:
+                self.op_var.set("")
+            self.estimador = None
+            self.estimador_op = None
             
-            op_pendentes = self._get_op_pendentes()
-            self.op_dropdown.config(values=op_pendentes, state='readonly') 
+            termo = self.op_var.get().strip()
+            self.op_dropdown.config(state='normal')
+            if not termo:
+                self.op_dropdown.config(values=self._get_op_pendentes())
             
-            current_selection = self.op_var.get()
-            if current_selection not in op_pendentes:
-                 self.op_var.set("")
-            
-            self.btn_iniciar.config(state='normal' if op_pendentes else 'disabled') 
+            self.btn_iniciar.config(state='normal' if termo or self.op_dropdown['values'] else 'disabled') 
             
+        self._atualizar_sincronizacao()
+
         if self.status_maquina == "PRODUZINDO":
             self.btn_produzir.config(state="normal", text="Apontar Unidade Produzida", bg="#4CAF50")
             self.btn_parada.config(state="normal", text="Apontar Parada", bg="#FF9800")
@@ -449,9 +742,24 @@ class TelaOperador(ttk.Frame):
             self.btn_produzir.config(state="disabled", text="Selecione uma OP", bg="gray")
             self.btn_parada.config(state="disabled", text="Apontar Parada", bg="gray")
             self.btn_finalizar.config(state="disabled", bg="gray")
+        self.btn_desfazer.config(state="normal" if self.op_atual else "disabled")
             
         self.after(1000, self.atualizar_interface)
 
+    def _atualizar_sincronizacao(self):
+        sincronizador = self.app_controller.sincronizador
+        if not sincronizador:
+            return
+        pendentes = self.app_controller.diario.pendentes()
+        if sincronizador.online:
+            texto = f"Sincronizado às {sincronizador.ultima_sincronizacao:%H:%M:%S}"
+            if pendentes:
+                texto += f" ({pendentes} apontamento(s) a enviar)"
+            self.lbl_sync.config(text=texto, foreground="gray")
+        else:
+            self.lbl_sync.config(text=f"Sem conexão com o banco central - {pendentes} apontamento(s) guardado(s) no terminal",
+                                 foreground="red")
+
     def iniciar_op(self):
         
         op = self.op_var.get()
@@ -459,29 +767,14 @@ class TelaOperador(ttk.Frame):
             messagebox.showwarning("Atenção", "Selecione uma Ordem de Produção.")
             return
 
-        op_data = self._get_op_data_db(op)
-        maquina = op_data['maquina']
-
-        status_maquina_alvo = self._get_status_by_maquina_name(maquina)
-        
-        if status_maquina_alvo != "LIVRE":
-            messagebox.showwarning("Atenção", f"A máquina '{maquina}' está {status_maquina_alvo} e não pode iniciar esta OP.")
+        try:
+            maquina = self.app_controller.transicao("iniciar", op, operador=self.operador)
+        except TransicaoInvalida as e:
+            messagebox.showwarning("Atenção", str(e))
+            return
+        except sqlite3.OperationalError as e:
+            messagebox.showerror("Erro", f"Falha ao gravar o apontamento, tente novamente: {e}")
             return
-
-        conexao = conectar_db()
-        if not conexao: return
-        cursor = conexao.cursor()
-
-        agora = datetime.now()
-
-        sql_op = "UPDATE ordens_producao SET status = 'PRODUZINDO', inicio_producao = ? WHERE op = ?"
-        cursor.execute(sql_op, (agora, op))
-
-        sql_maquina = "INSERT OR REPLACE INTO maquinas_status (maquina, status) VALUES (?, ?)"
-        cursor.execute(sql_maquina, (maquina, "PRODUZINDO"))
-
-        conexao.commit()
-        conexao.close()
         
         messagebox.showinfo("Iniciado", f"Produção da OP {op} iniciada na {maquina}.")
         self.op_atual = op
@@ -492,19 +785,36 @@ class TelaOperador(ttk.Frame):
             messagebox.showwarning("Atenção", "A máquina não está em produção (está PARADA ou LIVRE).")
             return
 
-        conexao = conectar_db()
-        if not conexao: return
-        cursor = conexao.cursor()
+        try:
+            produzido, planejado = self.app_controller.transicao("apontar_producao", self.op_atual, operador=self.operador)
+        except TransicaoInvalida as e:
+            messagebox.showwarning("Atenção", str(e))
+            self.atualizar_interface()
+            return
+        except sqlite3.OperationalError as e:
+            messagebox.showerror("Erro", f"Falha ao gravar o apontamento, tente novamente: {e}")
+            return
 
-        sql = "UPDATE ordens_producao SET produzido = produzido + 1 WHERE op = ?"
-        cursor.execute(sql, (self.op_atual,))
-        
-        op_data = self._get_op_data_db(self.op_atual)
-        if op_data and op_data['produzido'] >= op_data['planejado']:
+        if produzido >= planejado:
              messagebox.showwarning("Atenção", f"OP {self.op_atual} atingiu ou excedeu a quantidade planejada! Considere finalizar.")
+        self.atualizar_interface()
 
-        conexao.commit()
-        conexao.close()
+    def desfazer_producao(self):
+        if not self.op_atual:
+            messagebox.showwarning("Atenção", "Nenhuma OP em andamento.")
+            return
+
+        try:
+            produzido, planejado = self.app_controller.transicao("estornar_producao", self.op_atual,
+                                                                 operador=self.operador)
+        except TransicaoInvalida as e:
+            messagebox.showwarning("Atenção", str(e))
+            return
+        except sqlite3.OperationalError as e:
+            messagebox.showerror("Erro", f"Falha ao gravar o apontamento, tente novamente: {e}")
+            return
+
+        messagebox.showinfo("Apontamento Desfeito", f"Último apontamento desfeito. Produzido: {produzido} / {planejado}")
         self.atualizar_interface()
 
     def apontar_parada(self):
@@ -527,12 +837,7 @@ class TelaOperador(ttk.Frame):
         motivo_var = tk.StringVar()
         motivo_dropdown = ttk.Combobox(parada_window, textvariable=motivo_var, state="readonly", width=35)
         
-        conexao = conectar_db()
-        cursor = conexao.cursor()
-        motivos_db = cursor.execute("SELECT motivo FROM motivos_parada").fetchall()
-        conexao.close()
-        
-        motivo_dropdown['values'] = [r['motivo'] for r in motivos_db]
+        motivo_dropdown['values'] = [m.motivo for m in self.app_controller.cache.motivos()]
         motivo_dropdown.pack(pady=5, padx=10)
         motivo_dropdown.current(0)
 
@@ -547,22 +852,15 @@ class TelaOperador(ttk.Frame):
         ttk.Button(parada_window, text="Confirmar Parada", command=confirmar_parada).pack(pady=15)
 
     def _registrar_parada(self, motivo):
-        op_data = self._get_op_data_db(self.op_atual)
-        maquina = op_data['maquina']
-        agora = datetime.now()
-
-        conexao = conectar_db()
-        if not conexao: return
-        cursor = conexao.cursor()
-
-        sql_maquina = "INSERT OR REPLACE INTO maquinas_status (maquina, status) VALUES (?, ?)"
-        cursor.execute(sql_maquina, (maquina, "PARADA"))
-
-        sql_log = "INSERT INTO paradas_log (op, motivo, inicio, operador) VALUES (?, ?, ?, ?)"
-        cursor.execute(sql_log, (self.op_atual, motivo, agora, self.operador))
-
-        conexao.commit()
-        conexao.close()
+        try:
+            maquina = self.app_controller.transicao("parar", self.op_atual, motivo, self.operador)
+        except TransicaoInvalida as e:
+            messagebox.showwarning("Atenção", str(e))
+            self.atualizar_interface()
+            return
+        except sqlite3.OperationalError as e:
+            messagebox.showerror("Erro", f"Falha ao gravar o apontamento, tente novamente: {e}")
+            return
         
         messagebox.showinfo("Parada Registrada", f"Parada da {maquina} registrada por motivo: {motivo}")
         self.atualizar_interface()
@@ -570,35 +868,20 @@ class TelaOperador(ttk.Frame):
     def retornar_producao(self):
         if not self.op_atual: return
 
-        op_data = self._get_op_data_db(self.op_atual)
-        maquina = op_data['maquina']
-        agora = datetime.now()
-
-        conexao = conectar_db()
-        if not conexao: return
-        cursor = conexao.cursor()
-
-        sql_maquina = "INSERT OR REPLACE INTO maquinas_status (maquina, status) VALUES (?, ?)"
-        cursor.execute(sql_maquina, (maquina, "PRODUZINDO"))
-
-        sql_select_log = "SELECT id, inicio FROM paradas_log WHERE op = ? AND fim IS NULL ORDER BY id DESC LIMIT 1"
-        cursor.execute(sql_select_log, (self.op_atual,))
-        log_recente = cursor.fetchone()
+        try:
+            maquina, duracao = self.app_controller.transicao("retomar", self.op_atual, operador=self.operador)
+        except TransicaoInvalida as e:
+            messagebox.showwarning("Atenção", str(e))
+            self.atualizar_interface()
+            return
+        except sqlite3.OperationalError as e:
+            messagebox.showerror("Erro", f"Falha ao gravar o apontamento, tente novamente: {e}")
+            return
 
-        if log_recente:
-            inicio = log_recente['inicio']
-            duracao = (agora - inicio).total_seconds()
-            
-            sql_update_log = "UPDATE paradas_log SET fim = ?, duracao_seg = ? WHERE id = ?"
-            cursor.execute(sql_update_log, (agora, round(duracao), log_recente['id']))
-            
-            conexao.commit()
+        if duracao is not None:
             messagebox.showinfo("Retorno", f"Máquina {maquina} Retornou à Produção. Duração da Parada: {round(duracao/60, 1)} minutos.")
         else:
-            conexao.commit()
             messagebox.showinfo("Retorno", f"Máquina {maquina} Retornou à Produção.")
-
-        conexao.close()
         self.atualizar_interface()
 
     def finalizar_op(self):
@@ -606,9 +889,6 @@ class TelaOperador(ttk.Frame):
             messagebox.showwarning("Atenção", "Nenhuma OP em andamento para finalizar.")
             return
 
-        op_data = self._get_op_data_db(self.op_atual)
-        maquina = op_data['maquina']
-
         if self.status_maquina == "PARADA":
             messagebox.showerror("Erro", "Não é possível finalizar a OP enquanto a máquina estiver em PARADA.")
             return
@@ -616,24 +896,30 @@ class TelaOperador(ttk.Frame):
         if not messagebox.askyesno("Confirmar Finalização", f"Tem certeza que deseja finalizar a OP {self.op_atual}?"):
             return
 
-        conexao = conectar_db()
-        if not conexao: return
-        cursor = conexao.cursor()
-
-        sql_op = "UPDATE ordens_producao SET status = 'FINALIZADA' WHERE op = ?"
-        cursor.execute(sql_op, (self.op_atual,))
-
-        sql_maquina = "INSERT OR REPLACE INTO maquinas_status (maquina, status) VALUES (?, ?)"
-        cursor.execute(sql_maquina, (maquina, "LIVRE"))
-
-        conexao.commit()
-        conexao.close()
+        try:
+            _, produzido = self.app_controller.transicao("finalizar", self.op_atual, operador=self.operador)
+        except TransicaoInvalida as e:
+            messagebox.showwarning("Atenção", str(e))
+            self.atualizar_interface()
+            return
+        except sqlite3.OperationalError as e:
+            messagebox.showerror("Erro", f"Falha ao gravar o apontamento, tente novamente: {e}")
+            return
 
-        messagebox.showinfo("Finalização", f"OP {self.op_atual} finalizada com sucesso! Produzido total: {op_data['produzido']}")
+        messagebox.showinfo("Finalização", f"OP {self.op_atual} finalizada com sucesso! Produzido total: {produzido}")
         self.op_atual = None
         self.atualizar_interface()
 
+LIMITE_BUSCA_GESTOR = 200
+
 class PainelGestor(ttk.Frame):
+    PERIODOS_LINHA = {"Últimas 8 horas": timedelta(hours=8), "Últimas 24 horas": timedelta(days=1),
+                      "Últimos 7 dias": timedelta(days=7), "Últimos 30 dias": timedelta(days=30)}
+    CORES_STATUS = {"PRODUZINDO": "#7BC67B", "PARADA": "#E57373", "LIVRE": "#90B4E0"}
+    INTERVALO_LINHA_TEMPO = timedelta(seconds=30)
+    AMOSTRA_TENDENCIA = timedelta(minutes=1)
+    PONTOS_TENDENCIA = 120
+
     def __init__(self, master, app_controller):
         super().__init__(master, padding="20")
         self.app_controller = app_controller
@@ -641,45 +927,6 @@ class PainelGestor(ttk.Frame):
         self.atualizar_dados()
         self.after(3000, self.atualizar_dados_periodicamente)
 
-    def _calcular_oee_simulado(self, op_data):
-        if op_data["status"] != "PRODUZINDO" or op_data.get("inicio_producao") is None:
-            return "N/A"
-
-        produzido = op_data["produzido"]
-        meta_hora = op_data["meta_hora"]
-        inicio_producao = op_data["inicio_producao"]
-        tempo_decorrido = (datetime.now() - inicio_producao).total_seconds() / 3600
-
-        conexao = conectar_db()
-        if not conexao: return "0.0%"
-        cursor = conexao.cursor()
-
-        sql_paradas = "SELECT SUM(duracao_seg) AS total_parado FROM paradas_log WHERE op = ? AND fim IS NOT NULL"
-        cursor.execute(sql_paradas, (op_data['op'],))
-        resultado_parada = cursor.fetchone()
-        tempo_parado_seg = resultado_parada['total_parado'] or 0
-
-        sql_parada_aberta = "SELECT inicio FROM paradas_log WHERE op = ? AND fim IS NULL ORDER BY id DESC LIMIT 1"
-        cursor.execute(sql_parada_aberta, (op_data['op'],))
-        parada_aberta = cursor.fetchone()
-        if parada_aberta:
-            tempo_parado_seg += (datetime.now() - parada_aberta['inicio']).total_seconds()
-
-        conexao.close()
-
-        tempo_operacional_hr = (tempo_decorrido * 3600 - tempo_parado_seg) / 3600
-
-        if tempo_operacional_hr <= 0:
-            return "0.0%"
-
-        quantidade_esperada = tempo_operacional_hr * meta_hora
-        
-        performance = (produzido / quantidade_esperada) if quantidade_esperada > 0 else 0
-        
-        oee = performance * 100
-        
-        return f"{min(oee, 100):.1f}%"
-
     def atualizar_dados_periodicamente(self):
         self.atualizar_dados()
         self.after(3000, self.atualizar_dados_periodicamente)
@@ -690,15 +937,82 @@ class PainelGestor(ttk.Frame):
         btn_frame = ttk.Frame(self)
         btn_frame.pack(fill="x", anchor="ne")
         ttk.Button(btn_frame, text="Sair / Voltar para Login", command=self.app_controller.mostrar_tela_login).pack(side="right", padx=5, pady=5)
+        ttk.Button(btn_frame, text="Análise de Paradas", command=self.app_controller.mostrar_analise_paradas).pack(side="right", padx=5, pady=5)
+        ttk.Button(btn_frame, text="Apontamentos", command=self.app_controller.mostrar_apontamentos).pack(side="right", padx=5, pady=5)
+        self.btn_relatorios = ttk.Button(btn_frame, text="Gerar Relatórios", command=self.gerar_relatorios)
+        self.btn_relatorios.pack(side="right", padx=5, pady=5)
+        if self.app_controller.federacao:
+            ttk.Button(btn_frame, text="Visão Corporativa", command=self.app_controller.mostrar_visao_corporativa).pack(side="right", padx=5, pady=5)
         
         self.maquinas_frame = ttk.LabelFrame(self, text="Status das Máquinas", padding="10")
         self.maquinas_frame.pack(fill="x", pady=15)
+        self.rotulos_maquinas = {}
+
+        self.lbl_idade_kpi = ttk.Label(self, text="KPIs: aguardando primeiro cálculo", foreground="gray")
+        self.lbl_idade_kpi.pack(anchor="e")
+
+        self.tendencia_frame = ttk.LabelFrame(self, text="Tendências (últimas 2 horas, um ponto por minuto)", padding="10")
+        self.tendencia_frame.pack(fill="x", pady=5)
+        self.canvas_tendencia = tk.Canvas(self.tendencia_frame, height=40, bg="white", highlightthickness=0)
+        self.canvas_tendencia.pack(anchor="w")
+        self.tendencias = {}
+        self.proxima_amostra = datetime.min
+
+        self.seq_frame = ttk.LabelFrame(self, text="Sequenciamento Sugerido", padding="10")
+        self.seq_frame.pack(fill="x", pady=5)
+
+        seq_colunas = ("maquina", "carga", "proximas", "atrasadas")
+        self.tree_seq = ttk.Treeview(self.seq_frame, columns=seq_colunas, show="headings", height=4)
+        self.tree_seq.heading("maquina", text="Máquina")
+        self.tree_seq.heading("carga", text="Carga (h)")
+        self.tree_seq.heading("proximas", text="Próximas OPs")
+        self.tree_seq.heading("atrasadas", text="Previstas com Atraso")
+        self.tree_seq.column("maquina", width=80, anchor=tk.CENTER)
+        self.tree_seq.column("carga", width=70, anchor=tk.CENTER)
+        self.tree_seq.column("proximas", width=320)
+        self.tree_seq.column("atrasadas", width=120, anchor=tk.CENTER)
+        self.tree_seq.pack(fill="x")
+
+        self.linha_frame = ttk.LabelFrame(self, text="Linha do Tempo das Máquinas", padding="10")
+        self.linha_frame.pack(fill="x", pady=5)
+
+        periodo_frame = ttk.Frame(self.linha_frame)
+        periodo_frame.pack(fill="x")
+        self.periodo_linha_var = tk.StringVar(value="Últimas 8 horas")
+        periodo = ttk.Combobox(periodo_frame, textvariable=self.periodo_linha_var, state="readonly",
+                               values=list(self.PERIODOS_LINHA), width=18)
+        periodo.pack(side="left")
+        periodo.bind("<<ComboboxSelected>>", lambda e: self._atualizar_linha_tempo())
+        for status, cor in self.CORES_STATUS.items():
+            tk.Label(periodo_frame, text=f"  {status}  ", bg=cor).pack(side="right", padx=2)
+
+        self.canvas_linha = tk.Canvas(self.linha_frame, height=60, bg="white", highlightthickness=0)
+        self.canvas_linha.pack(fill="x", pady=5)
+        self.canvas_linha.bind("<Configure>", lambda e: self._atualizar_linha_tempo())
+        self.proxima_linha_tempo = datetime.min
 
         self.op_frame = ttk.LabelFrame(self, text="Progresso das Ordens de Produção", padding="10")
         self.op_frame.pack(fill="both", expand=True, pady=10)
         
-        columns = ("op", "maquina", "produto", "planejado", "produzido", "status", "meta", "oee")
-        self.tree = ttk.Treeview(self.op_frame, columns=columns, show="headings")
+        busca_frame = ttk.Frame(self.op_frame)
+        busca_frame.pack(fill="x", pady=(0, 5))
+        ttk.Label(busca_frame, text="Buscar OP / Produto:").pack(side="left")
+        self.busca_var = tk.StringVar()
+        busca_entry = ttk.Entry(busca_frame, textvariable=self.busca_var, width=30)
+        busca_entry.pack(side="left", padx=5)
+        busca_entry.bind("<KeyRelease>", self._agendar_busca)
+        self.busca_agendada = None
+        self.kpi_por_op = {}
+
+        # Ações sobre todas as OPs selecionadas (Ctrl/Shift + clique), cada uma numa única transação.
+        ttk.Button(busca_frame, text="Reprogramar Prazo", command=self.reprogramar_ops).pack(side="right", padx=2)
+        ttk.Button(busca_frame, text="Trocar Máquina", command=self.reatribuir_ops).pack(side="right", padx=2)
+        ttk.Button(busca_frame, text="Finalizar", command=self.finalizar_ops).pack(side="right", padx=2)
+        ttk.Button(busca_frame, text="Cancelar", command=self.cancelar_ops).pack(side="right", padx=2)
+        ttk.Label(busca_frame, text="Selecionadas:").pack(side="right", padx=5)
+
+        columns = ("op", "maquina", "produto", "planejado", "produzido", "status", "meta", "oee", "taxa", "previsao", "alerta")
+        self.tree = ttk.Treeview(self.op_frame, columns=columns, show="headings", selectmode="extended")
 
         self.tree.heading("op", text="OP")
         self.tree.heading("maquina", text="Máquina")
@@ -708,6 +1022,9 @@ class PainelGestor(ttk.Frame):
         self.tree.heading("status", text="Status")
         self.tree.heading("meta", text="Meta/H")
         self.tree.heading("oee", text="OEE")
+        self.tree.heading("taxa", text="Ritmo Atual")
+        self.tree.heading("previsao", text="Previsão")
+        self.tree.heading("alerta", text="Alerta de Ritmo")
         
         self.tree.column("op", width=80, anchor=tk.CENTER)
         self.tree.column("maquina", width=80, anchor=tk.CENTER)
@@ -717,44 +1034,579 @@ class PainelGestor(ttk.Frame):
         self.tree.column("status", width=90, anchor=tk.CENTER)
         self.tree.column("meta", width=60, anchor=tk.CENTER)
         self.tree.column("oee", width=60, anchor=tk.CENTER)
+        self.tree.column("taxa", width=80, anchor=tk.CENTER)
+        self.tree.column("previsao", width=90, anchor=tk.CENTER)
+        self.tree.column("alerta", width=280)
+        self.tree.tag_configure("alerta_ritmo", background="#FFE0B2")
+        self.tree.tag_configure("cancelada", foreground="gray")
 
         self.tree.pack(fill="both", expand=True)
 
     def atualizar_dados(self):
-        conexao = conectar_db()
+        conexao = conectar_db_leitura()
         if not conexao: return
-        cursor = conexao.cursor()
 
-        for widget in self.maquinas_frame.winfo_children():
-            widget.destroy()
+        agora = datetime.now()
+        kpis = self.app_controller.ler_kpi(conexao, agora)
+        self.kpi_por_op = {row['op']: row for row in kpis if row['op']}
+
+        if kpis:
+            idade = max(row['idade_seg'] for row in kpis)
+            self.lbl_idade_kpi.config(text=f"KPIs atualizados há {idade:.0f}s")
+        self._atualizar_tendencias(kpis, agora)
+
+        self._atualizar_maquinas(kpis)
+
+        ops_db = self._consultar_ops(conexao)
 
-        maquinas_db = cursor.execute("SELECT maquina, status FROM maquinas_status").fetchall()
-        for row in maquinas_db:
-            status = row['status']
+        sequenciador = self.app_controller.sequenciador
+        sequenciador.sincronizar(conexao)
+        conexao.close()
+        self._atualizar_sequenciamento(sequenciador, agora)
+        if agora >= self.proxima_linha_tempo:
+            self._atualizar_linha_tempo()
+        self._preencher_ops(ops_db, agora)
+
+    def _atualizar_maquinas(self, kpis):
+        # Os rótulos só são recriados quando o conjunto de máquinas muda; a cada ciclo só mudam texto e cor.
+        maquinas = [row['maquina'] for row in kpis]
+        if maquinas != list(self.rotulos_maquinas):
+            for widget in self.maquinas_frame.winfo_children():
+                widget.destroy()
+            self.rotulos_maquinas = {}
+            for maquina in maquinas:
+                frame = ttk.Frame(self.maquinas_frame)
+                frame.pack(side="left", padx=10, pady=5)
+                ttk.Label(frame, text=f"{maquina}:", font=("Arial", 10, "bold")).pack(side="left")
+                lbl_status = ttk.Label(frame, font=("Arial", 10, "bold"))
+                lbl_status.pack(side="left", padx=5)
+                lbl_ritmo = ttk.Label(frame, foreground="#E65100")
+                lbl_ritmo.pack(side="left")
+                self.rotulos_maquinas[maquina] = (lbl_status, lbl_ritmo)
+
+        for row in kpis:
+            status = row['status_maquina']
             cor = "green" if status == "PRODUZINDO" else ("red" if status == "PARADA" else "blue")
-            
-            frame = ttk.Frame(self.maquinas_frame)
-            frame.pack(side="left", padx=10, pady=5)
-            
-            ttk.Label(frame, text=f"{row['maquina']}:", font=("Arial", 10, "bold")).pack(side="left")
-            ttk.Label(frame, text=status, font=("Arial", 10, "bold"), foreground=cor).pack(side="left", padx=5)
+            lbl_status, lbl_ritmo = self.rotulos_maquinas[row['maquina']]
+            lbl_status.config(text=status, foreground=cor)
+            lbl_ritmo.config(text="⚠ ritmo" if row.get('alerta_ritmo') else "")
+
+    def _atualizar_tendencias(self, kpis, agora):
+        maquinas = [row['maquina'] for row in kpis]
+        if maquinas != list(self.tendencias):
+            self._refazer_tendencias(maquinas)
+        for row in kpis:
+            self.tendencias[row['maquina']].observar(row)
+        if agora >= self.proxima_amostra:
+            self.proxima_amostra = agora + self.AMOSTRA_TENDENCIA
+            for tendencia in self.tendencias.values():
+                tendencia.amostrar()
+
+    def _refazer_tendencias(self, maquinas):
+        canvas = self.canvas_tendencia
+        margem, espaco, altura_linha, cabecalho = 70, 20, 22, 14
+        largura = 2 * (self.PONTOS_TENDENCIA - 1)
+        canvas.delete("all")
+        for j, titulo in enumerate(("Peças/h (até 1,5× a meta)", "OEE", "Estado")):
+            canvas.create_text(margem + j * (largura + espaco), 0, text=titulo, anchor="nw", font=("Arial", 8))
+
+        anteriores, self.tendencias = self.tendencias, {}
+        for i, maquina in enumerate(maquinas):
+            tendencia = anteriores.get(maquina) or TendenciaMaquina(canvas, self.PONTOS_TENDENCIA, self.CORES_STATUS)
+            y = cabecalho + i * altura_linha
+            canvas.create_text(margem - 5, y + altura_linha / 2, text=maquina, anchor="e", font=("Arial", 9))
+            for j, serie in enumerate(tendencia.series()):
+                serie.posicionar(margem + j * (largura + espaco), y + 2, largura, altura_linha - 4)
+            self.tendencias[maquina] = tendencia
+        canvas.config(width=margem + 3 * (largura + espaco), height=cabecalho + len(maquinas) * altura_linha)
+
+    def _consultar_ops(self, conexao):
+        termo = self.busca_var.get().strip()
+        if not termo:
+            return conexao.execute("SELECT * FROM ordens_producao").fetchall()
+        ops = [r['op'] for r in buscar_ops(conexao, termo, limite=LIMITE_BUSCA_GESTOR)]
+        if not ops:
+            return []
+        marcadores = ", ".join("?" * len(ops))
+        return conexao.execute(f"SELECT * FROM ordens_producao WHERE op IN ({marcadores})", ops).fetchall()
 
-        for i in self.tree.get_children():
-            self.tree.delete(i)
+    def _agendar_busca(self, event=None):
+        if self.busca_agendada:
+            self.after_cancel(self.busca_agendada)
+        self.busca_agendada = self.after(ATRASO_BUSCA_MS, self._buscar)
 
-        ops_db = cursor.execute("SELECT * FROM ordens_producao").fetchall()
+    def _buscar(self):
+        self.busca_agendada = None
+        conexao = conectar_db_leitura()
+        if not conexao: return
+        ops_db = self._consultar_ops(conexao)
         conexao.close()
-        
-        for row in ops_db:
-            op_data = dict(row)
-            
-            oee = self._calcular_oee_simulado(op_data)
+        self._preencher_ops(ops_db, datetime.now())
+
+    def _preencher_ops(self, ops_db, agora):
+        # Atualiza as linhas existentes no lugar em vez de apagar e recriar tudo a cada ciclo.
+        existentes = set(self.tree.get_children())
+        for posicao, op_data in enumerate(ops_db):
+            kpi = self.kpi_por_op.get(op_data['op'], {})
+            oee = formatar_oee(kpi.get('oee'))
             meta_display = f"{op_data['meta_hora']}/h"
-            
-            self.tree.insert("", "end", iid=op_data['op'], 
-                             values=(op_data['op'], op_data['maquina'], op_data['produto'], 
-                                     op_data['planejado'], op_data['produzido'], op_data['status'], 
-                                     meta_display, oee))
+            taxa = formatar_taxa(kpi.get('taxa_hora'))
+            previsao = formatar_previsao(kpi.get('previsao_termino'), agora)
+            alerta = kpi.get('alerta_ritmo')
+            valores = (op_data['op'], op_data['maquina'], op_data['produto'],
+                       op_data['planejado'], op_data['produzido'], op_data['status'],
+                       meta_display, oee, taxa, previsao, alerta or "")
+            tags = ("alerta_ritmo",) if alerta else (("cancelada",) if op_data['status'] == "CANCELADA" else ())
+
+            if op_data['op'] in existentes:
+                existentes.discard(op_data['op'])
+                self.tree.item(op_data['op'], values=valores, tags=tags)
+                self.tree.move(op_data['op'], "", posicao)
+            else:
+                self.tree.insert("", posicao, iid=op_data['op'], values=valores, tags=tags)
+        if existentes:
+            self.tree.delete(*existentes)
+
+    def _ops_selecionadas(self):
+        ops = list(self.tree.selection())
+        if not ops:
+            messagebox.showwarning("Atenção", "Selecione uma ou mais OPs (Ctrl/Shift + clique).")
+        return ops
+
+    def _executar_lote(self, funcao, ops, *args, observacao=None):
+        conexao = conectar_db()
+        if not conexao: return None
+        try:
+            return funcao(conexao, ops, *args, self.app_controller.usuario_logado,
+                          terminal=self.app_controller.terminal, observacao=observacao)
+        except TransicaoInvalida as e:
+            messagebox.showwarning("Atenção", str(e))
+        except sqlite3.OperationalError as e:
+            messagebox.showerror("Erro", f"Falha ao aplicar a operação em lote, tente novamente: {e}")
+        finally:
+            conexao.close()
+            self.atualizar_dados()
+        return None
+
+    def cancelar_ops(self):
+        ops = self._ops_selecionadas()
+        if not ops: return
+        observacao = simpledialog.askstring(
+            "Cancelar OPs", f"Cancelar {len(ops)} OP(s)? As que estão em produção liberam a máquina.\n"
+                            "Motivo do cancelamento:", parent=self)
+        if observacao is None: return
+        resultado = self._executar_lote(operacoes_lote.cancelar, ops, observacao=observacao or None)
+        if resultado:
+            quantidade, paradas = resultado
+            messagebox.showinfo("Cancelar OPs", f"{quantidade} OP(s) cancelada(s)"
+                                + (f", {paradas} parada(s) aberta(s) fechada(s)." if paradas else "."))
+
+    def finalizar_ops(self):
+        ops = self._ops_selecionadas()
+        if not ops: return
+        if not messagebox.askyesno("Finalizar OPs", f"Finalizar {len(ops)} OP(s) em produção e liberar as máquinas?",
+                                   parent=self):
+            return
+        resultado = self._executar_lote(operacoes_lote.finalizar, ops)
+        if resultado:
+            quantidade, paradas = resultado
+            messagebox.showinfo("Finalizar OPs", f"{quantidade} OP(s) finalizada(s)"
+                                + (f", {paradas} parada(s) aberta(s) fechada(s)." if paradas else "."))
+
+    def reatribuir_ops(self):
+        ops = self._ops_selecionadas()
+        if not ops: return
+        maquinas = self.app_controller.cache.maquinas()
+        maquina = simpledialog.askstring("Trocar Máquina", f"Nova máquina para {len(ops)} OP(s) pendente(s):\n"
+                                         + ", ".join(maquinas), parent=self)
+        if not maquina or not maquina.strip(): return
+        maquina = maquina.strip()
+        if maquina not in maquinas and not messagebox.askyesno(
+                "Trocar Máquina", f"A máquina '{maquina}' não está cadastrada. Cadastrar e continuar?", parent=self):
+            return
+        quantidade = self._executar_lote(operacoes_lote.reatribuir_maquina, ops, maquina)
+        if quantidade:
+            messagebox.showinfo("Trocar Máquina", f"{quantidade} OP(s) passada(s) para {maquina}.")
+
+    def reprogramar_ops(self):
+        ops = self._ops_selecionadas()
+        if not ops: return
+        prazo_str = simpledialog.askstring("Reprogramar Prazo", f"Novo prazo para {len(ops)} OP(s) (dd/mm/aaaa; "
+                                           "vazio tira o prazo):", parent=self)
+        if prazo_str is None: return
+        prazo = None
+        if prazo_str.strip():
+            try:
+                prazo = datetime.strptime(prazo_str.strip(), "%d/%m/%Y").replace(hour=23, minute=59)
+            except ValueError:
+                messagebox.showerror("Erro", "Prazo deve estar no formato dd/mm/aaaa.")
+                return
+        quantidade = self._executar_lote(operacoes_lote.reprogramar, ops, prazo)
+        if quantidade:
+            messagebox.showinfo("Reprogramar Prazo", f"Prazo de {quantidade} OP(s) "
+                                + (f"passado para {prazo:%d/%m/%Y}." if prazo else "removido."))
+
+    def _atualizar_sequenciamento(self, sequenciador, agora):
+        for i in self.tree_seq.get_children():
+            self.tree_seq.delete(i)
+
+        for maquina, carga in sorted(sequenciador.carga_horas().items()):
+            proximas = ", ".join(s.op for s in sequenciador.proximas(maquina, 3, agora))
+            proximas += " ..." if sequenciador.pendentes(maquina) > 3 else ""
+            atrasadas = sequenciador.atrasadas(maquina, agora)
+            self.tree_seq.insert("", "end", values=(maquina, f"{carga:.1f}", proximas or "--", atrasadas))
+
+    def gerar_relatorios(self):
+        from relatorios import PASTA_PADRAO, periodo_do_argumento  # ProcessPool/multiprocessing fora da partida
+
+        periodo = simpledialog.askstring(
+            "Relatórios", "Período (AAAA-MM para o mês inteiro, AAAA-MM-DD para um dia):",
+            initialvalue=datetime.now().strftime("%Y-%m-%d"), parent=self)
+        if not periodo:
+            return
+        periodo = periodo.strip()
+        try:
+            dia_inicio, dia_fim = periodo_do_argumento(periodo)
+        except ValueError:
+            messagebox.showerror("Erro", "Período inválido. Use AAAA-MM ou AAAA-MM-DD.")
+            return
+
+        pasta = os.path.join(PASTA_PADRAO, periodo)
+        self.resultado_relatorios = None
+        self.btn_relatorios.config(state="disabled", text="Gerando relatórios...")
+        threading.Thread(target=self._gerar_relatorios, args=(dia_inicio, dia_fim, pasta), daemon=True).start()
+        self.after(500, self._verificar_relatorios)
+
+    def _gerar_relatorios(self, dia_inicio, dia_fim, pasta):
+        from relatorios import gerar_relatorios
+
+        try:
+            quantidade, duracao = gerar_relatorios(BANCO.alvo, dia_inicio, dia_fim, pasta)
+            self.resultado_relatorios = ("ok", f"{quantidade} relatórios gerados em {duracao:.1f}s.\n"
+                                               f"{os.path.abspath(os.path.join(pasta, 'index.html'))}")
+        except Exception as e:
+            self.resultado_relatorios = ("erro", f"Falha ao gerar os relatórios: {e}")
+
+    def _verificar_relatorios(self):
+        if self.resultado_relatorios is None:
+            self.after(500, self._verificar_relatorios)
+            return
+        self.btn_relatorios.config(state="normal", text="Gerar Relatórios")
+        tipo, mensagem = self.resultado_relatorios
+        if tipo == "ok":
+            messagebox.showinfo("Relatórios", mensagem)
+        else:
+            messagebox.showerror("Erro", mensagem)
+
+    def _atualizar_linha_tempo(self):
+        conexao = conectar_db_leitura()
+        if not conexao: return
+        agora = datetime.now()
+        self.proxima_linha_tempo = agora + self.INTERVALO_LINHA_TEMPO
+
+        canvas = self.canvas_linha
+        margem, altura_linha, eixo = 70, 20, 16
+        largura = max(canvas.winfo_width(), 400)
+        area = largura - margem - 10
+        inicio = agora - self.PERIODOS_LINHA[self.periodo_linha_var.get()]
+        dados = linha_do_tempo(conexao, inicio, agora, largura=area)
+        conexao.close()
+
+        canvas.delete("all")
+        canvas.config(height=len(dados) * altura_linha + eixo + 4)
+        escala = area / (agora - inicio).total_seconds()
+
+        for i, (maquina, linha) in enumerate(dados.items()):
+            y = i * altura_linha + 2
+            canvas.create_text(margem - 5, y + altura_linha / 2, text=maquina, anchor="e", font=("Arial", 9))
+            for status, a, b in linha["segmentos"]:
+                x0 = margem + (a - inicio).total_seconds() * escala
+                x1 = margem + (b - inicio).total_seconds() * escala
+                canvas.create_rectangle(x0, y + 2, max(x1, x0 + 1), y + altura_linha - 2,
+                                        fill=self.CORES_STATUS.get(status, "gray"), width=0)
+            total = sum(linha["totais"].values())
+            if total > 0:
+                produzindo = linha["totais"].get("PRODUZINDO", 0) / total * 100
+                canvas.create_text(margem + area + 5, y + altura_linha / 2, text=f"{produzindo:.0f}%",
+                                   anchor="w", font=("Arial", 8))
+
+        y = len(dados) * altura_linha + 2
+        formato = "%H:%M" if agora - inicio <= timedelta(days=1) else "%d/%m"
+        for k in range(6):
+            x = margem + area * k / 5
+            marca = inicio + (agora - inicio) * k / 5
+            canvas.create_line(x, 2, x, y, fill="#DDDDDD")
+            canvas.create_text(x, y + eixo / 2, text=marca.strftime(formato), font=("Arial", 8))
+
+class TelaAnaliseParadas(ttk.Frame):
+    PERIODOS = {"Todo o histórico": None, "Hoje": 0, "Últimos 7 dias": 6, "Últimos 30 dias": 29, "Últimos 365 dias": 364}
+    ABAS = [("motivo", "Por Motivo"), ("maquina", "Por Máquina"), ("operador", "Por Operador"), ("hora", "Por Hora do Dia")]
+
+    def __init__(self, master, app_controller):
+        super().__init__(master, padding="20")
+        self.app_controller = app_controller
+        self.criar_widgets()
+        self.atualizar_dados()
+
+    def criar_widgets(self):
+        ttk.Label(self, text="Análise de Paradas", font=("Arial", 20, "bold")).pack(pady=10)
+
+        btn_frame = ttk.Frame(self)
+        btn_frame.pack(fill="x")
+        ttk.Label(btn_frame, text="Período:").pack(side="left", padx=5)
+        self.periodo_var = tk.StringVar(value="Últimos 30 dias")
+        periodo = ttk.Combobox(btn_frame, textvariable=self.periodo_var, state="readonly",
+                               values=list(self.PERIODOS), width=20)
+        periodo.pack(side="left", padx=5)
+        periodo.bind("<<ComboboxSelected>>", lambda e: self.atualizar_dados())
+        ttk.Button(btn_frame, text="Voltar ao Painel", command=self.app_controller.mostrar_painel_gestor).pack(side="right", padx=5)
+
+        notebook = ttk.Notebook(self)
+        notebook.pack(fill="both", expand=True, pady=10)
+
+        self.trees = {}
+        for dimensao, titulo in self.ABAS:
+            aba = ttk.Frame(notebook, padding="10")
+            notebook.add(aba, text=titulo)
+            columns = ("chave", "quantidade", "horas", "pct", "acumulado")
+            tree = ttk.Treeview(aba, columns=columns, show="headings")
+            tree.heading("chave", text=titulo.replace("Por ", ""))
+            tree.heading("quantidade", text="Ocorrências")
+            tree.heading("horas", text="Tempo Parado (h)")
+            tree.heading("pct", text="%")
+            tree.heading("acumulado", text="% Acumulado")
+            tree.column("chave", width=200)
+            for coluna in columns[1:]:
+                tree.column(coluna, width=100, anchor=tk.CENTER)
+            tree.pack(fill="both", expand=True)
+            self.trees[dimensao] = tree
+
+        aba = ttk.Frame(notebook, padding="10")
+        notebook.add(aba, text="MTBF / MTTR")
+        self.tree_mtbf = ttk.Treeview(aba, columns=("maquina", "falhas", "mtbf", "mttr"), show="headings")
+        self.tree_mtbf.heading("maquina", text="Máquina")
+        self.tree_mtbf.heading("falhas", text="Falhas (não planejadas)")
+        self.tree_mtbf.heading("mtbf", text="MTBF (h)")
+        self.tree_mtbf.heading("mttr", text="MTTR (h)")
+        for coluna in ("falhas", "mtbf", "mttr"):
+            self.tree_mtbf.column(coluna, width=120, anchor=tk.CENTER)
+        self.tree_mtbf.pack(fill="both", expand=True)
+
+    def _periodo(self):
+        dias = self.PERIODOS[self.periodo_var.get()]
+        if dias is None:
+            return None, None
+        hoje = datetime.now().date()
+        return (hoje - timedelta(days=dias)).isoformat(), hoje.isoformat()
+
+    def atualizar_dados(self):
+        conexao = conectar_db_leitura()
+        if not conexao: return
+        dia_inicio, dia_fim = self._periodo()
+
+        for dimensao, tree in self.trees.items():
+            for i in tree.get_children():
+                tree.delete(i)
+            for row in pareto(conexao, dimensao, dia_inicio, dia_fim):
+                chave = f"{row['chave']}h" if dimensao == "hora" else row['chave']
+                tree.insert("", "end", values=(chave, row['quantidade'], f"{row['total_seg'] / 3600:.2f}",
+                                               f"{row['pct']:.1f}%", f"{row['pct_acumulado']:.1f}%"))
+
+        for i in self.tree_mtbf.get_children():
+            self.tree_mtbf.delete(i)
+        for row in mtbf_mttr(conexao, dia_inicio, dia_fim):
+            mtbf = "--" if row['mtbf_h'] is None else f"{row['mtbf_h']:.1f}"
+            mttr = "--" if row['mttr_h'] is None else f"{row['mttr_h']:.2f}"
+            self.tree_mtbf.insert("", "end", values=(row['maquina'], row['falhas'], mtbf, mttr))
+
+        conexao.close()
+
+class TelaApontamentos(ttk.Frame):
+    """Diário de apontamentos: consulta, estorno e correção de motivo (compensações, nada é apagado)."""
+    LIMITE = 300
+
+    def __init__(self, master, app_controller):
+        super().__init__(master, padding="20")
+        self.app_controller = app_controller
+        self.criar_widgets()
+        self.atualizar_dados()
+
+    def criar_widgets(self):
+        ttk.Label(self, text="Diário de Apontamentos", font=("Arial", 20, "bold")).pack(pady=10)
+
+        btn_frame = ttk.Frame(self)
+        btn_frame.pack(fill="x")
+        ttk.Label(btn_frame, text="OP:").pack(side="left", padx=5)
+        self.op_var = tk.StringVar()
+        op_entry = ttk.Entry(btn_frame, textvariable=self.op_var, width=20)
+        op_entry.pack(side="left", padx=5)
+        op_entry.bind("<Return>", lambda e: self.atualizar_dados())
+        ttk.Button(btn_frame, text="Filtrar", command=self.atualizar_dados).pack(side="left", padx=5)
+        ttk.Button(btn_frame, text="Voltar ao Painel", command=self.app_controller.mostrar_painel_gestor).pack(side="right", padx=5)
+        ttk.Button(btn_frame, text="Corrigir Motivo", command=self.corrigir_motivo).pack(side="right", padx=5)
+        ttk.Button(btn_frame, text="Estornar", command=self.estornar).pack(side="right", padx=5)
+
+        columns = ("id", "momento", "op", "acao", "pecas", "motivo", "operador", "terminal", "situacao")
+        self.tree = ttk.Treeview(self, columns=columns, show="headings", selectmode="browse")
+        titulos = ("Nº", "Momento", "OP", "Ação", "Peças", "Motivo", "Operador", "Terminal", "Situação")
+        for coluna, titulo in zip(columns, titulos):
+            self.tree.heading(coluna, text=titulo)
+            self.tree.column(coluna, width=80, anchor=tk.CENTER)
+        self.tree.column("momento", width=130)
+        self.tree.column("motivo", width=150, anchor=tk.W)
+        self.tree.pack(fill="both", expand=True, pady=10)
+
+    def atualizar_dados(self):
+        conexao = conectar_db()
+        if not conexao: return
+        linhas = listar(conexao, self.op_var.get().strip() or None, self.LIMITE)
+        conexao.close()
+
+        for i in self.tree.get_children():
+            self.tree.delete(i)
+        for row in linhas:
+            if row['estornado']:
+                situacao = "Estornado"
+            elif row['corrige']:
+                situacao = f"Corrige nº {row['corrige']}"
+            else:
+                situacao = ""
+            self.tree.insert("", "end", iid=str(row['id']), values=(
+                row['id'], f"{row['momento']:%d/%m %H:%M:%S}", row['op'], row['acao'],
+                "" if row['pecas'] is None else row['pecas'], row['motivo'] or "",
+                row['operador'] or "", row['terminal'] or "", situacao))
+
+    def _selecionado(self):
+        selecao = self.tree.selection()
+        if not selecao:
+            messagebox.showwarning("Atenção", "Selecione um apontamento.")
+            return None
+        return int(selecao[0])
+
+    def _executar(self, funcao, *args):
+        conexao = conectar_db()
+        if not conexao: return False
+        try:
+            funcao(conexao, *args, terminal=socket.gethostname())
+            return True
+        except TransicaoInvalida as e:
+            messagebox.showwarning("Atenção", str(e))
+        except sqlite3.OperationalError as e:
+            messagebox.showerror("Erro", f"Falha ao gravar a correção, tente novamente: {e}")
+        finally:
+            conexao.close()
+            self.atualizar_dados()
+        return False
+
+    def estornar(self):
+        id_apontamento = self._selecionado()
+        if id_apontamento is None: return
+        observacao = simpledialog.askstring("Estornar", f"Motivo do estorno do apontamento nº {id_apontamento}:",
+                                            parent=self)
+        if observacao is None: return
+        if self._executar(estornar, id_apontamento, self.app_controller.usuario_logado, observacao=observacao or None):
+            messagebox.showinfo("Estorno", f"Apontamento nº {id_apontamento} estornado.")
+
+    def corrigir_motivo(self):
+        id_apontamento = self._selecionado()
+        if id_apontamento is None: return
+        motivos = [m.motivo for m in self.app_controller.cache.motivos()]
+        motivo = simpledialog.askstring("Corrigir Motivo", "Novo motivo:\n" + "\n".join(motivos), parent=self)
+        if not motivo: return
+        if motivo not in motivos:
+            messagebox.showwarning("Atenção", f"Motivo '{motivo}' não cadastrado.")
+            return
+        if self._executar(corrigir_motivo, id_apontamento, motivo, self.app_controller.usuario_logado):
+            messagebox.showinfo("Correção", f"Motivo do apontamento nº {id_apontamento} corrigido para {motivo}.")
+
+class TelaCorporativa(ttk.Frame):
+    """Todos os sites do registro, lidos em paralelo (somente leitura)."""
+    DIAS_PARETO = 29
+
+    def __init__(self, master, app_controller):
+        super().__init__(master, padding="20")
+        self.app_controller = app_controller
+        self.criar_widgets()
+        self.atualizar_dados()
+        self.after(5000, self.atualizar_dados_periodicamente)
+
+    def atualizar_dados_periodicamente(self):
+        self.atualizar_dados()
+        self.after(5000, self.atualizar_dados_periodicamente)
+
+    def _criar_tree(self, master, colunas, altura):
+        tree = ttk.Treeview(master, columns=[c for c, _, _ in colunas], show="headings", height=altura)
+        for coluna, titulo, largura in colunas:
+            tree.heading(coluna, text=titulo)
+            tree.column(coluna, width=largura, anchor=tk.CENTER)
+        tree.pack(fill="both", expand=True)
+        return tree
+
+    def criar_widgets(self):
+        ttk.Label(self, text="Visão Corporativa", font=("Arial", 20, "bold")).pack(pady=10)
+
+        btn_frame = ttk.Frame(self)
+        btn_frame.pack(fill="x")
+        self.lbl_sites = ttk.Label(btn_frame, text="", foreground="gray")
+        self.lbl_sites.pack(side="left", padx=5)
+        ttk.Button(btn_frame, text="Voltar ao Painel", command=self.app_controller.mostrar_painel_gestor).pack(side="right", padx=5)
+
+        sites_frame = ttk.LabelFrame(self, text="Sites", padding="10")
+        sites_frame.pack(fill="x", pady=5)
+        self.tree_sites = self._criar_tree(sites_frame, [
+            ("site", "Site", 140), ("produzindo", "Produzindo", 80), ("parada", "Paradas", 70),
+            ("livre", "Livres", 60), ("ops_producao", "OPs em Produção", 110), ("ops_pendentes", "OPs Pendentes", 100),
+            ("ops_finalizadas", "OPs Finalizadas", 100)], 4)
+
+        maquinas_frame = ttk.LabelFrame(self, text="Máquinas", padding="10")
+        maquinas_frame.pack(fill="both", expand=True, pady=5)
+        self.tree_maquinas = self._criar_tree(maquinas_frame, [
+            ("site", "Site", 120), ("maquina", "Máquina", 90), ("status", "Status", 90), ("op", "OP", 110),
+            ("progresso", "Progresso", 80), ("oee", "OEE", 60), ("taxa", "Taxa", 80)], 8)
+
+        pareto_frame = ttk.LabelFrame(self, text=f"Paradas por Motivo (últimos {self.DIAS_PARETO + 1} dias)", padding="10")
+        pareto_frame.pack(fill="x", pady=5)
+        self.tree_pareto = self._criar_tree(pareto_frame, [
+            ("motivo", "Motivo", 200), ("quantidade", "Ocorrências", 90), ("horas", "Tempo Parado (h)", 110),
+            ("pct", "%", 60), ("acumulado", "% Acumulado", 90)], 5)
+
+    def atualizar_dados(self):
+        federacao = self.app_controller.federacao
+        hoje = datetime.now().date()
+        resumo, erros = resumo_sites(federacao)
+        kpis, erros_kpi = kpi_corporativo(federacao)
+        motivos, erros_pareto = pareto_corporativo(
+            federacao, "motivo", (hoje - timedelta(days=self.DIAS_PARETO)).isoformat(), hoje.isoformat())
+        erros.update(erros_kpi)
+        erros.update(erros_pareto)
+
+        for tree in (self.tree_sites, self.tree_maquinas, self.tree_pareto):
+            for i in tree.get_children():
+                tree.delete(i)
+
+        for site, dados in resumo.items():
+            maquinas, ops = dados["maquinas"], dados["ops"]
+            self.tree_sites.insert("", "end", values=(
+                site, maquinas.get("PRODUZINDO", 0), maquinas.get("PARADA", 0), maquinas.get("LIVRE", 0),
+                ops.get("PRODUZINDO", 0), ops.get("PENDENTE", 0), ops.get("FINALIZADA", 0)))
+
+        for row in kpis:
+            progresso = f"{row['progresso']:.0f}%" if row['op'] else "--"
+            self.tree_maquinas.insert("", "end", values=(
+                row['site'], row['maquina'], row['status_maquina'], row['op'] or "--", progresso,
+                formatar_oee(row['oee']), formatar_taxa(row['taxa_hora'])))
+
+        for row in motivos:
+            self.tree_pareto.insert("", "end", values=(
+                row['chave'], row['quantidade'], f"{row['total_seg'] / 3600:.2f}",
+                f"{row['pct']:.1f}%", f"{row['pct_acumulado']:.1f}%"))
+
+        total = len(REGISTRO_SITES.sites)
+        if erros:
+            self.lbl_sites.config(text=f"{total - len(erros)}/{total} sites. Indisponíveis: {', '.join(sorted(erros))}",
+                                  foreground="red")
+        else:
+            self.lbl_sites.config(text=f"{total} sites, atualizado às {datetime.now():%H:%M:%S}", foreground="gray")
 
 class TelaCadastro(ttk.Frame):
     def __init__(self, master, app_controller):
@@ -775,6 +1627,18 @@ class TelaCadastro(ttk.Frame):
         motivo_tab = ttk.Frame(notebook, padding="10")
         self._criar_cadastro_motivo(motivo_tab)
         notebook.add(motivo_tab, text="Motivos de Parada")
+
+        calendario_tab = ttk.Frame(notebook, padding="10")
+        self._criar_cadastro_calendario(calendario_tab)
+        notebook.add(calendario_tab, text="Turnos e Paradas Planejadas")
+
+        saude_tab = ttk.Frame(notebook, padding="10")
+        self._criar_saude_banco(saude_tab)
+        notebook.add(saude_tab, text="Saúde do Banco")
+
+        memoria_tab = ttk.Frame(notebook, padding="10")
+        self._criar_memoria(memoria_tab)
+        notebook.add(memoria_tab, text="Memória dos Terminais")
         
         btn_frame = ttk.Frame(self)
         btn_frame.pack(pady=10)
@@ -792,7 +1656,8 @@ class TelaCadastro(ttk.Frame):
             "produto": tk.StringVar(),
             "planejado": tk.StringVar(),
             "maquina": tk.StringVar(),
-            "meta": tk.StringVar()
+            "meta": tk.StringVar(),
+            "prazo": tk.StringVar()
         }
 
         fields = [
@@ -800,12 +1665,18 @@ class TelaCadastro(ttk.Frame):
             ("Produto:", self.vars["produto"]),
             ("Quant. Planejada:", self.vars["planejado"]),
             ("Máquina/Linha:", self.vars["maquina"]),
-            ("Meta por Hora:", self.vars["meta"])
+            ("Meta por Hora:", self.vars["meta"]),
+            ("Prazo (dd/mm/aaaa):", self.vars["prazo"])
         ]
 
         for i, (label_text, var) in enumerate(fields):
             ttk.Label(form_frame, text=label_text).grid(row=i, column=0, padx=5, pady=5, sticky="w")
-            ttk.Entry(form_frame, textvariable=var, width=30).grid(row=i, column=1, padx=5, pady=5)
+            if var is self.vars["maquina"]:
+                self.entry_maquina = ttk.Combobox(form_frame, textvariable=var, width=28,
+                                                  values=self.app_controller.cache.maquinas())
+                self.entry_maquina.grid(row=i, column=1, padx=5, pady=5)
+            else:
+                ttk.Entry(form_frame, textvariable=var, width=30).grid(row=i, column=1, padx=5, pady=5)
 
         ttk.Button(form_frame, text="Cadastrar OP", command=self.cadastrar_op).grid(row=len(fields), column=0, columnspan=2, pady=10)
 
@@ -815,6 +1686,7 @@ class TelaCadastro(ttk.Frame):
         planejado_str = self.vars["planejado"].get().strip()
         maquina = self.vars["maquina"].get().strip()
         meta_str = self.vars["meta"].get().strip()
+        prazo_str = self.vars["prazo"].get().strip()
 
         if not all([op, produto, planejado_str, maquina, meta_str]):
             messagebox.showerror("Erro", "Todos os campos devem ser preenchidos.")
@@ -827,28 +1699,48 @@ class TelaCadastro(ttk.Frame):
             messagebox.showerror("Erro", "Quantidade Planejada e Meta por Hora devem ser números inteiros.")
             return
 
+        prazo = None
+        if prazo_str:
+            try:
+                prazo = datetime.strptime(prazo_str, "%d/%m/%Y").replace(hour=23, minute=59)
+            except ValueError:
+                messagebox.showerror("Erro", "Prazo deve estar no formato dd/mm/aaaa.")
+                return
+
+        cache = self.app_controller.cache
+        if cache.cabecalho_op(op):
+            messagebox.showwarning("Atenção", f"A OP '{op}' já está cadastrada.")
+            return
+
         conexao = conectar_db()
         if not conexao: return
         cursor = conexao.cursor()
 
-        cursor.execute("SELECT 1 FROM ordens_producao WHERE op = ?", (op,))
-        if cursor.fetchone():
+        sql_op = """
+        INSERT INTO ordens_producao (op, produto, planejado, maquina, meta_hora, produzido, status, inicio_producao, prazo) 
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """
+        try:
+            cursor.execute(sql_op, (op, produto, planejado, maquina, meta, 0, "PENDENTE", None, prazo))
+        except sqlite3.IntegrityError:
+            # Cadastrada por outro terminal depois da última leitura do cache.
             conexao.close()
+            cache.invalidar("ordens_producao")
             messagebox.showwarning("Atenção", f"A OP '{op}' já está cadastrada.")
             return
 
-        sql_op = """
-        INSERT INTO ordens_producao (op, produto, planejado, maquina, meta_hora, produzido, status, inicio_producao) 
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """
-        cursor.execute(sql_op, (op, produto, planejado, maquina, meta, 0, "PENDENTE", None))
-
         sql_maquina_status = "INSERT OR IGNORE INTO maquinas_status (maquina, status) VALUES (?, ?)"
         cursor.execute(sql_maquina_status, (maquina, "LIVRE"))
+        maquina_nova = cursor.rowcount > 0
 
         conexao.commit()
         conexao.close()
 
+        cache.apos_escrita("ordens_producao", CabecalhoOP(op, produto, planejado, maquina, meta, prazo))
+        if maquina_nova:
+            cache.invalidar("maquinas")
+        self.entry_maquina['values'] = cache.maquinas()
+
         messagebox.showinfo("Sucesso", f"Ordem de Produção '{op}' cadastrada com sucesso!")
         for var in self.vars.values():
             var.set("")
@@ -859,8 +1751,11 @@ class TelaCadastro(ttk.Frame):
         motivo_frame.pack(fill="x", pady=10)
 
         self.motivo_var = tk.StringVar()
+        self.motivo_planejado_var = tk.BooleanVar()
         ttk.Label(motivo_frame, text="Novo Motivo de Parada:").pack(pady=5)
         ttk.Entry(motivo_frame, textvariable=self.motivo_var, width=50).pack(pady=5)
+        ttk.Checkbutton(motivo_frame, text="Parada planejada (não conta como indisponibilidade)",
+                        variable=self.motivo_planejado_var).pack(pady=5)
         ttk.Button(motivo_frame, text="Adicionar Motivo", command=self.adicionar_motivo_parada).pack(pady=10)
         
         ttk.Label(master, text="Motivos Atuais:").pack(pady=(15, 5))
@@ -872,16 +1767,8 @@ class TelaCadastro(ttk.Frame):
     def atualizar_lista_motivos(self):
         self.lista_motivos.delete(0, tk.END)
         
-        conexao = conectar_db()
-        if not conexao: return
-        cursor = conexao.cursor()
-        
-        motivos_db = cursor.execute("SELECT motivo FROM motivos_parada ORDER BY motivo").fetchall()
-        
-        conexao.close()
-        
-        for row in motivos_db:
-            self.lista_motivos.insert(tk.END, row['motivo'])
+        for m in self.app_controller.cache.motivos():
+            self.lista_motivos.insert(tk.END, m.motivo + (" (planejada)" if m.planejada else ""))
 
     def adicionar_motivo_parada(self):
         motivo = self.motivo_var.get().strip()
@@ -893,18 +1780,217 @@ class TelaCadastro(ttk.Frame):
         if not conexao: return
         cursor = conexao.cursor()
 
-        cursor.execute("INSERT OR IGNORE INTO motivos_parada (motivo) VALUES (?)", (motivo,))
+        planejada = int(self.motivo_planejado_var.get())
+        cursor.execute("INSERT OR IGNORE INTO motivos_parada (motivo, planejada) VALUES (?, ?)",
+                       (motivo, planejada))
         
         if cursor.rowcount > 0:
             conexao.commit()
+            self.app_controller.cache.apos_escrita("motivos_parada", Motivo(motivo, planejada))
             messagebox.showinfo("Sucesso", f"Motivo '{motivo}' adicionado.")
             self.motivo_var.set("")
+            self.motivo_planejado_var.set(False)
             self.atualizar_lista_motivos()
         else:
             messagebox.showwarning("Atenção", "Este motivo já existe.")
         
         conexao.close()
 
+    def _criar_cadastro_calendario(self, master):
+        form_frame = ttk.LabelFrame(master, text="Novo Turno ou Janela Planejada", padding="10")
+        form_frame.pack(fill="x", pady=10)
+
+        self.cal_vars = {
+            "tipo": tk.StringVar(value="Turno"),
+            "nome": tk.StringVar(),
+            "inicio": tk.StringVar(),
+            "fim": tk.StringVar(),
+            "dias": tk.StringVar(value=TODOS_OS_DIAS)
+        }
+
+        ttk.Label(form_frame, text="Tipo:").grid(row=0, column=0, padx=5, pady=5, sticky="w")
+        ttk.Combobox(form_frame, textvariable=self.cal_vars["tipo"], state="readonly", width=27,
+                     values=["Turno", "Janela Planejada"]).grid(row=0, column=1, padx=5, pady=5)
+
+        fields = [
+            ("Nome / Descrição:", self.cal_vars["nome"]),
+            ("Início (HH:MM):", self.cal_vars["inicio"]),
+            ("Fim (HH:MM):", self.cal_vars["fim"]),
+            ("Dias (0=seg ... 6=dom):", self.cal_vars["dias"])
+        ]
+        for i, (label_text, var) in enumerate(fields, start=1):
+            ttk.Label(form_frame, text=label_text).grid(row=i, column=0, padx=5, pady=5, sticky="w")
+            ttk.Entry(form_frame, textvariable=var, width=30).grid(row=i, column=1, padx=5, pady=5)
+
+        ttk.Button(form_frame, text="Adicionar", command=self.adicionar_calendario).grid(row=len(fields) + 1, column=0, columnspan=2, pady=10)
+
+        self.lista_calendario = tk.Listbox(master, height=8, width=50)
+        self.lista_calendario.pack(pady=5, fill="x")
+        self.atualizar_lista_calendario()
+
+    def _criar_saude_banco(self, master):
+        topo = ttk.Frame(master)
+        topo.pack(fill="x")
+        self.lbl_saude = ttk.Label(topo, text="", font=("Arial", 10), justify="left")
+        self.lbl_saude.pack(side="left")
+        ttk.Button(topo, text="Atualizar", command=self.atualizar_saude_banco).pack(side="right")
+
+        def tree(titulo, colunas, altura):
+            frame = ttk.LabelFrame(master, text=titulo, padding="5")
+            frame.pack(fill="both", expand=True, pady=5)
+            t = ttk.Treeview(frame, columns=[c for c, _, _ in colunas], show="headings", height=altura)
+            for coluna, texto, largura in colunas:
+                t.heading(coluna, text=texto)
+                t.column(coluna, width=largura)
+            t.pack(fill="both", expand=True)
+            return t
+
+        self.tree_tarefas = tree("Manutenção Automática", [("tarefa", "Tarefa", 120), ("executado", "Último Ciclo", 110),
+                                                            ("duracao", "Duração (ms)", 80), ("resultado", "Resultado", 300)], 5)
+        self.tree_consultas = tree("Uso de Índices nas Consultas Principais", [("consulta", "Consulta", 170),
+                                                                               ("indice", "Usa Índice", 70), ("plano", "Plano", 370)], 5)
+        self.tree_indices = tree("Índices", [("indice", "Índice", 220), ("tabela", "Tabela", 150), ("tamanho", "Tamanho (KB)", 100)], 6)
+        self.atualizar_saude_banco()
+
+    def atualizar_saude_banco(self):
+        conexao = conectar_db()
+        if not conexao: return
+        dados = saude(conexao, None if BANCO.memoria else DB_NAME)
+        conexao.close()
+
+        wal = "--" if dados['wal_bytes'] is None else f"{dados['wal_bytes'] / 1024:.0f} KB"
+        self.lbl_saude.config(text=(
+            f"Tamanho: {dados['tamanho_bytes'] / 1024 / 1024:.1f} MB ({dados['paginas']} páginas)   "
+            f"Livre: {dados['paginas_livres']} páginas ({dados['livre_pct']:.1f}%)\n"
+            f"WAL: {wal}   Journal: {dados['journal_mode']}   Auto vacuum: {dados['auto_vacuum']}\n"
+            f"{self.app_controller.cronometro.resumo()}"))
+
+        for t in (self.tree_tarefas, self.tree_consultas, self.tree_indices):
+            for i in t.get_children():
+                t.delete(i)
+        for row in dados['tarefas']:
+            executado = f"{row['executado_em']:%d/%m %H:%M}" if row['executado_em'] else "nunca"
+            if row['parte']:
+                executado += " (em andamento)"
+            self.tree_tarefas.insert("", "end", values=(row['tarefa'], executado, row['duracao_ms'] or "", row['resultado'] or ""))
+        for row in dados['consultas']:
+            self.tree_consultas.insert("", "end", values=(row['consulta'], "Sim" if row['usa_indice'] else "NÃO", row['plano']))
+        for row in dados['indices']:
+            tamanho = "--" if row['bytes'] is None else f"{row['bytes'] / 1024:.0f}"
+            self.tree_indices.insert("", "end", values=(row['indice'], row['tabela'], tamanho))
+
+    def _criar_memoria(self, master):
+        topo = ttk.Frame(master)
+        topo.pack(fill="x")
+        self.lbl_memoria = ttk.Label(topo, text="", font=("Arial", 10), justify="left")
+        self.lbl_memoria.pack(side="left")
+        ttk.Button(topo, text="Atualizar", command=self.atualizar_memoria).pack(side="right")
+        ttk.Button(topo, text="Relatório de Heap", command=self.gerar_relatorio_heap).pack(side="right", padx=5)
+
+        colunas = [("terminal", "Terminal", 100), ("momento", "Leitura", 90), ("rss", "RSS (MB)", 70),
+                   ("heap", "Heap Python (MB)", 100), ("widgets", "Widgets", 60), ("after", "Jobs after()", 80),
+                   ("alerta", "Alerta", 250)]
+        self.tree_memoria = ttk.Treeview(master, columns=[c for c, _, _ in colunas], show="headings", height=12)
+        for coluna, texto, largura in colunas:
+            self.tree_memoria.heading(coluna, text=texto)
+            self.tree_memoria.column(coluna, width=largura)
+        self.tree_memoria.tag_configure("alerta", background="#FFCDD2")
+        self.tree_memoria.pack(fill="both", expand=True, pady=5)
+        self.atualizar_memoria()
+
+    def atualizar_memoria(self):
+        telemetria = self.app_controller.telemetria
+        if not telemetria:
+            self.lbl_memoria.config(text="Telemetria de memória desligada (TELEMETRIA_MEMORIA).")
+        elif telemetria.ultima is None:
+            self.lbl_memoria.config(text="Este terminal: primeira leitura ainda não feita.")
+        else:
+            self.lbl_memoria.config(text=f"Este terminal ({telemetria.ultima['momento']:%H:%M}): "
+                                         f"{telemetria.resumo(telemetria.ultima)}")
+
+        for i in self.tree_memoria.get_children():
+            self.tree_memoria.delete(i)
+        conexao = conectar_db()
+        if not conexao: return
+        linhas = historico_memoria(conexao)
+        conexao.close()
+        for row in linhas:
+            rss = "--" if row['rss_kb'] is None else f"{row['rss_kb'] / 1024:.1f}"
+            self.tree_memoria.insert("", "end", values=(row['terminal'], f"{row['momento']:%d/%m %H:%M}", rss,
+                                                         f"{row['heap_kb'] / 1024:.1f}", row['widgets'],
+                                                         row['jobs_after'], row['alerta'] or ""),
+                                     tags=("alerta",) if row['alerta'] else ())
+
+    def gerar_relatorio_heap(self):
+        telemetria = self.app_controller.telemetria
+        if not telemetria:
+            messagebox.showerror("Erro", "Telemetria de memória desligada (TELEMETRIA_MEMORIA).")
+            return
+        try:
+            caminho = telemetria.relatorio_heap()
+        except OSError as e:
+            messagebox.showerror("Erro", f"Falha ao gravar o relatório de heap: {e}")
+            return
+        self.atualizar_memoria()
+        messagebox.showinfo("Relatório de Heap", f"Relatório gravado em:\n{os.path.abspath(caminho)}")
+
+    def atualizar_lista_calendario(self):
+        self.lista_calendario.delete(0, tk.END)
+
+        conexao = conectar_db()
+        if not conexao: return
+        cursor = conexao.cursor()
+
+        turnos = cursor.execute("SELECT nome, hora_inicio, hora_fim, dias_semana FROM turnos ORDER BY hora_inicio").fetchall()
+        janelas = cursor.execute("SELECT descricao, hora_inicio, hora_fim, dias_semana FROM janelas_planejadas ORDER BY hora_inicio").fetchall()
+        conexao.close()
+
+        for row in turnos:
+            self.lista_calendario.insert(tk.END, f"Turno: {row['nome']} {row['hora_inicio']}-{row['hora_fim']} (dias {row['dias_semana']})")
+        for row in janelas:
+            self.lista_calendario.insert(tk.END, f"Planejada: {row['descricao']} {row['hora_inicio']}-{row['hora_fim']} (dias {row['dias_semana']})")
+
+    def adicionar_calendario(self):
+        tipo = self.cal_vars["tipo"].get()
+        nome = self.cal_vars["nome"].get().strip()
+        inicio = self.cal_vars["inicio"].get().strip()
+        fim = self.cal_vars["fim"].get().strip()
+        dias = self.cal_vars["dias"].get().strip() or TODOS_OS_DIAS
+
+        if not all([nome, inicio, fim]):
+            messagebox.showerror("Erro", "Nome, início e fim devem ser preenchidos.")
+            return
+
+        try:
+            datetime.strptime(inicio, "%H:%M")
+            datetime.strptime(fim, "%H:%M")
+        except ValueError:
+            messagebox.showerror("Erro", "Início e fim devem estar no formato HH:MM.")
+            return
+
+        if any(d not in TODOS_OS_DIAS for d in dias):
+            messagebox.showerror("Erro", "Dias devem ser dígitos de 0 (segunda) a 6 (domingo).")
+            return
+
+        conexao = conectar_db()
+        if not conexao: return
+        cursor = conexao.cursor()
+
+        if tipo == "Turno":
+            cursor.execute("INSERT OR REPLACE INTO turnos (nome, hora_inicio, hora_fim, dias_semana) VALUES (?, ?, ?, ?)",
+                           (nome, inicio, fim, dias))
+        else:
+            cursor.execute("INSERT INTO janelas_planejadas (descricao, hora_inicio, hora_fim, dias_semana) VALUES (?, ?, ?, ?)",
+                           (nome, inicio, fim, dias))
+
+        conexao.commit()
+        conexao.close()
+
+        messagebox.showinfo("Sucesso", f"{tipo} '{nome}' cadastrado.")
+        for chave in ("nome", "inicio", "fim"):
+            self.cal_vars[chave].set("")
+        self.atualizar_lista_calendario()
+
 
 if __name__ == "__main__":
     app = AplicacaoProducao()
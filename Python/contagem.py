@@ -0,0 +1,411 @@
+"""Histórico compacto do contador de peças: blocos por máquina e hora.
+
+Uma linha por peça (10 peças/s por linha) vira centenas de milhões de linhas
+por ano. Aqui cada máquina tem um bloco por hora em ``contagem_blocos``:
+os instantes são deltas em milissegundos num ``array`` gravado como BLOB,
+com o menor tipo que comporta o bloco (``H`` = 2 bytes enquanto nenhum
+intervalo passa de 65 s), e as peças por evento só são gravadas quando
+algum evento não é de exatamente uma peça. O bloco também guarda
+``eventos``, ``pecas`` e o primeiro/último instante, então somas que cobrem
+horas inteiras nem decodificam o BLOB.
+
+``RegistroContagem`` mantém a hora corrente de cada máquina em memória e
+grava os blocos a cada ``CHECKPOINT_SEG``; o bloco da hora que virou sai
+selado no mesmo checkpoint. ``ler_contagem`` decodifica um bloco por vez,
+só dos blocos do intervalo pedido.
+
+A fonte é o diário ``apontamentos``: ``alimentar`` lê as peças gravadas
+depois de ``contagem_marca`` (produção gravada direto, lotes sincronizados
+do diário local com o instante do evento, estornos) e as entrega ao
+registro. O job do KPI chama ``alimentar`` enquanto tem o lease, então um
+só processo escreve os blocos. A marca é gravada na mesma transação dos
+blocos: depois de uma queda, o que estava só em memória é relido do diário.
+
+Uso: python contagem.py --importar-apontamentos | --comparar [horas]
+"""
+import os
+import sqlite3
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+CHECKPOINT_SEG = 60
+LOTE_ALIMENTACAO = 5000
+TIPOS_DELTA = ("H", "I")
+TIPOS_PECAS = ("b", "h", "i")
+MILISSEGUNDO = timedelta(milliseconds=1)
+
+
+def criar_tabela_contagem(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS contagem_blocos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        maquina TEXT NOT NULL,
+        hora TIMESTAMP NOT NULL,
+        eventos INTEGER NOT NULL,
+        pecas INTEGER NOT NULL,
+        primeiro_ms INTEGER,
+        ultimo_ms INTEGER,
+        selado INTEGER NOT NULL DEFAULT 0,
+        tipo_delta TEXT NOT NULL,
+        deltas BLOB NOT NULL,
+        tipo_pecas TEXT,
+        pecas_evento BLOB,
+        UNIQUE (maquina, hora)
+    )""")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS contagem_marca (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        apontamento INTEGER NOT NULL
+    )""")
+    cursor.execute("INSERT OR IGNORE INTO contagem_marca (id, apontamento) VALUES (1, 0)")
+
+
+def _inicio_hora(quando):
+    return quando.replace(minute=0, second=0, microsecond=0)
+
+
+def _empacotar(valores, tipos):
+    for tipo in tipos:
+        try:
+            dados = array(tipo, valores)
+        except OverflowError:
+            continue
+        if sys.byteorder == "big":
+            dados.byteswap()
+        return tipo, dados.tobytes()
+    raise OverflowError(f"valor fora do alcance de {tipos[-1]!r}")
+
+
+def _desempacotar(tipo, blob):
+    dados = array(tipo)
+    dados.frombytes(blob)
+    if sys.byteorder == "big":
+        dados.byteswap()
+    return dados
+
+
+class _Bloco:
+    __slots__ = ("hora", "deltas", "pecas", "ultimo_ms", "total")
+
+    def __init__(self, hora, offsets=(), pecas=()):
+        self.hora = hora
+        self.deltas = array("I")
+        self.pecas = array("i")
+        self.ultimo_ms = 0
+        self.total = 0
+        for ms, n in zip(offsets, pecas):
+            self.anexar(ms, n)
+
+    def anexar(self, ms, pecas):
+        ms = max(ms, self.ultimo_ms)
+        self.deltas.append(ms - self.ultimo_ms)
+        self.pecas.append(pecas)
+        self.ultimo_ms = ms
+        self.total += pecas
+
+    def inserir(self, ms, pecas):
+        """Como ``anexar``, mas aceita evento fora de ordem (raro: reenvio atrasado)."""
+        if ms >= self.ultimo_ms:
+            return self.anexar(ms, pecas)
+        offsets, lista = list(accumulate(self.deltas)), list(self.pecas)
+        i = bisect_right(offsets, max(ms, 0))
+        offsets.insert(i, max(ms, 0))
+        lista.insert(i, pecas)
+        self.__init__(self.hora, offsets, lista)
+
+    def codificar(self):
+        tipo_delta, deltas = _empacotar(self.deltas, TIPOS_DELTA)
+        tipo_pecas = pecas_evento = None
+        if any(n != 1 for n in self.pecas):
+            tipo_pecas, pecas_evento = _empacotar(self.pecas, TIPOS_PECAS)
+        return tipo_delta, deltas, tipo_pecas, pecas_evento
+
+
+def _decodificar(row):
+    """(offsets em ms desde a hora, peças por evento) de uma linha de ``contagem_blocos``."""
+    offsets = array("I", accumulate(_desempacotar(row["tipo_delta"], row["deltas"])))
+    if row["tipo_pecas"]:
+        pecas = _desempacotar(row["tipo_pecas"], row["pecas_evento"])
+    else:
+        pecas = array("b", [1]) * len(offsets)
+    return offsets, pecas
+
+
+def _gravar_bloco(cursor, maquina, bloco, selado):
+    tipo_delta, deltas, tipo_pecas, pecas_evento = bloco.codificar()
+    primeiro = bloco.deltas[0] if bloco.deltas else None
+    cursor.execute("""
+        INSERT INTO contagem_blocos (maquina, hora, eventos, pecas, primeiro_ms, ultimo_ms, selado,
+                                     tipo_delta, deltas, tipo_pecas, pecas_evento)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (maquina, hora) DO UPDATE SET
+            eventos = excluded.eventos, pecas = excluded.pecas, primeiro_ms = excluded.primeiro_ms,
+            ultimo_ms = excluded.ultimo_ms, selado = excluded.selado, tipo_delta = excluded.tipo_delta,
+            deltas = excluded.deltas, tipo_pecas = excluded.tipo_pecas, pecas_evento = excluded.pecas_evento
+    """, (maquina, bloco.hora, len(bloco.deltas), bloco.total, primeiro, bloco.ultimo_ms, int(selado),
+          tipo_delta, deltas, tipo_pecas, pecas_evento))
+
+
+def _carregar_bloco(cursor, maquina, hora):
+    row = cursor.execute("SELECT * FROM contagem_blocos WHERE maquina = ? AND hora = ?", (maquina, hora)).fetchone()
+    if row is None:
+        return _Bloco(hora)
+    return _Bloco(hora, *_decodificar(row))
+
+
+class RegistroContagem:
+    """Recebe os eventos do contador e mantém os blocos das horas correntes.
+
+    ``marca`` é o último apontamento entregue; vai para ``contagem_marca``
+    junto com os blocos, por isso nada é gravado fora do checkpoint.
+    """
+
+    def __init__(self, conectar, checkpoint_seg=CHECKPOINT_SEG):
+        self.conectar = conectar
+        self.checkpoint_seg = checkpoint_seg
+        self.blocos = {}
+        self.alterados = set()
+        self.selados = {}
+        self.marca = None
+        self.ultimo_checkpoint = time.monotonic()
+        self._trava = threading.Lock()
+
+    def registrar(self, maquina, quando, pecas=1, marca=None):
+        """Soma ``pecas`` da ``maquina`` no instante ``quando``."""
+        hora = _inicio_hora(quando)
+        ms = (quando - hora) // MILISSEGUNDO
+        with self._trava:
+            bloco = self.blocos.get(maquina)
+            if bloco is not None and hora < bloco.hora:
+                # Evento atrasado de uma hora já encerrada: regrava aquele bloco no próximo checkpoint.
+                antigo = self.selados.get((maquina, hora)) or self._carregar(maquina, hora)
+                antigo.inserir(ms, pecas)
+                self.selados[maquina, hora] = antigo
+            else:
+                if bloco is not None and hora > bloco.hora:
+                    self.selados[maquina, bloco.hora] = bloco
+                    bloco = None
+                if bloco is None:
+                    # Primeiro evento da hora neste processo: continua o parcial gravado, se houver.
+                    bloco = self.blocos[maquina] = self.selados.pop((maquina, hora), None) \
+                        or self._carregar(maquina, hora)
+                bloco.inserir(ms, pecas)
+                self.alterados.add(maquina)
+
+            if marca is not None:
+                self.marca = marca
+            if time.monotonic() - self.ultimo_checkpoint >= self.checkpoint_seg:
+                self._checkpoint()
+
+    def selar(self):
+        """Grava todos os blocos em memória (encerramento); só as horas já encerradas ficam seladas."""
+        with self._trava:
+            hora_atual = _inicio_hora(datetime.now())
+            self._gravar([(m, b, True) for (m, _), b in self.selados.items()]
+                         + [(m, b, b.hora < hora_atual) for m, b in self.blocos.items()])
+            self.blocos.clear()
+            self.alterados.clear()
+            self.selados.clear()
+
+    def checkpoint(self):
+        with self._trava:
+            self._checkpoint()
+
+    def descartar(self):
+        """Esquece o que está em memória sem gravar (outro processo assumiu; ele relê do diário)."""
+        with self._trava:
+            self.blocos.clear()
+            self.alterados.clear()
+            self.selados.clear()
+            self.marca = None
+
+    def _checkpoint(self):
+        self._gravar([(m, b, True) for (m, _), b in self.selados.items()]
+                     + [(m, self.blocos[m], False) for m in self.alterados])
+        self.alterados.clear()
+        self.selados.clear()
+        self.ultimo_checkpoint = time.monotonic()
+
+    def _carregar(self, maquina, hora):
+        conexao = self.conectar()
+        if not conexao:
+            return _Bloco(hora)
+        try:
+            return _carregar_bloco(conexao.cursor(), maquina, hora)
+        finally:
+            conexao.close()
+
+    def _gravar(self, blocos):
+        if not blocos and self.marca is None:
+            return
+        conexao = self.conectar()
+        if not conexao: return
+        try:
+            cursor = conexao.cursor()
+            for maquina, bloco, selado in blocos:
+                _gravar_bloco(cursor, maquina, bloco, selado)
+            if self.marca is not None:
+                cursor.execute("UPDATE contagem_marca SET apontamento = ? WHERE id = 1", (self.marca,))
+            conexao.commit()
+        except sqlite3.Error as e:
+            print(f"Erro ao gravar o histórico do contador: {e}")
+        finally:
+            conexao.close()
+
+
+def alimentar(conexao, registro, lote=LOTE_ALIMENTACAO):
+    """Entrega ao ``registro`` as peças do diário depois da marca; devolve quantas leu."""
+    if registro.marca is None:
+        registro.marca = conexao.execute("SELECT apontamento FROM contagem_marca WHERE id = 1").fetchone()[0]
+    linhas = conexao.execute("""
+        SELECT a.id, o.maquina, a.momento AS "momento [timestamp]", a.pecas
+        FROM apontamentos a JOIN ordens_producao o ON o.op = a.op
+        WHERE a.id > ? AND a.pecas IS NOT NULL AND a.pecas != 0 AND a.acao != 'abertura'
+        ORDER BY a.id LIMIT ?
+    """, (registro.marca, lote)).fetchall()
+    for row in linhas:
+        registro.registrar(row["maquina"], row["momento"], row["pecas"], marca=row["id"])
+    if len(linhas) == lote:
+        # Recuperando atraso: não acumula horas seladas em memória entre um lote e outro.
+        registro.checkpoint()
+    return len(linhas)
+
+
+def ler_contagem(conexao, maquina, inicio, fim):
+    """Gera (momento, peças) da ``maquina`` em [inicio, fim), decodificando um bloco por vez."""
+    cursor = conexao.execute("""
+        SELECT hora AS "hora [timestamp]", tipo_delta, deltas, tipo_pecas, pecas_evento
+        FROM contagem_blocos WHERE maquina = ? AND hora >= ? AND hora < ? ORDER BY hora
+    """, (maquina, _inicio_hora(inicio), fim))
+    for row in cursor:
+        hora = row["hora"]
+        offsets, pecas = _decodificar(row)
+        de = bisect_left(offsets, (inicio - hora) / MILISSEGUNDO)
+        ate = bisect_left(offsets, (fim - hora) / MILISSEGUNDO)
+        for i in range(de, ate):
+            yield hora + timedelta(milliseconds=offsets[i]), pecas[i]
+
+
+def somar_pecas(conexao, maquina, inicio, fim):
+    """Peças da ``maquina`` em [inicio, fim): horas inteiras pelo total do bloco, só as pontas decodificadas."""
+    total = 0
+    for row in conexao.execute("""
+        SELECT hora AS "hora [timestamp]", pecas, primeiro_ms, ultimo_ms, tipo_delta, deltas, tipo_pecas, pecas_evento
+        FROM contagem_blocos WHERE maquina = ? AND hora >= ? AND hora < ? ORDER BY hora
+    """, (maquina, _inicio_hora(inicio), fim)):
+        de_ms = (inicio - row["hora"]) / MILISSEGUNDO
+        ate_ms = (fim - row["hora"]) / MILISSEGUNDO
+        if row["primeiro_ms"] is None:
+            continue
+        if de_ms <= row["primeiro_ms"] and row["ultimo_ms"] < ate_ms:
+            total += row["pecas"]
+            continue
+        offsets, pecas = _decodificar(row)
+        total += sum(pecas[bisect_left(offsets, de_ms):bisect_left(offsets, ate_ms)])
+    return total
+
+
+def importar_apontamentos(conexao):
+    """Reconstrói os blocos a partir das peças do diário de apontamentos (produção e estornos).
+
+    Move a marca para o fim do diário; rode com os terminais fechados, senão o
+    dono do lease do KPI regrava por cima os blocos que tem em memória.
+    """
+    cursor = conexao.cursor()
+    cursor.execute("DELETE FROM contagem_blocos")
+    blocos = {}
+    for row in cursor.execute("""
+        SELECT o.maquina, a.momento AS "momento [timestamp]", a.pecas
+        FROM apontamentos a JOIN ordens_producao o ON o.op = a.op
+        WHERE a.pecas IS NOT NULL AND a.pecas != 0 AND a.acao != 'abertura'
+        ORDER BY a.momento, a.id
+    """).fetchall():
+        hora = _inicio_hora(row["momento"])
+        bloco = blocos.get((row["maquina"], hora))
+        if bloco is None:
+            bloco = blocos[row["maquina"], hora] = _Bloco(hora)
+        bloco.anexar((row["momento"] - hora) // MILISSEGUNDO, row["pecas"])
+    for (maquina, _), bloco in blocos.items():
+        _gravar_bloco(cursor, maquina, bloco, selado=True)
+    cursor.execute("UPDATE contagem_marca SET apontamento = (SELECT COALESCE(MAX(id), 0) FROM apontamentos) "
+                   "WHERE id = 1")
+    conexao.commit()
+    return len(blocos)
+
+
+def comparar(horas=24, pecas_por_segundo=10):
+    """Mede tamanho e varredura de uma linha por peça contra os blocos, em bancos temporários."""
+    import random
+    import tempfile
+
+    pasta = tempfile.mkdtemp()
+    inicio = datetime(2025, 1, 6, 6)
+    rng = random.Random(1)
+    eventos, quando = [], inicio
+    while quando < inicio + timedelta(hours=horas):
+        quando += timedelta(milliseconds=max(1, int(rng.expovariate(pecas_por_segundo) * 1000)))
+        eventos.append(quando)
+
+    linhas = sqlite3.connect(os.path.join(pasta, "linhas.db"), detect_types=sqlite3.PARSE_DECLTYPES)
+    linhas.execute("CREATE TABLE contagem (maquina TEXT, momento TIMESTAMP, pecas INTEGER)")
+    linhas.execute("CREATE INDEX idx_contagem ON contagem (maquina, momento)")
+    linhas.executemany("INSERT INTO contagem VALUES ('Linha 1', ?, 1)", ((q,) for q in eventos))
+    linhas.commit()
+
+    caminho_blocos = os.path.join(pasta, "blocos.db")
+
+    def conectar():
+        conexao = sqlite3.connect(caminho_blocos, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
+        conexao.row_factory = sqlite3.Row
+        return conexao
+
+    conexao = conectar()
+    criar_tabela_contagem(conexao.cursor())
+    conexao.commit()
+    registro = RegistroContagem(conectar, checkpoint_seg=float("inf"))
+    for q in eventos:
+        registro.registrar("Linha 1", q)
+    registro.selar()
+    conexao.execute("VACUUM")
+    linhas.execute("VACUUM")
+
+    de, ate = inicio + timedelta(hours=2, minutes=17), inicio + timedelta(hours=min(horas, 10), minutes=3)
+    t = time.perf_counter()
+    soma_linhas = linhas.execute("SELECT SUM(pecas) FROM contagem WHERE maquina = 'Linha 1' AND momento >= ? AND momento < ?",
+                                 (de, ate)).fetchone()[0]
+    seg_linhas = time.perf_counter() - t
+    t = time.perf_counter()
+    soma_blocos = somar_pecas(conexao, "Linha 1", de, ate)
+    seg_blocos = time.perf_counter() - t
+    t = time.perf_counter()
+    lidos = sum(1 for _ in ler_contagem(conexao, "Linha 1", de, ate))
+    seg_leitura = time.perf_counter() - t
+
+    tamanho_linhas = os.path.getsize(os.path.join(pasta, "linhas.db"))
+    tamanho_blocos = os.path.getsize(caminho_blocos)
+    linhas.close()
+    conexao.close()
+    print(f"{len(eventos)} peças em {horas} h")
+    print(f"Uma linha por peça: {tamanho_linhas / 1024 / 1024:.1f} MB, soma de {de:%H:%M} a {ate:%H:%M} "
+          f"= {soma_linhas} em {seg_linhas * 1000:.1f} ms")
+    print(f"Blocos por hora:    {tamanho_blocos / 1024 / 1024:.1f} MB, soma = {soma_blocos} em {seg_blocos * 1000:.1f} ms, "
+          f"leitura de {lidos} eventos em {seg_leitura * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--comparar":
+        comparar(int(sys.argv[2]) if len(sys.argv) > 2 else 24)
+    elif len(sys.argv) > 1 and sys.argv[1] == "--importar-apontamentos":
+        from codigofinal import conectar_db
+
+        conexao = conectar_db()
+        criar_tabela_contagem(conexao.cursor())
+        print(f"{importar_apontamentos(conexao)} blocos gravados.")
+        conexao.close()
+    else:
+        print(__doc__)
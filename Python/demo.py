@@ -1,27 +1,31 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
+import os
 import sqlite3
 from datetime import datetime, timedelta
 
+from banco import BancoProducao
+
 # --- Configurações Globais ---
-DB_NAME = "producao.db"
+# A demo roda em memória por padrão (não deixa producao.db para trás);
+# PRODUCAO_DB=demo.db grava em disco, PRODUCAO_SNAPSHOT=arquivo.db semeia a partir de um snapshot.
+DB_NAME = os.environ.get("PRODUCAO_DB") or "memoria:demo"
+SNAPSHOT_INICIAL = os.environ.get("PRODUCAO_SNAPSHOT")
+BANCO = BancoProducao(DB_NAME)
 
 # --- 💾 Camada de Banco de Dados ---
 
 def conectar_db():
     try:
-        conexao = sqlite3.connect(
-            DB_NAME, 
-            detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES
-        )
-        conexao.row_factory = sqlite3.Row 
-        return conexao
+        return BANCO.conectar()
     except sqlite3.Error as e:
         print(f"Erro Crítico DB: {e}")
         return None
 
 def inicializar_db():
     """Inicializa tabelas e insere dados de demonstração."""
+    if SNAPSHOT_INICIAL and BANCO.memoria:
+        BANCO.carregar(SNAPSHOT_INICIAL)
     conexao = conectar_db()
     if not conexao: return
     cursor = conexao.cursor()
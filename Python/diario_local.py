@@ -0,0 +1,438 @@
+"""Diário local do terminal de apontamento (modo offline).
+
+Os botões do operador gravam primeiro num SQLite local (WAL,
+``synchronous=NORMAL``): a transição é validada contra a cópia local do
+estado da OP e o evento vai para a tabela ``eventos`` na mesma transação,
+sem tocar no banco central. Um thread reconcilia o diário com o banco
+central em lotes, na ordem em que os eventos aconteceram, e depois
+recarrega a cópia local.
+
+Regras de reconciliação:
+
+- cada evento tem um uuid; o banco central guarda os já aplicados em
+  ``eventos_aplicados``, então reenviar um lote (queda no meio da
+  sincronização) não duplica nada;
+- peças apontadas sempre somam na OP, mesmo que outro terminal já a tenha
+  finalizado: a produção aconteceu;
+- transições de estado valem se o estado central ainda permitir (primeiro
+  a chegar ao banco central vence); senão o evento fica como ``CONFLITO``,
+  com o motivo em ``detalhe``, no diário e em ``eventos_aplicados``;
+- todo evento aplicado entra no diário de ``apontamentos`` do banco central
+  com o terminal, o uuid e o horário em que aconteceu no terminal.
+
+A cópia local é atualizada por diferença: só as OPs com apontamento novo no
+banco central (marca d'água no id do diário de ``apontamentos``) ou com
+evento novo neste terminal são relidas. Tudo é lido antes de pegar o lock
+do diário local, que fica preso só para trocar essas linhas e reaplicar os
+eventos pendentes. Mudança de cadastro de OP ou de máquina (``versoes_cadastro``)
+e, por segurança, a cada ``RECARGA_COMPLETA_SEG``, recarregam tudo.
+
+Eventos já aplicados de OPs que saíram da cópia local (finalizadas ou
+canceladas) são apagados depois de ``RETENCAO_EVENTOS_DIAS``; os de OPs em
+aberto ficam, porque o desfazer depende deles.
+"""
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import transicoes
+from transicoes import PRE_CONDICOES, TransicaoInvalida, recusa
+
+LOTE_SINCRONIZACAO = 200
+ESPERA_MAXIMA_SEG = 30.0
+RECARGA_COMPLETA_SEG = 300.0
+RETENCAO_EVENTOS_DIAS = 7
+LOTE_LIMPEZA = 500
+
+SQL_OPS_CENTRAL = """
+    SELECT o.op, o.produto, o.planejado, o.maquina, o.meta_hora, o.produzido, o.status,
+           o.inicio_producao, o.prazo,
+           (SELECT MAX(p.inicio) FROM paradas_log p WHERE p.op = o.op AND p.fim IS NULL) AS "parada_inicio [timestamp]"
+    FROM ordens_producao o
+"""
+
+
+def conectar_diario(caminho):
+    conexao = sqlite3.connect(caminho, uri=caminho.startswith("file:"),
+                              detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
+    conexao.row_factory = sqlite3.Row
+    conexao.execute("PRAGMA journal_mode=WAL")
+    conexao.execute("PRAGMA synchronous=NORMAL")
+    return conexao
+
+
+def criar_tabelas_diario(conexao):
+    conexao.executescript("""
+    CREATE TABLE IF NOT EXISTS eventos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        uuid TEXT NOT NULL UNIQUE,
+        tipo TEXT NOT NULL,
+        op TEXT NOT NULL,
+        pecas INTEGER,
+        motivo TEXT,
+        operador TEXT,
+        quando TIMESTAMP NOT NULL,
+        situacao TEXT NOT NULL DEFAULT 'PENDENTE',
+        detalhe TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_eventos_pendentes ON eventos (id) WHERE situacao = 'PENDENTE';
+    CREATE INDEX IF NOT EXISTS idx_eventos_op ON eventos (op, id);
+
+    CREATE TABLE IF NOT EXISTS ops_local (
+        op TEXT PRIMARY KEY,
+        produto TEXT,
+        planejado INTEGER,
+        maquina TEXT,
+        meta_hora INTEGER,
+        produzido INTEGER,
+        status TEXT,
+        inicio_producao TIMESTAMP,
+        prazo TIMESTAMP,
+        parada_inicio TIMESTAMP
+    );
+
+    CREATE TABLE IF NOT EXISTS maquinas_local (
+        maquina TEXT PRIMARY KEY,
+        status TEXT NOT NULL
+    );
+    """)
+
+
+def criar_tabela_sincronizacao(cursor):
+    """Tabela do banco central com os eventos de diário já aplicados (idempotência)."""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS eventos_aplicados (
+        uuid TEXT PRIMARY KEY,
+        terminal TEXT NOT NULL,
+        tipo TEXT NOT NULL,
+        op TEXT NOT NULL,
+        quando TIMESTAMP NOT NULL,
+        aplicado_em TIMESTAMP NOT NULL,
+        situacao TEXT NOT NULL,
+        detalhe TEXT
+    )""")
+
+
+def _pecas_a_estornar(cursor, op, antes_de=None):
+    """Peças do último apontamento ainda não desfeito na OP.
+
+    Anda no diário do fim para o começo: cada estorno pula um apontamento, e
+    o primeiro apontamento não pulado é o que será desfeito.
+    """
+    sql = """SELECT tipo, pecas FROM eventos WHERE op = ? AND situacao != 'CONFLITO'
+             AND tipo IN ('apontar_producao', 'estornar_producao')"""
+    parametros = [op]
+    if antes_de is not None:
+        sql += " AND id < ?"
+        parametros.append(antes_de)
+    pular = 0
+    for r in cursor.execute(sql + " ORDER BY id DESC", parametros):
+        if r["tipo"] == "estornar_producao":
+            pular += 1
+        elif pular:
+            pular -= 1
+        else:
+            return r["pecas"]
+    raise TransicaoInvalida(f"Não há apontamento de produção deste terminal para desfazer na OP {op}.")
+
+
+def _aplicar_local(cursor, tipo, op, pecas, quando, evento_id=None):
+    """Aplica a transição na cópia local; mesmas regras e retornos de ``transicoes``."""
+    row = cursor.execute("""
+        SELECT o.*, COALESCE(m.status, 'LIVRE') AS status_maquina
+        FROM ops_local o LEFT JOIN maquinas_local m ON m.maquina = o.maquina WHERE o.op = ?
+    """, (op,)).fetchone()
+    if row is None:
+        raise TransicaoInvalida(f"A OP '{op}' não está disponível neste terminal.")
+    status_op, status_maquina = PRE_CONDICOES[tipo]
+    if row["status"] not in status_op or status_maquina not in (None, row["status_maquina"]):
+        raise recusa(op, tipo, row["status"], row["maquina"], row["status_maquina"])
+    maquina = row["maquina"]
+
+    def mudar_maquina(status):
+        cursor.execute("INSERT OR REPLACE INTO maquinas_local (maquina, status) VALUES (?, ?)", (maquina, status))
+
+    if tipo == "iniciar":
+        cursor.execute("UPDATE ops_local SET status = 'PRODUZINDO', inicio_producao = ? WHERE op = ?", (quando, op))
+        mudar_maquina("PRODUZINDO")
+        return maquina
+    if tipo == "apontar_producao":
+        cursor.execute("UPDATE ops_local SET produzido = produzido + ? WHERE op = ?", (pecas, op))
+        return row["produzido"] + pecas, row["planejado"]
+    if tipo == "estornar_producao":
+        estornadas = _pecas_a_estornar(cursor, op, evento_id)
+        cursor.execute("UPDATE ops_local SET produzido = produzido - ? WHERE op = ?", (estornadas, op))
+        return row["produzido"] - estornadas, row["planejado"]
+    if tipo == "parar":
+        cursor.execute("UPDATE ops_local SET parada_inicio = ? WHERE op = ?", (quando, op))
+        mudar_maquina("PARADA")
+        return maquina
+    if tipo == "retomar":
+        cursor.execute("UPDATE ops_local SET parada_inicio = NULL WHERE op = ?", (op,))
+        mudar_maquina("PRODUZINDO")
+        inicio = row["parada_inicio"]
+        return maquina, (round((quando - inicio).total_seconds()) if inicio else None)
+    cursor.execute("UPDATE ops_local SET status = 'FINALIZADA' WHERE op = ?", (op,))
+    mudar_maquina("LIVRE")
+    return maquina, row["produzido"]
+
+
+class DiarioLocal:
+    """Interface do terminal: mesmas transições de ``transicoes``, gravadas só no diário."""
+
+    def __init__(self, caminho, terminal):
+        self.caminho = caminho
+        self.terminal = terminal
+        self.conexao = conectar_diario(caminho)
+        criar_tabelas_diario(self.conexao)
+        self.ao_registrar = None
+
+    def _registrar(self, tipo, op, pecas=None, motivo=None, operador=None):
+        quando = datetime.now()
+        with transicoes.transacao(self.conexao, "diario_" + tipo) as cursor:
+            resultado = _aplicar_local(cursor, tipo, op, pecas, quando)
+            if tipo == "estornar_producao":
+                pecas = _pecas_a_estornar(cursor, op)
+            cursor.execute("""
+                INSERT INTO eventos (uuid, tipo, op, pecas, motivo, operador, quando)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (uuid.uuid4().hex, tipo, op, pecas, motivo, operador, quando))
+        if self.ao_registrar:
+            self.ao_registrar()
+        return resultado
+
+    def iniciar(self, op, operador=None):
+        return self._registrar("iniciar", op, operador=operador)
+
+    def apontar_producao(self, op, pecas=1, operador=None):
+        return self._registrar("apontar_producao", op, pecas=pecas, operador=operador)
+
+    def parar(self, op, motivo, operador):
+        return self._registrar("parar", op, motivo=motivo, operador=operador)
+
+    def retomar(self, op, operador=None):
+        return self._registrar("retomar", op, operador=operador)
+
+    def finalizar(self, op, operador=None):
+        return self._registrar("finalizar", op, operador=operador)
+
+    def estornar_producao(self, op, operador=None):
+        return self._registrar("estornar_producao", op, operador=operador)
+
+    def op(self, op):
+        row = self.conexao.execute("SELECT * FROM ops_local WHERE op = ?", (op,)).fetchone()
+        return dict(row) if row else None
+
+    def op_ativa(self):
+        row = self.conexao.execute("SELECT op FROM ops_local WHERE status = 'PRODUZINDO' LIMIT 1").fetchone()
+        return row["op"] if row else None
+
+    def status_maquina(self, maquina):
+        row = self.conexao.execute("SELECT status FROM maquinas_local WHERE maquina = ?", (maquina,)).fetchone()
+        return row["status"] if row else "LIVRE"
+
+    def ops_pendentes(self, termo="", limite=None):
+        """OPs pendentes na ordem da fila do sequenciador (prazo, depois menor duração)."""
+        sql = "SELECT op FROM ops_local WHERE status = 'PENDENTE'"
+        parametros = []
+        if termo:
+            sql += " AND (op LIKE ? OR produto LIKE ?)"
+            parametros += [f"%{termo}%"] * 2
+        sql += " ORDER BY prazo IS NULL, prazo, (planejado - produzido) * 1.0 / NULLIF(meta_hora, 0), op"
+        if limite:
+            sql += " LIMIT ?"
+            parametros.append(limite)
+        return [r["op"] for r in self.conexao.execute(sql, parametros)]
+
+    def pendentes(self):
+        return self.conexao.execute("SELECT COUNT(*) FROM eventos WHERE situacao = 'PENDENTE'").fetchone()[0]
+
+    def fechar(self):
+        self.conexao.close()
+
+
+def _aplicar_central(cursor, evento, terminal):
+    if evento["tipo"] == "apontar_producao":
+        if cursor.execute("UPDATE ordens_producao SET produzido = produzido + ? WHERE op = ?",
+                          (evento["pecas"], evento["op"])).rowcount == 0:
+            raise TransicaoInvalida(f"A OP '{evento['op']}' não existe.")
+        transicoes.anotar(cursor, "apontar_producao", evento["op"], evento["quando"], pecas=evento["pecas"],
+                          operador=evento["operador"], terminal=terminal, uuid=evento["uuid"])
+        return
+    transicoes.aplicar(cursor, evento["tipo"], evento["op"], motivo=evento["motivo"], operador=evento["operador"],
+                       agora=evento["quando"], terminal=terminal, uuid=evento["uuid"])
+
+
+def aplicar_lote(central, terminal, eventos):
+    """Aplica os eventos no banco central numa só transação; devolve [(uuid, situacao, detalhe)]."""
+    resultados = []
+    agora = datetime.now()
+    with transicoes.transacao(central, "sincronizar_diario") as cursor:
+        for evento in eventos:
+            ja_aplicado = cursor.execute(
+                "SELECT situacao, detalhe FROM eventos_aplicados WHERE uuid = ?", (evento["uuid"],)
+            ).fetchone()
+            if ja_aplicado:
+                resultados.append((evento["uuid"], ja_aplicado["situacao"], ja_aplicado["detalhe"]))
+                continue
+
+            cursor.execute("SAVEPOINT evento")
+            try:
+                _aplicar_central(cursor, evento, terminal)
+                situacao, detalhe = "APLICADO", None
+            except TransicaoInvalida as e:
+                cursor.execute("ROLLBACK TO evento")
+                situacao, detalhe = "CONFLITO", str(e)
+            cursor.execute("RELEASE evento")
+
+            cursor.execute("""
+                INSERT INTO eventos_aplicados (uuid, terminal, tipo, op, quando, aplicado_em, situacao, detalhe)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (evento["uuid"], terminal, evento["tipo"], evento["op"], evento["quando"], agora, situacao, detalhe))
+            resultados.append((evento["uuid"], situacao, detalhe))
+    return resultados
+
+
+def _marca_central(central):
+    """(último apontamento, versão do cadastro de OPs, versão do cadastro de máquinas) do banco central."""
+    row = central.execute("""
+        SELECT (SELECT COALESCE(MAX(id), 0) FROM apontamentos),
+               (SELECT versao FROM versoes_cadastro WHERE tabela = 'ordens_producao'),
+               (SELECT versao FROM versoes_cadastro WHERE tabela = 'maquinas')
+    """).fetchone()
+    return tuple(row)
+
+
+def atualizar_copia_local(local, central, marca=None):
+    """Atualiza a cópia local com o que mudou desde ``marca`` e reaplica os eventos ainda não sincronizados.
+
+    ``marca`` None recarrega tudo. Devolve a marca a passar na próxima chamada,
+    ou a mesma ``marca`` se um evento novo chegou durante a leitura (tenta de novo depois).
+    """
+    central_agora = _marca_central(central)
+    ultimo_evento = local.execute("SELECT COALESCE(MAX(id), 0) FROM eventos").fetchone()[0]
+    completa = marca is None or marca[1:3] != central_agora[1:3]
+    if completa:
+        ops = central.execute(SQL_OPS_CENTRAL + " WHERE o.status NOT IN ('FINALIZADA', 'CANCELADA')").fetchall()
+    else:
+        # OPs com apontamento novo no central, com evento novo aqui ou ainda pendente (a reaplicar).
+        relidas = {r[0] for r in central.execute("SELECT DISTINCT op FROM apontamentos WHERE id > ?", (marca[0],))}
+        relidas.update(r[0] for r in local.execute(
+            "SELECT DISTINCT op FROM eventos WHERE id > ? OR situacao = 'PENDENTE'", (marca[3],)))
+        relidas = sorted(relidas)
+        ops = []
+        for inicio in range(0, len(relidas), 500):
+            lote = relidas[inicio:inicio + 500]
+            ops += central.execute(SQL_OPS_CENTRAL + f" WHERE o.op IN ({', '.join('?' * len(lote))})", lote).fetchall()
+        # Todas as relidas saem da cópia; voltam só as que ainda estão em aberto no central.
+        ops = [r for r in ops if r["status"] not in ("FINALIZADA", "CANCELADA")]
+    maquinas = [tuple(r) for r in central.execute("SELECT maquina, status FROM maquinas_status").fetchall()]
+    ops = [tuple(r) for r in ops]
+
+    local.execute("BEGIN IMMEDIATE")
+    try:
+        if local.execute("SELECT COALESCE(MAX(id), 0) FROM eventos").fetchone()[0] != ultimo_evento:
+            local.rollback()
+            return marca
+        if completa:
+            local.execute("DELETE FROM ops_local")
+        else:
+            local.executemany("DELETE FROM ops_local WHERE op = ?", [(op,) for op in relidas])
+        local.executemany("INSERT INTO ops_local VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", ops)
+        local.execute("DELETE FROM maquinas_local")
+        local.executemany("INSERT INTO maquinas_local VALUES (?, ?)", maquinas)
+
+        cursor = local.cursor()
+        for evento in local.execute("SELECT * FROM eventos WHERE situacao = 'PENDENTE' ORDER BY id").fetchall():
+            try:
+                _aplicar_local(cursor, evento["tipo"], evento["op"], evento["pecas"], evento["quando"], evento["id"])
+            except TransicaoInvalida:
+                # Vai virar CONFLITO quando chegar ao banco central.
+                pass
+        local.commit()
+    except BaseException:
+        local.rollback()
+        raise
+    return central_agora + (ultimo_evento,)
+
+
+def limpar_eventos(local, agora=None):
+    """Apaga um lote de eventos aplicados antigos de OPs que já saíram da cópia local. Devolve quantos."""
+    limite = (agora or datetime.now()) - timedelta(days=RETENCAO_EVENTOS_DIAS)
+    with local:
+        return local.execute("""
+            DELETE FROM eventos WHERE id IN (
+                SELECT id FROM eventos WHERE situacao = 'APLICADO' AND quando < ?
+                  AND op NOT IN (SELECT op FROM ops_local)
+                LIMIT ?)
+        """, (limite, LOTE_LIMPEZA)).rowcount
+
+
+class SincronizadorDiario(threading.Thread):
+    """Envia o diário ao banco central e mantém a cópia local atualizada."""
+
+    def __init__(self, caminho_diario, conectar_central, terminal, intervalo=2.0):
+        super().__init__(daemon=True)
+        self.caminho_diario = caminho_diario
+        self.conectar_central = conectar_central
+        self.terminal = terminal
+        self.intervalo = intervalo
+        self.online = False
+        self.ultima_sincronizacao = None
+        self.conflitos = 0
+        self._marca = None
+        self._recarga_completa_em = 0.0
+        self._acordar = threading.Event()
+        self._parar = threading.Event()
+
+    def notificar(self):
+        self._acordar.set()
+
+    def parar(self):
+        self._parar.set()
+        self._acordar.set()
+        self.join(timeout=5)
+
+    def sincronizar(self, local):
+        central = self.conectar_central()
+        if not central:
+            raise sqlite3.OperationalError("banco central indisponível")
+        try:
+            while True:
+                eventos = local.execute(
+                    "SELECT * FROM eventos WHERE situacao = 'PENDENTE' ORDER BY id LIMIT ?", (LOTE_SINCRONIZACAO,)
+                ).fetchall()
+                if not eventos:
+                    break
+                resultados = aplicar_lote(central, self.terminal, eventos)
+                with local:
+                    local.executemany("UPDATE eventos SET situacao = ?, detalhe = ? WHERE uuid = ?",
+                                      [(situacao, detalhe, u) for u, situacao, detalhe in resultados])
+                self.conflitos += sum(1 for _, situacao, _ in resultados if situacao == "CONFLITO")
+            if time.monotonic() - self._recarga_completa_em >= RECARGA_COMPLETA_SEG:
+                self._marca = None
+                self._recarga_completa_em = time.monotonic()
+            self._marca = atualizar_copia_local(local, central, self._marca)
+            limpar_eventos(local)
+        finally:
+            central.close()
+        self.ultima_sincronizacao = datetime.now()
+
+    def run(self):
+        local = conectar_diario(self.caminho_diario)
+        espera = self.intervalo
+        while not self._parar.is_set():
+            try:
+                self.sincronizar(local)
+                self.online = True
+                espera = self.intervalo
+            except sqlite3.Error as e:
+                if self.online:
+                    print(f"Banco central indisponível, apontamentos ficam no diário local: {e}")
+                self.online = False
+                espera = min(espera * 2, ESPERA_MAXIMA_SEG)
+            self._acordar.wait(espera)
+            self._acordar.clear()
+        local.close()
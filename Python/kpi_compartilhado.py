@@ -0,0 +1,275 @@
+"""Snapshot de KPIs em memória compartilhada para vários painéis no mesmo PC.
+
+Na sala de controle rodam vários processos de painel (gestor, TV, exportação)
+lendo o mesmo ``kpi_snapshot``. ``PublicadorKPI`` é o único que consulta o
+banco: quando ``PRAGMA data_version`` muda, relê o snapshot e grava num
+segmento ``multiprocessing.shared_memory`` de layout fixo. ``LeitorKPI``
+mapeia o segmento e decodifica direto do buffer (``struct.unpack_from``
+sobre o ``memoryview``), sem abrir conexão; mais um painel custa só a
+decodificação de algumas centenas de bytes por máquina.
+
+Layout: cabeçalho ``CABECALHO`` seguido de ``capacidade`` registros
+``REGISTRO``. A ``sequencia`` funciona como seqlock: ímpar enquanto o
+publicador escreve; o leitor repete a leitura se ela mudou no meio.
+
+Os textos têm tamanho fixo em bytes UTF-8. Um valor que não cabe (ou um
+status fora de ``STATUS``, ou máquinas além da capacidade) não é cortado:
+o publicador marca o snapshot como ``completo = 0`` e o leitor devolve
+None, então o painel lê do banco com as chaves iguais às do cadastro.
+"""
+import hashlib
+import math
+import os
+import sqlite3
+import struct
+import sys
+import threading
+import time
+from datetime import datetime
+from multiprocessing import resource_tracker, shared_memory
+
+from kpi_snapshot import ler_kpi
+
+MAGICO = b"KPI2"
+# magico, capacidade, linhas, sequencia, publicado_em (epoch), completo
+CABECALHO = struct.Struct("<4sHHQdB")
+# maquina, status_maquina, op, produto, status_op, planejado, produzido, meta_hora,
+# progresso, parado_seg, oee, taxa_hora, previsao_termino, alerta_ritmo, atualizado_em
+REGISTRO = struct.Struct("<64sB48s96sBiiididdd192sd")
+CAPACIDADE = 256
+STATUS = ("", "PRODUZINDO", "PARADA", "LIVRE", "FINALIZADA", "PENDENTE", "CANCELADA")
+VERIFICACAO_SEG = 0.25
+# Sem publicação há mais que isso, o leitor considera o publicador parado.
+VALIDADE_SEG = 10.0
+TENTATIVAS_LEITURA = 100
+
+
+def nome_segmento(alvo):
+    """Nome do segmento derivado do banco, para dois bancos no mesmo PC não se misturarem."""
+    return "ariline_kpi_" + hashlib.sha1(os.path.abspath(alvo).encode()).hexdigest()[:12]
+
+
+def _rastrear(segmento, rastrear):
+    """Liga/desliga o resource_tracker (POSIX) para o segmento.
+
+    Quem só anexa um segmento não pode deixá-lo registrado: ao sair, o
+    resource_tracker do processo apagaria o segmento de quem publica.
+    """
+    if os.name == "posix":
+        (resource_tracker.register if rastrear else resource_tracker.unregister)(segmento._name, "shared_memory")
+
+
+class NaoCabe(ValueError):
+    """Valor que não cabe no layout fixo do segmento."""
+
+
+def _texto(valor, tamanho):
+    bruto = (valor or "").encode("utf-8")
+    if len(bruto) > tamanho:
+        raise NaoCabe(f"{valor!r} tem {len(bruto)} bytes (máximo {tamanho})")
+    return bruto
+
+
+def _decodificar_texto(bruto):
+    return bruto.rstrip(b"\0").decode("utf-8", "ignore") or None
+
+
+def _codigo_status(status):
+    if status not in STATUS and status is not None:
+        raise NaoCabe(f"status {status!r} desconhecido")
+    return STATUS.index(status or "")
+
+
+def _real(valor):
+    return math.nan if valor is None else float(valor)
+
+
+def _opcional(valor):
+    return None if math.isnan(valor) else valor
+
+
+def _epoch(momento):
+    return math.nan if momento is None else momento.timestamp()
+
+
+def _momento(epoch):
+    return None if math.isnan(epoch) else datetime.fromtimestamp(epoch)
+
+
+class PublicadorKPI(threading.Thread):
+    """Copia ``kpi_snapshot`` para a memória compartilhada sempre que o banco muda."""
+
+    def __init__(self, conectar, nome, capacidade=CAPACIDADE, verificacao=VERIFICACAO_SEG):
+        super().__init__(name="PublicadorKPI", daemon=True)
+        self.conectar = conectar
+        self.nome = nome
+        self.capacidade = capacidade
+        self.verificacao = verificacao
+        self.segmento = None
+        self.sequencia = 0
+        self.recusa = None
+        self._parar = threading.Event()
+
+    def parar(self):
+        self._parar.set()
+
+    def _abrir_segmento(self):
+        tamanho = CABECALHO.size + self.capacidade * REGISTRO.size
+        try:
+            self.segmento = shared_memory.SharedMemory(self.nome, create=True, size=tamanho)
+        except FileExistsError:
+            self.segmento = shared_memory.SharedMemory(self.nome)
+            _rastrear(self.segmento, False)
+            magico, _, _, sequencia, publicado_em, _ = CABECALHO.unpack_from(self.segmento.buf)
+            if magico == MAGICO and time.time() - publicado_em < VALIDADE_SEG:
+                self.segmento.close()
+                self.segmento = None
+                return False
+            # Sobra de um publicador que caiu: assume o segmento, ou recria se não couber.
+            _rastrear(self.segmento, True)
+            if self.segmento.size < tamanho:
+                self.segmento.close()
+                self.segmento.unlink()
+                self.segmento = shared_memory.SharedMemory(self.nome, create=True, size=tamanho)
+            else:
+                self.sequencia = (sequencia + 1) & ~1
+        return True
+
+    def _codificar(self, linhas):
+        if len(linhas) > self.capacidade:
+            raise NaoCabe(f"{len(linhas)} máquinas (capacidade {self.capacidade})")
+        return [REGISTRO.pack(_texto(row["maquina"], 64), _codigo_status(row["status_maquina"]),
+                              _texto(row["op"], 48), _texto(row["produto"], 96), _codigo_status(row["status_op"]),
+                              row["planejado"] or 0, row["produzido"] or 0, row["meta_hora"] or 0,
+                              row["progresso"] or 0.0, row["parado_seg"] or 0, _real(row["oee"]),
+                              _real(row["taxa_hora"]), _epoch(row["previsao_termino"]),
+                              _texto(row["alerta_ritmo"], 192), _epoch(row["atualizado_em"]))
+                for row in linhas]
+
+    def publicar(self, linhas, agora=None):
+        """Grava as linhas (formato de ``ler_kpi``) no segmento, sob o seqlock; devolve se o snapshot está completo."""
+        try:
+            registros, recusa = self._codificar(linhas), None
+        except NaoCabe as e:
+            registros, recusa = [], str(e)
+        if recusa != self.recusa:
+            if recusa:
+                print(f"Snapshot compartilhado suspenso, os painéis leem do banco: {recusa}.")
+            self.recusa = recusa
+        buf = self.segmento.buf
+        agora = agora or time.time()
+
+        CABECALHO.pack_into(buf, 0, MAGICO, self.capacidade, 0, self.sequencia + 1, agora, 0)
+        for i, registro in enumerate(registros):
+            buf[CABECALHO.size + i * REGISTRO.size:CABECALHO.size + (i + 1) * REGISTRO.size] = registro
+        self.sequencia += 2
+        CABECALHO.pack_into(buf, 0, MAGICO, self.capacidade, len(registros), self.sequencia, agora, recusa is None)
+        return recusa is None
+
+    def run(self):
+        if not self._abrir_segmento():
+            print(f"Snapshot compartilhado: outro processo já publica em {self.nome}.")
+            return
+        conexao = None
+        ultima_versao = None
+        ultima_publicacao = 0.0
+        try:
+            while not self._parar.is_set():
+                try:
+                    if conexao is None:
+                        conexao = self.conectar()
+                    if conexao:
+                        versao = conexao.execute("PRAGMA data_version").fetchone()[0]
+                        agora = time.time()
+                        # Republica mesmo sem mudança para o leitor saber que o publicador está vivo.
+                        if versao != ultima_versao or agora - ultima_publicacao >= VALIDADE_SEG / 2:
+                            self.publicar(ler_kpi(conexao), agora)
+                            ultima_versao, ultima_publicacao = versao, agora
+                except sqlite3.Error as e:
+                    print(f"Erro ao publicar o snapshot compartilhado: {e}")
+                self._parar.wait(self.verificacao)
+        finally:
+            if conexao:
+                conexao.close()
+            self.segmento.close()
+            try:
+                self.segmento.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class LeitorKPI:
+    """Lê o snapshot publicado, sem acesso ao banco."""
+
+    def __init__(self, nome):
+        self.segmento = shared_memory.SharedMemory(nome)
+        _rastrear(self.segmento, False)
+        self.ultima_sequencia = None
+
+    @classmethod
+    def abrir(cls, nome):
+        """Leitor para o segmento ``nome`` ou None se ninguém está publicando."""
+        try:
+            return cls(nome)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def fechar(self):
+        self.segmento.close()
+
+    def ler(self, agora=None):
+        """Linhas no formato de ``ler_kpi``; None se o publicador parou ou o segmento é inválido."""
+        buf = self.segmento.buf
+        for _ in range(TENTATIVAS_LEITURA):
+            magico, capacidade, n, sequencia, publicado_em, completo = CABECALHO.unpack_from(buf)
+            if magico != MAGICO or not completo:
+                return None
+            if sequencia % 2:
+                time.sleep(0)
+                continue
+            registros = [REGISTRO.unpack_from(buf, CABECALHO.size + i * REGISTRO.size) for i in range(n)]
+            if CABECALHO.unpack_from(buf)[3] == sequencia:
+                break
+        else:
+            return None
+
+        if time.time() - publicado_em > VALIDADE_SEG:
+            return None
+        self.ultima_sequencia = sequencia
+        agora = agora or datetime.now()
+        linhas = []
+        for r in registros:
+            atualizado_em = _momento(r[14])
+            linhas.append({
+                "maquina": _decodificar_texto(r[0]), "status_maquina": STATUS[r[1]] or None,
+                "op": _decodificar_texto(r[2]), "produto": _decodificar_texto(r[3]),
+                "status_op": STATUS[r[4]] or None, "planejado": r[5], "produzido": r[6], "meta_hora": r[7],
+                "progresso": r[8], "parado_seg": r[9], "oee": _opcional(r[10]), "taxa_hora": _opcional(r[11]),
+                "previsao_termino": _momento(r[12]), "alerta_ritmo": _decodificar_texto(r[13]),
+                "atualizado_em": atualizado_em, "idade_seg": (agora - atualizado_em).total_seconds(),
+            })
+        return linhas
+
+
+if __name__ == "__main__":
+    from codigofinal import BANCO, conectar_db
+
+    nome = nome_segmento(BANCO.alvo)
+    if len(sys.argv) > 1 and sys.argv[1] == "--ler":
+        leitor = LeitorKPI.abrir(nome)
+        if leitor is None:
+            print("Nenhum publicador ativo neste PC.")
+            sys.exit(1)
+        for row in leitor.ler() or []:
+            print(f"{row['maquina']}: {row['status_maquina']} {row['op'] or ''} {row['produzido']}/{row['planejado']}")
+        leitor.fechar()
+    else:
+        job = PublicadorKPI(conectar_db, nome)
+        job.start()
+        print(f"Publicando kpi_snapshot em {nome}.")
+        try:
+            while job.is_alive():
+                job.join(timeout=1)
+        except KeyboardInterrupt:
+            job.parar()
+            job.join()
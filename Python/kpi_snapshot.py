@@ -0,0 +1,351 @@
+"""Snapshot pré-calculado de KPIs por máquina (e OP ativa).
+
+Um único job em segundo plano mantém a tabela ``kpi_snapshot``; os painéis
+apenas leem uma linha por máquina em vez de recalcular OEE, progresso e
+tempo parado a partir das tabelas brutas a cada atualização.
+"""
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+
+from calendario import Calendario, tempo_excluido_seg
+from contagem import RegistroContagem, alimentar
+from ritmo import DetectorRitmo
+from taxa import EstimadorTaxa
+
+INTERVALO_PADRAO_SEG = 2.0
+RECARGA_CALENDARIO_SEG = 60.0
+VERIFICACAO_SEG = 0.25
+LEASE_SEG = 10.0
+
+
+COLUNAS_KPI = ("maquina", "status_maquina", "op", "produto", "status_op", "planejado", "produzido",
+               "meta_hora", "progresso", "parado_seg", "oee", "taxa_hora", "previsao_termino", "alerta_ritmo",
+               "atualizado_em")
+
+
+def criar_tabela_kpi(cursor):
+    # A tabela é só derivada: se o layout mudou entre versões, recria e o job repopula.
+    colunas = tuple(r[1] for r in cursor.execute("PRAGMA table_info(kpi_snapshot)").fetchall())
+    if colunas and colunas != COLUNAS_KPI:
+        cursor.execute("DROP TABLE kpi_snapshot")
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS kpi_snapshot (
+        maquina TEXT PRIMARY KEY,
+        status_maquina TEXT NOT NULL,
+        op TEXT,
+        produto TEXT,
+        status_op TEXT,
+        planejado INTEGER DEFAULT 0,
+        produzido INTEGER DEFAULT 0,
+        meta_hora INTEGER DEFAULT 0,
+        progresso REAL DEFAULT 0,
+        parado_seg INTEGER DEFAULT 0,
+        oee REAL,
+        taxa_hora REAL,
+        previsao_termino TIMESTAMP,
+        alerta_ritmo TEXT,
+        atualizado_em TIMESTAMP NOT NULL
+    )""")
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS kpi_lease (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        dono TEXT,
+        renovado_em REAL DEFAULT 0
+    )""")
+    cursor.execute("INSERT OR IGNORE INTO kpi_lease (id, dono, renovado_em) VALUES (1, NULL, 0)")
+
+
+def calcular_oee(op_data, tempo_parado_seg, agora=None):
+    """Retorna o OEE (0-100) da OP ou None se ela não estiver produzindo."""
+    if op_data["status"] != "PRODUZINDO" or op_data["inicio_producao"] is None:
+        return None
+
+    agora = agora or datetime.now()
+    tempo_decorrido_seg = (agora - op_data["inicio_producao"]).total_seconds()
+    tempo_operacional_hr = (tempo_decorrido_seg - tempo_parado_seg) / 3600
+
+    if tempo_operacional_hr <= 0:
+        return 0.0
+
+    quantidade_esperada = tempo_operacional_hr * op_data["meta_hora"]
+    performance = (op_data["produzido"] / quantidade_esperada) if quantidade_esperada > 0 else 0
+
+    return min(performance * 100, 100.0)
+
+
+def formatar_oee(oee):
+    return "N/A" if oee is None else f"{oee:.1f}%"
+
+
+def tempo_parado_seg(cursor, op, agora=None):
+    """Soma das paradas não planejadas da OP (fechadas + a aberta, se houver)."""
+    agora = agora or datetime.now()
+    sql = """
+    SELECT COALESCE(SUM(CASE WHEN p.fim IS NOT NULL THEN p.duracao_seg END), 0) AS fechado,
+           MAX(CASE WHEN p.fim IS NULL THEN p.inicio END) AS "aberta [timestamp]"
+    FROM paradas_log p
+    LEFT JOIN motivos_parada m ON m.motivo = p.motivo
+    WHERE p.op = ? AND COALESCE(m.planejada, 0) = 0
+    """
+    resultado = cursor.execute(sql, (op,)).fetchone()
+    total = resultado["fechado"]
+    if resultado["aberta"]:
+        total += (agora - resultado["aberta"]).total_seconds()
+    return total
+
+
+def tempo_indisponivel_seg(cursor, op_data, agora=None, calendario=None):
+    """Tempo a descontar do OEE: todas as paradas da OP unidas ao tempo planejado do calendário."""
+    agora = agora or datetime.now()
+    if calendario is None:
+        sql = "SELECT COALESCE(SUM(duracao_seg), 0) FROM paradas_log WHERE op = ? AND fim IS NOT NULL"
+        total = cursor.execute(sql, (op_data["op"],)).fetchone()[0]
+        sql = 'SELECT MAX(inicio) AS "aberta [timestamp]" FROM paradas_log WHERE op = ? AND fim IS NULL'
+        aberta = cursor.execute(sql, (op_data["op"],)).fetchone()[0]
+        if aberta:
+            total += (agora - aberta).total_seconds()
+        return total
+
+    paradas = [(r["inicio"], r["fim"] or agora) for r in cursor.execute(
+        "SELECT inicio, fim FROM paradas_log WHERE op = ?", (op_data["op"],))]
+    return tempo_excluido_seg(calendario, op_data["inicio_producao"], agora, paradas, op_data["maquina"])
+
+
+def _calcular_linhas(cursor, agora, maquinas=None, estimadores=None, calendario=None, detectores=None):
+    sql = """
+    SELECT m.maquina, m.status AS status_maquina,
+           o.op, o.produto, o.status AS status_op, o.planejado, o.produzido,
+           o.meta_hora, o.inicio_producao
+    FROM maquinas_status m
+    LEFT JOIN ordens_producao o
+           ON o.maquina = m.maquina AND o.status IN ('PRODUZINDO', 'PARADA')
+    """
+    params = ()
+    if maquinas is not None:
+        sql += f" WHERE m.maquina IN ({','.join('?' * len(maquinas))})"
+        params = tuple(maquinas)
+
+    linhas = {}
+    for row in cursor.execute(sql, params).fetchall():
+        if row["maquina"] in linhas:
+            continue
+
+        if row["op"] is None:
+            linhas[row["maquina"]] = (row["maquina"], row["status_maquina"], None, None, None,
+                                      0, 0, 0, 0.0, 0, None, None, None, None, agora)
+            continue
+
+        op_data = dict(row, status=row["status_op"])
+        parado = tempo_parado_seg(cursor, row["op"], agora)
+        progresso = (row["produzido"] / row["planejado"]) * 100 if row["planejado"] > 0 else 0.0
+        oee = calcular_oee(op_data, tempo_indisponivel_seg(cursor, op_data, agora, calendario), agora)
+
+        taxa = previsao = None
+        if estimadores is not None:
+            estimador = estimadores.get(row["op"])
+            if estimador is None:
+                estimador = estimadores[row["op"]] = EstimadorTaxa()
+            estimador.observar(row["produzido"], row["status_maquina"] == "PARADA", agora)
+            taxa = estimador.taxa_hora(agora)
+            previsao = estimador.previsao_termino(row["planejado"] - row["produzido"], agora)
+
+        alerta = None
+        if detectores is not None:
+            detector = detectores.get(row["op"])
+            if detector is None:
+                detector = detectores[row["op"]] = DetectorRitmo(row["meta_hora"])
+            detector.observar(row["produzido"], row["status_maquina"] == "PARADA", agora, row["meta_hora"])
+            alerta = detector.alerta()
+
+        linhas[row["maquina"]] = (row["maquina"], row["status_maquina"], row["op"], row["produto"],
+                                  row["status_op"], row["planejado"], row["produzido"], row["meta_hora"],
+                                  progresso, round(parado), oee, taxa, previsao, alerta, agora)
+    return linhas
+
+
+def atualizar_kpi(conexao, maquinas=None, agora=None, estimadores=None, calendario=None, detectores=None):
+    """Recalcula o snapshot das máquinas informadas (ou de todas).
+
+    ``estimadores`` (op -> EstimadorTaxa) e ``detectores`` (op ->
+    DetectorRitmo) são mantidos pelo chamador entre chamadas para que a taxa
+    atual, a previsão e o alerta de ritmo sejam incrementais.
+    """
+    agora = agora or datetime.now()
+    cursor = conexao.cursor()
+    linhas = _calcular_linhas(cursor, agora, maquinas, estimadores, calendario, detectores)
+
+    if maquinas is None:
+        ativas = {linha[2] for linha in linhas.values()}
+        for estado in (estimadores, detectores):
+            if estado is not None:
+                for op in estado.keys() - ativas:
+                    del estado[op]
+
+    if maquinas is None:
+        existentes = {r["maquina"] for r in cursor.execute("SELECT maquina FROM kpi_snapshot")}
+        removidas = [(m,) for m in existentes - linhas.keys()]
+        cursor.executemany("DELETE FROM kpi_snapshot WHERE maquina = ?", removidas)
+
+    cursor.executemany(f"INSERT OR REPLACE INTO kpi_snapshot VALUES ({','.join('?' * len(COLUNAS_KPI))})",
+                       linhas.values())
+    conexao.commit()
+    return len(linhas)
+
+
+def reconstruir_kpi(conexao, agora=None):
+    """Apaga e recria todo o snapshot a partir das tabelas brutas."""
+    cursor = conexao.cursor()
+    criar_tabela_kpi(cursor)
+    cursor.execute("DELETE FROM kpi_snapshot")
+    return atualizar_kpi(conexao, agora=agora, calendario=Calendario.carregar(conexao))
+
+
+def verificar_kpi(conexao, tolerancia_oee=1.0, agora=None):
+    """Compara o snapshot gravado com um recálculo completo.
+
+    Retorna a lista de máquinas divergentes (vazia se estiver consistente).
+    """
+    agora = agora or datetime.now()
+    cursor = conexao.cursor()
+    esperado = _calcular_linhas(cursor, agora, calendario=Calendario.carregar(conexao))
+    gravado = {r["maquina"]: r for r in cursor.execute("SELECT * FROM kpi_snapshot").fetchall()}
+
+    divergentes = []
+    for maquina in esperado.keys() | gravado.keys():
+        novo, atual = esperado.get(maquina), gravado.get(maquina)
+        if novo is None or atual is None:
+            divergentes.append(maquina)
+            continue
+        if (novo[1], novo[2], novo[6]) != (atual["status_maquina"], atual["op"], atual["produzido"]):
+            divergentes.append(maquina)
+            continue
+        if (novo[10] is None) != (atual["oee"] is None):
+            divergentes.append(maquina)
+        elif novo[10] is not None and abs(novo[10] - atual["oee"]) > tolerancia_oee:
+            divergentes.append(maquina)
+    return sorted(divergentes)
+
+
+def ler_kpi(conexao, agora=None):
+    """Lê o snapshot (O(máquinas)) e acrescenta a idade de cada linha em segundos."""
+    agora = agora or datetime.now()
+    resultado = []
+    for row in conexao.execute("SELECT * FROM kpi_snapshot ORDER BY maquina").fetchall():
+        dados = dict(row)
+        dados["idade_seg"] = (agora - row["atualizado_em"]).total_seconds()
+        resultado.append(dados)
+    return resultado
+
+
+class AtualizadorKPI(threading.Thread):
+    """Job único que mantém ``kpi_snapshot``.
+
+    Recalcula quando outra conexão grava no banco (``PRAGMA data_version``),
+    quando ``notificar()`` é chamado ou, no máximo, a cada ``intervalo``
+    segundos. Entre vários terminais, só o dono do lease em ``kpi_lease`` grava;
+    o mesmo dono alimenta ``contagem_blocos`` a partir do diário.
+    """
+
+    def __init__(self, conectar, intervalo=INTERVALO_PADRAO_SEG, verificacao=VERIFICACAO_SEG):
+        super().__init__(name="AtualizadorKPI", daemon=True)
+        self.conectar = conectar
+        self.intervalo = intervalo
+        self.verificacao = verificacao
+        self.identificador = f"{socket.gethostname()}:{os.getpid()}"
+        self.estimadores = {}
+        self.detectores = {}
+        self.contagem = RegistroContagem(conectar)
+        self._acordar = threading.Event()
+        self._parar = threading.Event()
+
+    def notificar(self):
+        self._acordar.set()
+
+    def parar(self):
+        self._parar.set()
+        self._acordar.set()
+
+    def _renovar_lease(self, conexao):
+        agora = time.time()
+        cursor = conexao.execute(
+            "UPDATE kpi_lease SET dono = ?, renovado_em = ? WHERE id = 1 AND (dono = ? OR dono IS NULL OR renovado_em < ?)",
+            (self.identificador, agora, self.identificador, agora - LEASE_SEG))
+        conexao.commit()
+        return cursor.rowcount == 1
+
+    def run(self):
+        conexao = self.conectar()
+        if not conexao:
+            return
+        criar_tabela_kpi(conexao.cursor())
+        conexao.commit()
+
+        ultima_versao = None
+        ultimo_calculo = 0.0
+        ultimo_lease = 0.0
+        ultima_recarga = 0.0
+        calendario = None
+        lider = False
+
+        while not self._parar.is_set():
+            try:
+                agora = time.monotonic()
+                if agora - ultimo_lease >= LEASE_SEG / 3:
+                    era_lider, lider = lider, self._renovar_lease(conexao)
+                    if era_lider and not lider:
+                        self.contagem.descartar()
+                    ultimo_lease = agora
+
+                versao = conexao.execute("PRAGMA data_version").fetchone()[0]
+                if lider and (self._acordar.is_set() or versao != ultima_versao
+                              or agora - ultimo_calculo >= self.intervalo):
+                    self._acordar.clear()
+                    if calendario is None or agora - ultima_recarga >= RECARGA_CALENDARIO_SEG:
+                        calendario = Calendario.carregar(conexao)
+                        ultima_recarga = agora
+                    alimentar(conexao, self.contagem)
+                    atualizar_kpi(conexao, estimadores=self.estimadores, calendario=calendario,
+                                  detectores=self.detectores)
+                    ultima_versao = conexao.execute("PRAGMA data_version").fetchone()[0]
+                    ultimo_calculo = agora
+            except sqlite3.Error as e:
+                print(f"Erro ao atualizar KPI: {e}")
+
+            self._acordar.wait(self.verificacao)
+
+        if lider:
+            self.contagem.selar()
+            conexao.execute("UPDATE kpi_lease SET dono = NULL, renovado_em = 0 WHERE id = 1 AND dono = ?",
+                            (self.identificador,))
+            conexao.commit()
+        conexao.close()
+
+
+if __name__ == "__main__":
+    from codigofinal import DB_NAME, conectar_db
+
+    if len(sys.argv) > 1 and sys.argv[1] == "--verificar":
+        conexao = conectar_db()
+        divergentes = verificar_kpi(conexao)
+        print("Snapshot consistente." if not divergentes else f"Divergências: {', '.join(divergentes)}")
+        conexao.close()
+    elif len(sys.argv) > 1 and sys.argv[1] == "--reconstruir":
+        conexao = conectar_db()
+        print(f"{reconstruir_kpi(conexao)} máquinas recalculadas em {DB_NAME}.")
+        conexao.close()
+    else:
+        job = AtualizadorKPI(conectar_db)
+        job.start()
+        try:
+            while job.is_alive():
+                job.join(timeout=1)
+        except KeyboardInterrupt:
+            job.parar()
+            job.join()
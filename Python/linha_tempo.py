@@ -0,0 +1,160 @@
+"""Histórico de estados das máquinas e linha do tempo reduzida para desenho.
+
+Toda mudança em ``maquinas_status`` fica em ``maquinas_historico``, que só
+aceita inserções. As transições de ``transicoes`` gravam o estado com o
+horário da própria transição (``registrar_estado``), que num evento
+sincronizado depois de uma queda é o horário do terminal, não o da
+sincronização; o gatilho com a hora atual só grava o que chegou por outro
+caminho (cadastro, recuperação na partida). A linha do tempo é
+reduzida no próprio SQLite, antes de chegar ao canvas: trechos mais curtos
+que um pixel são agrupados por pixel e pintados com o estado que dominou
+aquele pixel, e trechos vizinhos com o mesmo estado são unidos. Assim o número de
+retângulos por máquina fica limitado pela largura do canvas, qualquer que
+seja o período consultado.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+
+def criar_historico_status(cursor):
+    """Cria a tabela de histórico e os gatilhos; devolve True se a tabela é nova."""
+    nova = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'maquinas_historico'"
+    ).fetchone() is None
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS maquinas_historico (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        maquina TEXT NOT NULL,
+        status TEXT NOT NULL,
+        inicio TIMESTAMP NOT NULL
+    )""")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_historico_maquina ON maquinas_historico (maquina, inicio, status)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_historico_ultimo ON maquinas_historico (maquina, id)")
+
+    # Só grava quando o estado realmente muda (INSERT OR REPLACE com o mesmo status não conta) e
+    # ninguém gravou antes: compara com o último registro gravado, não com o de maior ``inicio``.
+    for evento in ("INSERT", "UPDATE OF status"):
+        nome = "trg_historico_" + evento.split()[0].lower()
+        cursor.execute(f"DROP TRIGGER IF EXISTS {nome}")
+        cursor.execute(f"""
+        CREATE TRIGGER {nome} AFTER {evento} ON maquinas_status
+        WHEN NEW.status IS NOT (SELECT status FROM maquinas_historico WHERE maquina = NEW.maquina
+                                ORDER BY id DESC LIMIT 1)
+        BEGIN
+            INSERT INTO maquinas_historico (maquina, status, inicio)
+            VALUES (NEW.maquina, NEW.status, strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime'));
+        END""")
+
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_historico_sem_update BEFORE UPDATE ON maquinas_historico
+    BEGIN SELECT RAISE(ABORT, 'maquinas_historico aceita apenas inserções'); END""")
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_historico_sem_delete BEFORE DELETE ON maquinas_historico
+    BEGIN SELECT RAISE(ABORT, 'maquinas_historico aceita apenas inserções'); END""")
+
+    if nova:
+        cursor.execute("""
+        INSERT INTO maquinas_historico (maquina, status, inicio)
+        SELECT maquina, status, strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime') FROM maquinas_status
+        """)
+    return nova
+
+
+def registrar_estado(cursor, op, status, quando):
+    """Grava o ``status`` que a máquina da OP assume em ``quando``.
+
+    Vai antes do UPDATE em ``maquinas_status``, na mesma transação: o gatilho
+    encontra o estado já gravado e não repete a mudança com a hora atual.
+    """
+    cursor.execute("""
+        INSERT INTO maquinas_historico (maquina, status, inicio)
+        SELECT maquina, ?, ? FROM ordens_producao WHERE op = ?
+    """, (status, quando, op))
+
+
+def _julianday(quando):
+    return (quando - datetime(2000, 1, 1, 12)).total_seconds() / 86400 + 2451545.0
+
+
+def _trechos_reduzidos(cursor, maquina, inicio, fim, passo):
+    """Trechos longos com bordas exatas e, por pixel, o tempo de cada status nos trechos curtos.
+
+    Cada linha é (status, a, b, tempo, pixel), com a/b em segundos desde
+    ``inicio``; ``pixel`` é None nos trechos de pelo menos um pixel.
+    """
+    duracao = (fim - inicio).total_seconds()
+    return cursor.execute("""
+        WITH pontos AS (
+            SELECT status, 0.0 AS a FROM (
+                SELECT status FROM maquinas_historico WHERE maquina = :maquina AND inicio <= :inicio
+                ORDER BY inicio DESC, id DESC LIMIT 1)
+            UNION ALL
+            SELECT status, (julianday(inicio) - :dia_inicio) * 86400.0 FROM maquinas_historico
+            WHERE maquina = :maquina AND inicio > :inicio AND inicio < :fim
+        ), trechos AS (
+            SELECT status, a, LEAD(a, 1, :duracao) OVER (ORDER BY a) AS b FROM pontos
+        )
+        SELECT status, a, b, b - a AS tempo, NULL AS pixel FROM trechos WHERE b - a >= :passo
+        UNION ALL
+        SELECT status, MIN(a), MAX(b), SUM(b - a), CAST(a / :passo AS INTEGER) FROM trechos
+        WHERE b > a AND b - a < :passo GROUP BY CAST(a / :passo AS INTEGER), status
+        ORDER BY 2
+    """, {"maquina": maquina, "inicio": inicio, "fim": fim, "duracao": duracao, "passo": passo,
+          "dia_inicio": _julianday(inicio)}).fetchall()
+
+
+def reduzir(linhas):
+    """Junta as linhas de ``_trechos_reduzidos`` em segmentos (status, a, b) contíguos.
+
+    Num pixel com vários trechos curtos vence o status que ocupou mais tempo
+    ali; segmentos vizinhos com o mesmo status são unidos.
+    """
+    saida = []
+
+    def emitir(status, a, b):
+        if saida and saida[-1][0] == status and saida[-1][2] >= a:
+            saida[-1] = (status, saida[-1][1], b)
+        else:
+            saida.append((status, a, b))
+
+    balde = None  # [pixel, a, b, status dominante, tempo dele]
+    for status, a, b, tempo, pixel in linhas:
+        if balde and balde[0] != pixel:
+            emitir(balde[3], balde[1], balde[2])
+            balde = None
+        if pixel is None:
+            emitir(status, a, b)
+        elif balde is None:
+            balde = [pixel, a, b, status, tempo]
+        else:
+            balde[1], balde[2] = min(balde[1], a), max(balde[2], b)
+            if tempo > balde[4]:
+                balde[3], balde[4] = status, tempo
+    if balde:
+        emitir(balde[3], balde[1], balde[2])
+    return saida
+
+
+def linha_do_tempo(conexao, inicio, fim, largura=800, maquinas=None):
+    """Segmentos prontos para desenhar, por máquina, e o tempo total em cada status.
+
+    Devolve ``{maquina: {"segmentos": [(status, ini, fim)], "totais": {status: seg}}}``
+    com ``ini``/``fim`` em datetime.
+    """
+    cursor = conexao.cursor()
+    if maquinas is None:
+        maquinas = [r["maquina"] for r in cursor.execute(
+            "SELECT DISTINCT maquina FROM maquinas_historico ORDER BY maquina")]
+    passo = (fim - inicio).total_seconds() / max(largura, 1)
+
+    resultado = {}
+    for maquina in maquinas:
+        linhas = _trechos_reduzidos(cursor, maquina, inicio, fim, passo)
+        totais = defaultdict(float)
+        for row in linhas:
+            totais[row["status"]] += row["tempo"]
+        segmentos = [(status, inicio + timedelta(seconds=a), inicio + timedelta(seconds=b))
+                     for status, a, b in reduzir(linhas)]
+        resultado[maquina] = {"segmentos": segmentos, "totais": dict(totais)}
+    return resultado
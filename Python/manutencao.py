@@ -0,0 +1,326 @@
+"""Manutenção automática do banco de produção e métricas de saúde.
+
+O ``producao.db`` roda meses sem ninguém olhar; ``ManutencaoBanco`` é uma
+thread que, de tempos em tempos, faz:
+
+- checkpoint do WAL: ``PASSIVE`` sempre (não espera ninguém) e ``TRUNCATE``
+  quando o banco está quieto, para o ``-wal`` não crescer sem limite;
+- ``incremental_vacuum`` em passos de poucas páginas, devolvendo as páginas
+  livres ao sistema (bancos criados com ``auto_vacuum=INCREMENTAL``);
+- ``ANALYZE`` tabela a tabela, com ``analysis_limit``, e ``PRAGMA optimize``;
+- ``quick_check`` tabela a tabela.
+
+Cada passada trabalha por fatias de ``FATIA_SEG`` (uma tabela, um punhado de
+páginas) e a tarefa continua de onde parou na próxima passada (``parte`` em
+``manutencao``); um ``progress_handler`` interrompe qualquer comando que
+passe de ``COMANDO_MAX_SEG``. As tarefas pesadas só rodam em baixo
+movimento: fábrica parada (janela planejada do calendário ou nenhuma
+máquina produzindo) ou nenhum apontamento de operador há ``QUIETO_SEG``.
+
+Bancos antigos, sem ``auto_vacuum`` incremental, são convertidos por um
+``VACUUM`` completo, só com a fábrica parada, só se houver espaço livre que
+compense e limitado a ``VACUUM_MAX_SEG``; depois dele o índice de busca é
+reconstruído (o VACUUM pode renumerar rowids).
+
+Vários terminais podem rodar a thread: cada tarefa é reservada em
+``manutencao`` (mesmo esquema de lease do ``kpi_lease``) e só um executa.
+"""
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from busca_op import reconstruir_indice_busca
+from calendario import Calendario
+
+FATIA_SEG = 0.25
+COMANDO_MAX_SEG = 2.0
+VACUUM_MAX_SEG = 10.0
+QUIETO_SEG = 60.0
+VERIFICACAO_SEG = 15.0
+RESERVA_SEG = 60.0
+RECARGA_CALENDARIO_SEG = 300.0
+PAGINAS_POR_PASSO = 128
+LIMITE_ANALISE = 1000
+# VACUUM completo só compensa com pelo menos esta fração do arquivo livre.
+LIVRE_MINIMO_VACUUM = 0.10
+# Intervalo entre ciclos completos de cada tarefa.
+INTERVALOS = {
+    "checkpoint": timedelta(minutes=10),
+    "vacuum_incremental": timedelta(hours=1),
+    "estatisticas": timedelta(hours=6),
+    "verificacao": timedelta(days=1),
+    "vacuum_completo": timedelta(days=7),
+}
+# Tarefas que esperam baixo movimento; o VACUUM completo espera a fábrica parada.
+PESADAS = {"vacuum_incremental", "estatisticas", "verificacao", "vacuum_completo"}
+MODOS_AUTO_VACUUM = {0: "NONE", 1: "FULL", 2: "INCREMENTAL"}
+# Consultas quentes do sistema; a saúde mostra se cada uma ainda usa índice.
+CONSULTAS_MONITORADAS = [
+    ("OP ativa da máquina", "SELECT op FROM ordens_producao WHERE status = 'PRODUZINDO' AND maquina = ?"),
+    ("Parada aberta da OP", "SELECT id FROM paradas_log WHERE op = ? AND fim IS NULL"),
+    ("Último apontamento da OP", "SELECT id FROM apontamentos WHERE op = ? AND acao = 'apontar_producao' ORDER BY id DESC LIMIT 1"),
+    ("Linha do tempo da máquina", "SELECT status FROM maquinas_historico WHERE maquina = ? AND inicio >= ?"),
+    ("Pareto do período", "SELECT chave FROM paradas_diario WHERE dimensao = ? AND dia BETWEEN ? AND ?"),
+]
+
+
+def criar_tabela_manutencao(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS manutencao (
+        tarefa TEXT PRIMARY KEY,
+        executado_em TIMESTAMP,
+        parte TEXT,
+        duracao_ms INTEGER,
+        resultado TEXT,
+        dono TEXT,
+        reservado_ate REAL
+    )""")
+    cursor.executemany("INSERT OR IGNORE INTO manutencao (tarefa) VALUES (?)", [(t,) for t in INTERVALOS])
+
+
+def preparar_banco_novo(cursor):
+    """Liga ``auto_vacuum=INCREMENTAL``; só tem efeito antes da primeira tabela ser criada."""
+    cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+
+
+class TempoEsgotado(Exception):
+    """O comando passou do prazo e foi interrompido (e desfeito) pelo SQLite."""
+
+
+@contextmanager
+def prazo(conexao, segundos):
+    """Interrompe qualquer comando da conexão que passar de ``segundos``."""
+    limite = time.monotonic() + segundos
+    conexao.set_progress_handler(lambda: time.monotonic() > limite, 1000)
+    try:
+        yield
+    except sqlite3.OperationalError as e:
+        if "interrupted" in str(e) and time.monotonic() > limite:
+            raise TempoEsgotado() from e
+        raise
+    finally:
+        conexao.set_progress_handler(None, 0)
+
+
+def _tabelas(conexao):
+    """Tabelas comuns, sem as virtuais (FTS) e as tabelas internas delas."""
+    tabelas = conexao.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name").fetchall()
+    virtuais = [nome for nome, sql in tabelas if sql.startswith("CREATE VIRTUAL")]
+    return [nome for nome, sql in tabelas
+            if nome not in virtuais and not any(nome.startswith(v + "_") for v in virtuais)]
+
+
+def checkpoint(conexao, parte, quieto, limite):
+    if conexao.execute("PRAGMA journal_mode").fetchone()[0] != "wal":
+        return None, "sem WAL"
+    ocupado, paginas, copiadas = conexao.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+    if quieto and not ocupado and paginas == copiadas:
+        # Tudo já foi copiado: o TRUNCATE só zera o arquivo, não espera leitores.
+        ocupado, paginas, copiadas = conexao.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+        return None, f"WAL truncado ({copiadas} páginas)"
+    return None, f"{copiadas}/{paginas} páginas copiadas" + (" (leitor ativo)" if ocupado else "")
+
+
+def vacuum_incremental(conexao, parte, quieto, limite):
+    if conexao.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        return None, "auto_vacuum não é INCREMENTAL"
+    inicial = livres = conexao.execute("PRAGMA freelist_count").fetchone()[0]
+    while livres and time.monotonic() < limite:
+        # execute() daria um único passo (uma página); executescript roda o pragma até o fim.
+        conexao.executescript(f"PRAGMA incremental_vacuum({PAGINAS_POR_PASSO})")
+        livres = conexao.execute("PRAGMA freelist_count").fetchone()[0]
+    if livres:
+        return "continua", f"{inicial - livres} páginas devolvidas (continua)"
+    return None, f"{inicial} páginas devolvidas"
+
+
+def _por_tabela(conexao, parte, limite, comando):
+    """Roda ``comando(tabela)`` a partir da tabela seguinte a ``parte`` até acabar a fatia (ao menos uma)."""
+    resultados = []
+    pendentes = [t for t in _tabelas(conexao) if not parte or t > parte]
+    for i, tabela in enumerate(pendentes):
+        if i and time.monotonic() >= limite:
+            return parte, resultados
+        resultados.extend(comando(tabela))
+        parte = tabela
+    return None, resultados
+
+
+def estatisticas(conexao, parte, quieto, limite):
+    conexao.execute(f"PRAGMA analysis_limit={LIMITE_ANALISE}")
+    parte, _ = _por_tabela(conexao, parte, limite, lambda t: conexao.execute(f'ANALYZE "{t}"').fetchall())
+    if parte is None:
+        conexao.execute("PRAGMA optimize")
+        return None, "estatísticas atualizadas"
+    return parte, f"ANALYZE até {parte}"
+
+
+def verificacao(conexao, parte, quieto, limite):
+    def verificar(tabela):
+        linhas = [r[0] for r in conexao.execute(f'PRAGMA quick_check("{tabela}")')]
+        return [] if linhas == ["ok"] else [f"{tabela}: {l}" for l in linhas]
+
+    parte_nova, problemas = _por_tabela(conexao, parte, limite, verificar)
+    if problemas:
+        print("Verificação do banco encontrou problemas:\n" + "\n".join(problemas))
+        return parte_nova, "PROBLEMAS: " + "; ".join(problemas)[:500]
+    return parte_nova, "ok" if parte_nova is None else f"ok até {parte_nova}"
+
+
+def vacuum_completo(conexao, parte, quieto, limite):
+    """VACUUM completo, que converte o banco para auto_vacuum incremental."""
+    auto_vacuum, = conexao.execute("PRAGMA auto_vacuum").fetchone()
+    paginas, = conexao.execute("PRAGMA page_count").fetchone()
+    livres, = conexao.execute("PRAGMA freelist_count").fetchone()
+    if auto_vacuum == 2 or paginas == 0 or livres / paginas < LIVRE_MINIMO_VACUUM:
+        return None, "não necessário"
+    conexao.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conexao.execute("VACUUM")
+    reconstruir_indice_busca(conexao)
+    return None, f"VACUUM completo: {livres} páginas livres devolvidas"
+
+
+TAREFAS = {"checkpoint": checkpoint, "vacuum_incremental": vacuum_incremental, "estatisticas": estatisticas,
+           "verificacao": verificacao, "vacuum_completo": vacuum_completo}
+
+
+def saude(conexao, caminho=None):
+    """Métricas do banco para a tela de administração."""
+    pragma = lambda nome: conexao.execute(f"PRAGMA {nome}").fetchone()[0]
+    tamanho_pagina = pragma("page_size")
+    paginas = pragma("page_count")
+    livres = pragma("freelist_count")
+    wal = None
+    if caminho and os.path.exists(caminho + "-wal"):
+        wal = os.path.getsize(caminho + "-wal")
+
+    try:
+        tamanhos = dict(conexao.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name").fetchall())
+    except sqlite3.OperationalError:
+        tamanhos = {}
+    indices = [{"indice": r["name"], "tabela": r["tbl_name"], "bytes": tamanhos.get(r["name"])}
+               for r in conexao.execute("""
+                   SELECT name, tbl_name FROM sqlite_master WHERE type = 'index' ORDER BY tbl_name, name""")]
+
+    consultas = []
+    for nome, sql in CONSULTAS_MONITORADAS:
+        try:
+            plano = [r["detail"] for r in conexao.execute("EXPLAIN QUERY PLAN " + sql, [None] * sql.count("?"))]
+        except sqlite3.OperationalError as e:
+            plano = [f"indisponível: {e}"]
+        varre = any(p.startswith("SCAN") and "INDEX" not in p for p in plano)
+        consultas.append({"consulta": nome, "plano": "; ".join(plano), "usa_indice": not varre})
+
+    tarefas = [dict(r) for r in conexao.execute("""
+        SELECT tarefa, executado_em AS "executado_em [timestamp]", parte, duracao_ms, resultado
+        FROM manutencao ORDER BY tarefa""")]
+    return {
+        "tamanho_bytes": tamanho_pagina * paginas,
+        "paginas": paginas,
+        "paginas_livres": livres,
+        "livre_pct": livres / paginas * 100 if paginas else 0.0,
+        "wal_bytes": wal,
+        "auto_vacuum": MODOS_AUTO_VACUUM.get(pragma("auto_vacuum"), "?"),
+        "journal_mode": pragma("journal_mode"),
+        "indices": indices,
+        "consultas": consultas,
+        "tarefas": tarefas,
+    }
+
+
+class ManutencaoBanco(threading.Thread):
+    def __init__(self, conectar, verificacao=VERIFICACAO_SEG):
+        super().__init__(name="ManutencaoBanco", daemon=True)
+        self.conectar = conectar
+        self.verificacao = verificacao
+        self.identificador = f"{socket.gethostname()}:{os.getpid()}"
+        self._parar = threading.Event()
+
+    def parar(self):
+        self._parar.set()
+
+    def _reservar(self, conexao, tarefa, agora):
+        """Reserva a tarefa se ela está vencida (ou pela metade) e ninguém a segura."""
+        row = conexao.execute("SELECT executado_em, parte FROM manutencao WHERE tarefa = ?", (tarefa,)).fetchone()
+        if row is None:
+            return None
+        executado_em = row[0]
+        if row[1] is None and executado_em is not None and agora - executado_em < INTERVALOS[tarefa]:
+            return None
+        relogio = time.time()
+        cursor = conexao.execute("""
+            UPDATE manutencao SET dono = ?, reservado_ate = ?
+            WHERE tarefa = ? AND (dono = ? OR reservado_ate IS NULL OR reservado_ate < ?)
+        """, (self.identificador, relogio + RESERVA_SEG, tarefa, self.identificador, relogio))
+        conexao.commit()
+        return row if cursor.rowcount == 1 else None
+
+    def _registrar(self, conexao, tarefa, agora, parte, resultado, duracao):
+        conexao.execute("""
+            UPDATE manutencao SET parte = ?, resultado = ?, duracao_ms = ?, reservado_ate = NULL,
+                executado_em = CASE WHEN ? IS NULL THEN ? ELSE executado_em END
+            WHERE tarefa = ?
+        """, (parte, resultado, round(duracao * 1000), parte, agora, tarefa))
+        conexao.commit()
+
+    def executar(self, conexao, quieto, parada):
+        """Roda uma fatia de cada tarefa vencida que o movimento atual permite."""
+        agora = datetime.now()
+        for tarefa, funcao in TAREFAS.items():
+            if tarefa in PESADAS and not quieto or tarefa == "vacuum_completo" and not parada:
+                continue
+            row = self._reservar(conexao, tarefa, agora)
+            if row is None:
+                continue
+            inicio = time.monotonic()
+            parte = row[1]
+            try:
+                with prazo(conexao, VACUUM_MAX_SEG if tarefa == "vacuum_completo" else COMANDO_MAX_SEG):
+                    parte, resultado = funcao(conexao, parte, quieto, inicio + FATIA_SEG)
+            except TempoEsgotado:
+                # Um VACUUM desfeito espera o próximo ciclo; as outras tarefas repetem a fatia na próxima passada.
+                resultado = "interrompido pelo limite de tempo"
+                if tarefa == "vacuum_completo":
+                    parte = None
+            except sqlite3.Error as e:
+                resultado = f"erro: {e}"
+                parte = None
+            if conexao.in_transaction:
+                conexao.rollback()
+            self._registrar(conexao, tarefa, agora, parte, resultado, time.monotonic() - inicio)
+
+    def run(self):
+        conexao = self.conectar()
+        if not conexao:
+            return
+        conexao.execute("PRAGMA busy_timeout = 100")
+        criar_tabela_manutencao(conexao.cursor())
+        conexao.commit()
+
+        calendario = None
+        ultima_recarga = 0.0
+        while not self._parar.is_set():
+            try:
+                if calendario is None or time.monotonic() - ultima_recarga >= RECARGA_CALENDARIO_SEG:
+                    calendario = Calendario.carregar(conexao)
+                    ultima_recarga = time.monotonic()
+                # Fábrica parada: janela planejada (refeição) ou nenhuma máquina produzindo.
+                parada = (calendario.janela_planejada_em(datetime.now()) is not None or conexao.execute(
+                    "SELECT 1 FROM maquinas_status WHERE status = 'PRODUZINDO' LIMIT 1").fetchone() is None)
+                # O job de KPI grava o tempo todo; o que conta é o operador, visto no diário de apontamentos.
+                ultimo = conexao.execute(
+                    'SELECT registrado_em AS "r [timestamp]" FROM apontamentos ORDER BY id DESC LIMIT 1').fetchone()
+                quieto = (parada or ultimo is None
+                          or (datetime.now() - ultimo[0]).total_seconds() >= QUIETO_SEG)
+                self.executar(conexao, quieto, parada)
+            except sqlite3.Error as e:
+                print(f"Erro na manutenção do banco: {e}")
+                if conexao.in_transaction:
+                    conexao.rollback()
+            self._parar.wait(self.verificacao)
+        conexao.close()
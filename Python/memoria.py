@@ -0,0 +1,255 @@
+"""Telemetria de memória dos terminais que ficam semanas abertos.
+
+``TelemetriaMemoria`` roda no laço do Tk (``after``) e, a cada
+``INTERVALO_SEG``, mede o RSS do processo, o heap Python rastreado pelo
+``tracemalloc`` (agrupado por linha de alocação), o número de widgets e de
+jobs ``after()`` pendentes. A primeira medição depois de ``AQUECIMENTO_SEG``
+vira a base: cada leitura é comparada com a anterior e com a base, gravada
+em ``memoria_terminal`` e impressa; passando de um limite, a leitura sai
+como ALERTA com as linhas que mais cresceram. ``relatorio_heap`` gera o
+relatório completo sob demanda (tela de administração).
+
+Só o resumo por linha fica guardado entre medições (não o snapshot
+inteiro), então a própria telemetria não cresce com o tempo.
+"""
+import linecache
+import os
+import sqlite3
+import sys
+import tracemalloc
+from datetime import datetime, timedelta
+
+INTERVALO_SEG = 10 * 60
+AQUECIMENTO_SEG = 2 * 60
+QUADROS = 1
+RETENCAO = timedelta(days=30)
+LIMITE_CRESCIMENTO_RSS_MB = 50
+LIMITE_CRESCIMENTO_HEAP_MB = 20
+LIMITE_WIDGETS = 2000
+LIMITE_JOBS_AFTER = 50
+TOP_LOG = 5
+TOP_RELATORIO = 30
+PASTA_RELATORIOS = "relatorios_memoria"
+
+_FILTROS = (tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, linecache.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            tracemalloc.Filter(False, "<unknown>"))
+
+
+def criar_tabela_memoria(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS memoria_terminal (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        terminal TEXT NOT NULL,
+        momento TIMESTAMP NOT NULL,
+        rss_kb INTEGER,
+        heap_kb INTEGER,
+        widgets INTEGER,
+        jobs_after INTEGER,
+        alerta TEXT
+    )""")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_memoria_terminal ON memoria_terminal (terminal, momento)")
+
+
+def rss_bytes():
+    """Memória residente do processo (None se a plataforma não informar)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class Contadores(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                        ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                        ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+        contadores = Contadores()
+        contadores.cb = ctypes.sizeof(contadores)
+        processo = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(processo, ctypes.byref(contadores), contadores.cb):
+            return contadores.WorkingSetSize
+    return None
+
+
+def contar_widgets(raiz):
+    pendentes, total = [raiz], 0
+    while pendentes:
+        widget = pendentes.pop()
+        total += 1
+        pendentes.extend(widget.winfo_children())
+    return total
+
+
+def contar_jobs_after(raiz):
+    return len(raiz.tk.splitlist(raiz.tk.call("after", "info")))
+
+
+def _por_linha(snapshot):
+    """Resumo {(arquivo, linha): (bytes, blocos)} do snapshot filtrado."""
+    return {(s.traceback[0].filename, s.traceback[0].lineno): (s.size, s.count)
+            for s in snapshot.filter_traces(_FILTROS).statistics("lineno")}
+
+
+def _crescimentos(atual, anterior, limite):
+    diferencas = []
+    for local, (tamanho, blocos) in atual.items():
+        antes = anterior.get(local, (0, 0))
+        if tamanho > antes[0]:
+            diferencas.append((tamanho - antes[0], blocos - antes[1], tamanho, local))
+    diferencas.sort(reverse=True)
+    return diferencas[:limite]
+
+
+def _mb(valor):
+    return "--" if valor is None else f"{valor / 1024 / 1024:.1f} MB"
+
+
+def _mb_delta(valor):
+    return "" if valor is None else f" ({valor / 1024 / 1024:+.1f} MB)"
+
+
+def _local(local):
+    arquivo, linha = local
+    return f"{os.path.basename(arquivo)}:{linha}"
+
+
+class TelemetriaMemoria:
+    def __init__(self, raiz, terminal, conectar, intervalo_seg=INTERVALO_SEG, quadros=QUADROS):
+        self.raiz = raiz
+        self.terminal = terminal
+        self.conectar = conectar
+        self.intervalo_ms = int(intervalo_seg * 1000)
+        self.quadros = quadros
+        self.base = None
+        self.anterior = None
+        self.ultima = None
+        self._job = None
+
+    def iniciar(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.quadros)
+        self._job = self.raiz.after(AQUECIMENTO_SEG * 1000, self._ciclo)
+
+    def parar(self):
+        if self._job:
+            self.raiz.after_cancel(self._job)
+            self._job = None
+        tracemalloc.stop()
+
+    def medir(self):
+        """Leitura atual, com os maiores crescimentos por linha desde a anterior e desde a base."""
+        por_linha = _por_linha(tracemalloc.take_snapshot())
+        heap = sum(tamanho for tamanho, _ in por_linha.values())
+        leitura = {
+            "momento": datetime.now(),
+            "rss": rss_bytes(),
+            "heap": heap,
+            "heap_pico": tracemalloc.get_traced_memory()[1],
+            "widgets": contar_widgets(self.raiz),
+            "jobs_after": contar_jobs_after(self.raiz),
+            "por_linha": por_linha,
+        }
+        if self.base is None:
+            self.base = leitura
+        leitura["desde_base"] = _crescimentos(por_linha, self.base["por_linha"], TOP_LOG)
+        leitura["desde_anterior"] = _crescimentos(por_linha, (self.anterior or self.base)["por_linha"], TOP_LOG)
+        return leitura
+
+    def alertas(self, leitura):
+        base, alertas = self.base, []
+        if leitura["rss"] is not None and base["rss"] is not None \
+                and leitura["rss"] - base["rss"] > LIMITE_CRESCIMENTO_RSS_MB * 1024 * 1024:
+            alertas.append(f"RSS cresceu {_mb(leitura['rss'] - base['rss'])}")
+        if leitura["heap"] - base["heap"] > LIMITE_CRESCIMENTO_HEAP_MB * 1024 * 1024:
+            alertas.append(f"heap Python cresceu {_mb(leitura['heap'] - base['heap'])}")
+        if leitura["widgets"] > LIMITE_WIDGETS:
+            alertas.append(f"{leitura['widgets']} widgets")
+        if leitura["jobs_after"] > LIMITE_JOBS_AFTER:
+            alertas.append(f"{leitura['jobs_after']} jobs after()")
+        return alertas
+
+    def resumo(self, leitura):
+        base = self.base
+        rss_delta = None if leitura["rss"] is None or base["rss"] is None else leitura["rss"] - base["rss"]
+        return (f"RSS {_mb(leitura['rss'])}{_mb_delta(rss_delta)}, "
+                f"heap Python {_mb(leitura['heap'])}{_mb_delta(leitura['heap'] - base['heap'])}, "
+                f"{leitura['widgets']} widgets, {leitura['jobs_after']} jobs after()")
+
+    def _ciclo(self):
+        try:
+            leitura = self.medir()
+            alertas = self.alertas(leitura)
+            if alertas:
+                print(f"ALERTA memória [{self.terminal}]: {'; '.join(alertas)} — {self.resumo(leitura)}")
+                for delta, blocos, _, local in leitura["desde_base"]:
+                    print(f"    {_local(local)}: +{delta / 1024:.0f} KB ({blocos:+d} blocos) desde a base")
+            else:
+                maiores = ", ".join(f"{_local(local)} +{delta / 1024:.0f} KB"
+                                    for delta, _, _, local in leitura["desde_anterior"][:3])
+                print(f"Memória [{self.terminal}]: {self.resumo(leitura)}"
+                      + (f"; cresceram desde a anterior: {maiores}" if maiores else ""))
+            self._gravar(leitura, "; ".join(alertas) or None)
+            self.anterior, self.ultima = leitura, leitura
+        finally:
+            self._job = self.raiz.after(self.intervalo_ms, self._ciclo)
+
+    def _gravar(self, leitura, alerta):
+        conexao = self.conectar()
+        if not conexao: return
+        try:
+            conexao.execute("""
+                INSERT INTO memoria_terminal (terminal, momento, rss_kb, heap_kb, widgets, jobs_after, alerta)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (self.terminal, leitura["momento"], None if leitura["rss"] is None else leitura["rss"] // 1024,
+                  leitura["heap"] // 1024, leitura["widgets"], leitura["jobs_after"], alerta))
+            conexao.execute("DELETE FROM memoria_terminal WHERE terminal = ? AND momento < ?",
+                            (self.terminal, leitura["momento"] - RETENCAO))
+            conexao.commit()
+        except sqlite3.Error as e:
+            print(f"Erro ao gravar a telemetria de memória: {e}")
+        finally:
+            conexao.close()
+
+    def relatorio_heap(self, pasta=PASTA_RELATORIOS):
+        """Mede agora e grava o relatório completo do heap; devolve o caminho do arquivo."""
+        leitura = self.medir()
+        os.makedirs(pasta, exist_ok=True)
+        caminho = os.path.join(pasta, f"heap_{self.terminal}_{leitura['momento']:%Y%m%d_%H%M%S}.txt")
+        maiores = sorted(leitura["por_linha"].items(), key=lambda item: item[1][0], reverse=True)[:TOP_RELATORIO]
+        crescimentos = _crescimentos(leitura["por_linha"], self.base["por_linha"], TOP_RELATORIO)
+
+        with open(caminho, "w", encoding="utf-8") as f:
+            f.write(f"Terminal {self.terminal} — {leitura['momento']:%d/%m/%Y %H:%M:%S}\n")
+            f.write(f"{self.resumo(leitura)}\n")
+            f.write(f"Pico do heap rastreado: {_mb(leitura['heap_pico'])}   "
+                    f"Base: {self.base['momento']:%d/%m %H:%M}\n")
+            alertas = self.alertas(leitura)
+            if alertas:
+                f.write(f"ALERTA: {'; '.join(alertas)}\n")
+            f.write("\nMaiores alocações por linha:\n")
+            for local, (tamanho, blocos) in maiores:
+                f.write(f"  {tamanho / 1024:10.0f} KB {blocos:8d} blocos  {_local(local)}  "
+                        f"{linecache.getline(local[0], local[1]).strip()}\n")
+            f.write("\nMaior crescimento desde a base:\n")
+            for delta, blocos, tamanho, local in crescimentos:
+                f.write(f"  {delta / 1024:+10.0f} KB {blocos:+8d} blocos  {_local(local)}  "
+                        f"(agora {tamanho / 1024:.0f} KB)\n")
+        self.ultima = leitura
+        return caminho
+
+
+def historico(conexao, limite=50):
+    """Últimas leituras de todos os terminais, mais recentes primeiro."""
+    return conexao.execute("""
+        SELECT terminal, momento AS "momento [timestamp]", rss_kb, heap_kb, widgets, jobs_after, alerta
+        FROM memoria_terminal ORDER BY id DESC LIMIT ?
+    """, (limite,)).fetchall()
@@ -0,0 +1,157 @@
+"""Operações do gestor sobre várias OPs de uma vez (seleção múltipla no painel).
+
+Cada operação é uma única transação ``BEGIN IMMEDIATE`` com SQL por
+conjunto: as OPs escolhidas vão para a tabela temporária ``lote_ops``
+(carregada antes de pegar o lock de escrita) e a validação, as mudanças em
+``ordens_producao``/``maquinas_status``/``paradas_log`` e a anotação no
+diário de apontamentos são poucos comandos sobre esse conjunto, não um
+comando por OP. O lock fica preso por milissegundos mesmo com milhares de
+OPs, e os apontamentos dos operadores só esperam esse tanto.
+
+A validação é tudo ou nada: se alguma OP não está num status em que a
+operação vale, nada é aplicado e ``TransicaoInvalida`` lista as recusadas.
+
+* ``cancelar``: PENDENTE ou PRODUZINDO -> CANCELADA;
+* ``finalizar``: PRODUZINDO (máquina produzindo ou parada) -> FINALIZADA;
+* ``reatribuir_maquina``: troca a máquina de OPs pendentes;
+* ``reprogramar``: troca o prazo, que é a prioridade do sequenciador.
+
+Cancelar ou finalizar uma OP em produção fecha a parada aberta (somando-a
+aos agregados de ``analise_paradas``) e deixa a máquina LIVRE. Só OPs
+pendentes trocam de máquina: as paradas são atribuídas à máquina pela OP,
+e uma OP que já rodou levaria o histórico de paradas junto.
+"""
+from datetime import datetime
+
+import transicoes
+from analise_paradas import registrar_parada_fechada
+from transicoes import TransicaoInvalida
+
+# Status de OP em que cada operação vale, e o texto usado nas recusas.
+PERMITIDOS = {
+    "cancelar": ("PENDENTE", "PRODUZINDO"),
+    "finalizar": ("PRODUZINDO",),
+    "reatribuir_maquina": ("PENDENTE",),
+    "reprogramar": ("PENDENTE", "PRODUZINDO"),
+}
+ACOES = {
+    "cancelar": "cancelar",
+    "finalizar": "finalizar",
+    "reatribuir_maquina": "trocar a máquina de",
+    "reprogramar": "reprogramar",
+}
+# Quantas OPs recusadas aparecem na mensagem.
+LISTAR_RECUSADAS = 10
+
+
+def _carregar(conexao, ops):
+    """Grava a seleção em ``temp.lote_ops`` (fora do lock de escrita). Devolve quantas OPs distintas."""
+    conexao.execute("CREATE TEMP TABLE IF NOT EXISTS lote_ops (op TEXT PRIMARY KEY)")
+    conexao.execute("DELETE FROM temp.lote_ops")
+    conexao.executemany("INSERT OR IGNORE INTO temp.lote_ops (op) VALUES (?)", ((op,) for op in ops))
+    conexao.commit()
+    return conexao.execute("SELECT COUNT(*) FROM temp.lote_ops").fetchone()[0]
+
+
+def _validar(cursor, nome, quantidade):
+    marcadores = ", ".join("?" * len(PERMITIDOS[nome]))
+    recusadas = cursor.execute(f"""
+        SELECT l.op, o.status FROM temp.lote_ops l LEFT JOIN ordens_producao o ON o.op = l.op
+        WHERE o.status IS NULL OR o.status NOT IN ({marcadores})
+        ORDER BY l.op
+    """, PERMITIDOS[nome]).fetchall()
+    if not recusadas:
+        return
+    listadas = ", ".join(f"{r['op']} ({r['status'] or 'não existe'})" for r in recusadas[:LISTAR_RECUSADAS])
+    if len(recusadas) > LISTAR_RECUSADAS:
+        listadas += f" e mais {len(recusadas) - LISTAR_RECUSADAS}"
+    raise TransicaoInvalida(f"Não é possível {ACOES[nome]} {len(recusadas)} das {quantidade} OPs selecionadas "
+                            f"({' ou '.join(PERMITIDOS[nome])} apenas): {listadas}. Nenhuma OP foi alterada.")
+
+
+def _anotar(cursor, acao, agora, operador, terminal, observacao, detalhe, **parametros):
+    """Uma linha no diário por OP do lote; ``detalhe`` é uma expressão SQL sobre ``o`` (a OP antes da mudança)."""
+    cursor.execute(f"""
+        INSERT INTO apontamentos (momento, registrado_em, terminal, operador, acao, op, observacao)
+        SELECT :agora, :registrado_em, :terminal, :operador, :acao, o.op,
+               COALESCE({detalhe} || '; ' || :observacao, {detalhe}, :observacao)
+        FROM temp.lote_ops l JOIN ordens_producao o ON o.op = l.op
+    """, {"agora": agora, "registrado_em": datetime.now(), "terminal": terminal, "operador": operador,
+          "acao": acao, "observacao": observacao, **parametros})
+
+
+def _encerrar(cursor, status, agora):
+    """Fecha as paradas abertas, libera as máquinas e leva as OPs do lote para ``status``."""
+    paradas = cursor.execute("""
+        UPDATE paradas_log SET fim = :agora,
+            duracao_seg = CAST(ROUND((julianday(:agora) - julianday(inicio)) * 86400) AS INTEGER)
+        WHERE fim IS NULL AND op IN (SELECT op FROM temp.lote_ops)
+        RETURNING inicio AS "inicio [timestamp]", motivo, operador,
+            (SELECT maquina FROM ordens_producao o WHERE o.op = paradas_log.op) AS maquina,
+            COALESCE((SELECT planejada FROM motivos_parada m WHERE m.motivo = paradas_log.motivo), 0) AS planejada
+    """, {"agora": agora}).fetchall()
+    for p in paradas:
+        registrar_parada_fechada(cursor, p["maquina"], p["motivo"], p["operador"], p["inicio"], agora, p["planejada"])
+
+    cursor.execute("""
+        UPDATE maquinas_status SET status = 'LIVRE'
+        WHERE status != 'LIVRE' AND maquina IN (
+            SELECT o.maquina FROM temp.lote_ops l JOIN ordens_producao o ON o.op = l.op WHERE o.status = 'PRODUZINDO')
+    """)
+    cursor.execute("UPDATE ordens_producao SET status = ? WHERE op IN (SELECT op FROM temp.lote_ops)", (status,))
+    return len(paradas)
+
+
+def cancelar(conexao, ops, operador, terminal=None, observacao=None, agora=None):
+    """PENDENTE/PRODUZINDO -> CANCELADA. Devolve (OPs canceladas, paradas fechadas)."""
+    agora = agora or datetime.now()
+    quantidade = _carregar(conexao, ops)
+    with transicoes.transacao(conexao, "lote_cancelar") as cursor:
+        _validar(cursor, "cancelar", quantidade)
+        _anotar(cursor, "cancelar", agora, operador, terminal, observacao,
+                "'cancelada em lote (estava ' || o.status || ', ' || o.produzido || '/' || o.planejado || ')'")
+        return quantidade, _encerrar(cursor, "CANCELADA", agora)
+
+
+def finalizar(conexao, ops, operador, terminal=None, observacao=None, agora=None):
+    """PRODUZINDO -> FINALIZADA, com a máquina produzindo ou parada. Devolve (OPs finalizadas, paradas fechadas)."""
+    agora = agora or datetime.now()
+    quantidade = _carregar(conexao, ops)
+    with transicoes.transacao(conexao, "lote_finalizar") as cursor:
+        _validar(cursor, "finalizar", quantidade)
+        _anotar(cursor, "finalizar", agora, operador, terminal, observacao,
+                "'finalizada em lote com ' || o.produzido || '/' || o.planejado")
+        return quantidade, _encerrar(cursor, "FINALIZADA", agora)
+
+
+def reatribuir_maquina(conexao, ops, maquina, operador, terminal=None, observacao=None, agora=None):
+    """Passa OPs pendentes para ``maquina`` (cadastrada LIVRE se for nova). Devolve quantas OPs."""
+    maquina = (maquina or "").strip()
+    if not maquina:
+        raise ValueError("Informe a máquina de destino.")
+    agora = agora or datetime.now()
+    quantidade = _carregar(conexao, ops)
+    with transicoes.transacao(conexao, "lote_reatribuir_maquina") as cursor:
+        _validar(cursor, "reatribuir_maquina", quantidade)
+        _anotar(cursor, "reatribuir_maquina", agora, operador, terminal, observacao,
+                "'máquina ' || o.maquina || ' -> ' || :destino", destino=maquina)
+        cursor.execute("INSERT OR IGNORE INTO maquinas_status (maquina, status) VALUES (?, 'LIVRE')", (maquina,))
+        cursor.execute("""
+            UPDATE ordens_producao SET maquina = ?
+            WHERE op IN (SELECT op FROM temp.lote_ops) AND maquina != ?
+        """, (maquina, maquina))
+    return quantidade
+
+
+def reprogramar(conexao, ops, prazo, operador, terminal=None, observacao=None, agora=None):
+    """Troca o prazo de OPs em aberto (None tira o prazo). Devolve quantas OPs."""
+    agora = agora or datetime.now()
+    quantidade = _carregar(conexao, ops)
+    with transicoes.transacao(conexao, "lote_reprogramar") as cursor:
+        _validar(cursor, "reprogramar", quantidade)
+        _anotar(cursor, "reprogramar", agora, operador, terminal, observacao,
+                "'prazo ' || COALESCE(strftime('%d/%m/%Y', o.prazo), 'sem prazo') || ' -> ' || :destino",
+                destino=f"{prazo:%d/%m/%Y}" if prazo else "sem prazo")
+        cursor.execute("UPDATE ordens_producao SET prazo = ? WHERE op IN (SELECT op FROM temp.lote_ops)", (prazo,))
+    return quantidade
+
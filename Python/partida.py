@@ -0,0 +1,235 @@
+"""Partida rápida do terminal: medição das etapas e recuperação depois de queda.
+
+``Cronometro`` mede cada etapa até a tela de login ficar interativa; o total
+é comparado com ``ORCAMENTO_PARTIDA_MS`` e mostrado no console e na tela de
+saúde do banco.
+
+``terminais`` guarda uma sessão por (terminal, pid): uma segunda instância
+no mesmo PC é outra sessão, não uma queda. A sessão aberta é renovada a
+cada ``SESSAO_RENOVACAO_SEG`` (``renovar_sessao``); a que ficou sem
+renovar por ``SESSAO_VIVA`` e nunca chegou a ``encerrar_sessao`` caiu.
+``abrir_sessao`` devolve se uma sessão anterior deste terminal caiu. Depois
+de uma queda de energia, ``recuperar`` reconcilia o banco, sempre partindo
+dos índices (paradas abertas pelo índice parcial ``fim IS NULL``, OPs em
+produção por ``status``, último apontamento da OP por ``(op, id)``), sem
+varrer histórico:
+
+- parada aberta de OP que não está mais parada é fechada quando a máquina
+  saiu de PARADA (``maquinas_historico``) e entra nos agregados;
+- máquina PARADA sem parada aberta ganha uma, com ``MOTIVO_RECUPERACAO``,
+  desde que a máquina parou;
+- máquina PRODUZINDO sem OP em produção volta a LIVRE;
+- máquina PRODUZINDO sem terminal é parada com ``MOTIVO_QUEDA`` desde o
+  último apontamento; o operador retoma quando voltar. O dono da OP é o
+  terminal do último apontamento de operador (``ACOES_OPERADOR``): ações do
+  gestor (reprogramar, estornar, corrigir motivo) não contam. A OP fica sem
+  terminal se nenhuma sessão do dono está viva e a última caiu: a deste
+  terminal, já nesta partida; a de outro PC, só depois de ``SEM_TERMINAL_MAX``
+  (um terminal sem rede continua apontando no diário local).
+
+Tudo numa transação e anotado no diário de ``apontamentos``.
+"""
+import os
+import time
+from datetime import datetime, timedelta
+
+import transicoes
+from analise_paradas import registrar_parada_fechada
+
+ORCAMENTO_PARTIDA_MS = 300
+MOTIVO_QUEDA = "Queda do terminal (recuperação)"
+MOTIVO_RECUPERACAO = "Sem apontamento (recuperação)"
+OPERADOR_SISTEMA = "sistema"
+SESSAO_RENOVACAO_SEG = 10
+# Sessão sem renovar por mais que isso não está rodando (caiu, ou está sem acesso ao banco).
+SESSAO_VIVA = timedelta(seconds=3 * SESSAO_RENOVACAO_SEG)
+# OP de terminal de outro PC que caiu e não voltou por mais que isso é parada por quem partir.
+SEM_TERMINAL_MAX = timedelta(hours=12)
+# Sessões encerradas ficam esse tempo em ``terminais``.
+RETENCAO_SESSOES = timedelta(days=30)
+# Só o que o operador faz na OP indica qual terminal a está rodando.
+ACOES_OPERADOR = ("iniciar", "apontar_producao", "parar", "retomar")
+
+
+class Cronometro:
+    def __init__(self, inicio=None):
+        self.inicio = time.perf_counter() if inicio is None else inicio
+        self._marca = self.inicio
+        self.etapas = []
+
+    def etapa(self, nome):
+        agora = time.perf_counter()
+        self.etapas.append((nome, (agora - self._marca) * 1000))
+        self._marca = agora
+
+    def total_ms(self):
+        return (self._marca - self.inicio) * 1000
+
+    def resumo(self):
+        etapas = ", ".join(f"{nome} {ms:.0f}" for nome, ms in self.etapas)
+        aviso = "" if self.total_ms() <= ORCAMENTO_PARTIDA_MS else f" — acima do orçamento de {ORCAMENTO_PARTIDA_MS} ms"
+        return f"Partida em {self.total_ms():.0f} ms ({etapas}){aviso}"
+
+
+def criar_tabela_terminais(cursor):
+    colunas = {r[1] for r in cursor.execute("PRAGMA table_info(terminais)").fetchall()}
+    if colunas and "visto_em" not in colunas:
+        # Layout antigo, uma linha por terminal: passa a ser uma sessão por (terminal, pid).
+        cursor.execute("ALTER TABLE terminais RENAME TO terminais_antiga")
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS terminais (
+        terminal TEXT NOT NULL,
+        pid INTEGER NOT NULL,
+        iniciado_em TIMESTAMP,
+        visto_em TIMESTAMP,
+        encerrado_em TIMESTAMP,
+        partida_ms INTEGER,
+        PRIMARY KEY (terminal, pid)
+    )""")
+    if colunas and "visto_em" not in colunas:
+        cursor.execute("""
+            INSERT INTO terminais (terminal, pid, iniciado_em, visto_em, encerrado_em, partida_ms)
+            SELECT terminal, COALESCE(pid, 0), iniciado_em, iniciado_em, encerrado_em, partida_ms FROM terminais_antiga
+        """)
+        cursor.execute("DROP TABLE terminais_antiga")
+    cursor.executemany("INSERT OR IGNORE INTO motivos_parada (motivo) VALUES (?)",
+                       [(MOTIVO_QUEDA,), (MOTIVO_RECUPERACAO,)])
+
+
+def abrir_sessao(conexao, terminal, agora=None):
+    """Registra a sessão (terminal, pid); devolve True se uma sessão anterior deste terminal caiu sem encerrar.
+
+    As sessões caídas deste terminal são apagadas: a queda é tratada uma vez, nesta partida.
+    """
+    agora = agora or datetime.now()
+    with transicoes.transacao(conexao, "abrir_sessao") as cursor:
+        caiu = cursor.execute("""
+            DELETE FROM terminais WHERE terminal = ? AND encerrado_em IS NULL AND visto_em < ?
+        """, (terminal, agora - SESSAO_VIVA)).rowcount > 0
+        cursor.execute("DELETE FROM terminais WHERE encerrado_em < ?", (agora - RETENCAO_SESSOES,))
+        cursor.execute("""
+            INSERT OR REPLACE INTO terminais (terminal, pid, iniciado_em, visto_em) VALUES (?, ?, ?, ?)
+        """, (terminal, os.getpid(), agora, agora))
+    return caiu
+
+
+def renovar_sessao(conexao, terminal):
+    conexao.execute("UPDATE terminais SET visto_em = ? WHERE terminal = ? AND pid = ?",
+                    (datetime.now(), terminal, os.getpid()))
+    conexao.commit()
+
+
+def registrar_partida(conexao, terminal, partida_ms):
+    conexao.execute("UPDATE terminais SET partida_ms = ? WHERE terminal = ? AND pid = ?",
+                    (round(partida_ms), terminal, os.getpid()))
+    conexao.commit()
+
+
+def encerrar_sessao(conexao, terminal):
+    conexao.execute("UPDATE terminais SET encerrado_em = ? WHERE terminal = ? AND pid = ?",
+                    (datetime.now(), terminal, os.getpid()))
+    conexao.commit()
+
+
+def _saida_de_parada(cursor, maquina, desde):
+    """Quando a máquina deixou de estar PARADA depois de ``desde`` (``idx_historico_maquina``)."""
+    row = cursor.execute("""
+        SELECT inicio AS "inicio [timestamp]" FROM maquinas_historico
+        WHERE maquina = ? AND inicio > ? AND status != 'PARADA' ORDER BY inicio LIMIT 1
+    """, (maquina, desde)).fetchone()
+    return row["inicio"] if row else None
+
+
+def _entrada_em_parada(cursor, maquina):
+    row = cursor.execute("""
+        SELECT inicio AS "inicio [timestamp]", status FROM maquinas_historico
+        WHERE maquina = ? ORDER BY inicio DESC, id DESC LIMIT 1
+    """, (maquina,)).fetchone()
+    return row["inicio"] if row and row["status"] == "PARADA" else None
+
+
+def _ultimo_apontamento(cursor, op):
+    """Último apontamento de operador na OP: o terminal dele é o dono da OP."""
+    return cursor.execute(f"""
+        SELECT terminal, registrado_em AS "registrado_em [timestamp]" FROM apontamentos
+        WHERE op = ? AND acao IN ({", ".join("?" * len(ACOES_OPERADOR))}) ORDER BY id DESC LIMIT 1
+    """, (op, *ACOES_OPERADOR)).fetchone()
+
+
+def _sem_terminal(cursor, dono, terminal, sessao_caiu, agora):
+    """Se nenhuma sessão de ``dono`` (fora esta) está rodando e a última caiu."""
+    if dono is None:
+        return False
+    sessoes = cursor.execute("""
+        SELECT visto_em AS "visto_em [timestamp]", encerrado_em FROM terminais
+        WHERE terminal = ? AND NOT (terminal = ? AND pid = ?)
+        ORDER BY visto_em DESC
+    """, (dono, terminal, os.getpid())).fetchall()
+    if any(s["encerrado_em"] is None and s["visto_em"] >= agora - SESSAO_VIVA for s in sessoes):
+        return False
+    if dono == terminal:
+        return sessao_caiu
+    return bool(sessoes) and sessoes[0]["encerrado_em"] is None and sessoes[0]["visto_em"] < agora - SEM_TERMINAL_MAX
+
+
+def recuperar(conexao, terminal, sessao_caiu, agora=None):
+    """Reconcilia paradas e estados de máquina; devolve a lista do que foi corrigido."""
+    agora = agora or datetime.now()
+    acoes = []
+    with transicoes.transacao(conexao, "recuperacao") as cursor:
+        def anotar(op, quando, observacao, **campos):
+            # ``quando`` é o instante da correção (fim ou início da parada), para o diário refazer paradas_log.
+            transicoes.anotar(cursor, "recuperacao", op, quando, operador=OPERADOR_SISTEMA, terminal=terminal,
+                              observacao=observacao, **campos)
+            acoes.append(f"{op}: {observacao}")
+
+        abertas = cursor.execute("""
+            SELECT p.id, p.op, p.motivo, p.operador, p.inicio AS "inicio [timestamp]", o.maquina,
+                   o.status AS status_op, m.status AS status_maquina,
+                   COALESCE((SELECT planejada FROM motivos_parada mp WHERE mp.motivo = p.motivo), 0) AS planejada
+            FROM paradas_log p
+            JOIN ordens_producao o ON o.op = p.op
+            LEFT JOIN maquinas_status m ON m.maquina = o.maquina
+            WHERE p.fim IS NULL
+            ORDER BY p.id DESC
+        """).fetchall()
+        validas = set()
+        for p in abertas:
+            if p["status_op"] == "PRODUZINDO" and p["status_maquina"] == "PARADA" and p["op"] not in validas:
+                validas.add(p["op"])
+                continue
+            fim = _saida_de_parada(cursor, p["maquina"], p["inicio"]) or p["inicio"]
+            cursor.execute("""
+                UPDATE paradas_log SET fim = :fim,
+                    duracao_seg = CAST(ROUND((julianday(:fim) - julianday(inicio)) * 86400) AS INTEGER)
+                WHERE id = :id
+            """, {"fim": fim, "id": p["id"]})
+            registrar_parada_fechada(cursor, p["maquina"], p["motivo"], p["operador"], p["inicio"], fim, p["planejada"])
+            anotar(p["op"], fim, f"parada aberta sem máquina parada fechada em {fim:%d/%m %H:%M}", parada_id=p["id"])
+
+        maquinas = cursor.execute("""
+            SELECT m.maquina, m.status, o.op FROM maquinas_status m
+            LEFT JOIN ordens_producao o ON o.maquina = m.maquina AND o.status = 'PRODUZINDO'
+            WHERE m.status IN ('PRODUZINDO', 'PARADA')
+        """).fetchall()
+        for m in maquinas:
+            if m["op"] is None:
+                cursor.execute("UPDATE maquinas_status SET status = 'LIVRE' WHERE maquina = ?", (m["maquina"],))
+                acoes.append(f"{m['maquina']}: {m['status']} sem OP em produção, liberada")
+            elif m["status"] == "PARADA" and m["op"] not in validas:
+                inicio = _entrada_em_parada(cursor, m["maquina"]) or agora
+                cursor.execute("INSERT INTO paradas_log (op, motivo, inicio, operador) VALUES (?, ?, ?, ?)",
+                               (m["op"], MOTIVO_RECUPERACAO, inicio, OPERADOR_SISTEMA))
+                anotar(m["op"], inicio, f"máquina parada sem registro, parada aberta desde {inicio:%d/%m %H:%M}",
+                       motivo=MOTIVO_RECUPERACAO, parada_id=cursor.lastrowid)
+            elif m["status"] == "PRODUZINDO":
+                ultimo = _ultimo_apontamento(cursor, m["op"])
+                if ultimo is None:
+                    continue
+                if _sem_terminal(cursor, ultimo["terminal"], terminal, sessao_caiu, agora):
+                    transicoes.aplicar(cursor, "parar", m["op"], motivo=MOTIVO_QUEDA, operador=OPERADOR_SISTEMA,
+                                       agora=ultimo["registrado_em"], terminal=terminal)
+                    acoes.append(f"{m['op']}: em produção sem terminal, parada desde "
+                                 f"{ultimo['registrado_em']:%d/%m %H:%M}")
+    return acoes
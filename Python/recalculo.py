@@ -0,0 +1,284 @@
+"""Recálculo retroativo dos agregados derivados depois de mudar um cadastro.
+
+Reclassificar um motivo como planejado (ou não) muda o tipo de todas as
+paradas antigas com aquele motivo, mas ``paradas_diario``/``paradas_total``
+(Pareto e MTBF/MTTR) foram somados com a classificação da época.
+``agendar`` registra um recálculo para um período e um conjunto de máquinas
+em ``recalculos``, com uma partição (máquina, dia) por par em
+``recalculo_particoes``; ``executar`` processa as partições pendentes:
+
+* o banco é copiado uma vez para um snapshot somente-leitura (como em
+  ``relatorios``) e as partições, agrupadas por máquina em blocos de até
+  ``DIAS_POR_TAREFA`` dias, vão para um pool de processos que só lê do
+  snapshot e devolve as linhas de ``paradas_diario`` de cada dia;
+* o processo principal grava cada bloco numa transação curta: apaga e
+  regrava os dias do bloco e marca as partições como concluídas. Se o
+  processo cair no meio, ``executar`` de novo continua das pendentes;
+* máquinas com paradas fechadas, estornadas ou corrigidas depois do
+  snapshot (apontamentos acima da marca do snapshot), ou qualquer máquina se
+  o cadastro de motivos mudou, não usam o resultado do worker: o bloco é
+  refeito ali, com o lock na mão, a partir do banco vivo. Nenhuma parada
+  somada em tempo real durante o recálculo se perde;
+* no fim, ``paradas_total`` é refeito a partir de ``paradas_diario``, uma
+  transação por máquina.
+
+O ``kpi_snapshot`` não é recalculado aqui: o ``AtualizadorKPI`` do dono do
+lease vê as escritas (``PRAGMA data_version``) e refaz as linhas com os
+estimadores de ritmo que só ele tem em memória; recalcular daqui apagaria
+``taxa_hora``, ``previsao_termino`` e ``alerta_ritmo``.
+
+OEE, desempenho e relatórios não são guardados: saem de ``ordens_producao``
+(``meta_hora``) e ``paradas_log`` na hora da consulta. ``corrigir_meta_hora``
+só corrige as OPs do produto; os relatórios já gerados precisam ser gerados
+de novo para o período.
+
+Uso: python recalculo.py 2025-01-01 2025-12-31 [--maquinas "Linha 1" "Linha 2"] [--processos N]
+     python recalculo.py --reclassificar "Troca de ferramenta" --planejada
+     python recalculo.py --meta-hora "Peça X" 120
+     python recalculo.py --retomar
+"""
+import argparse
+import os
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import transicoes
+from analise_paradas import linhas_diario, recalcular_totais, somar_diario
+from replica import conectar_replica
+
+# Dias de uma máquina gravados por transação: uma semana segura o lock por poucos milissegundos.
+DIAS_POR_TAREFA = 7
+# Folga entre blocos para os apontamentos pegarem o lock: sem ela, quem espera (busy_timeout
+# dorme em passos de até 100 ms) perde a vez para o próximo bloco.
+PAUSA_ENTRE_BLOCOS_SEG = 0.02
+# Ações do diário que não mexem em parada fechada: não sujam o resultado do snapshot.
+ACOES_SEM_PARADA = ("apontar_producao", "iniciar", "parar", "abertura", "reprogramar", "reatribuir_maquina")
+
+
+def criar_tabelas_recalculo(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS recalculos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        pedido_em TIMESTAMP NOT NULL,
+        motivo TEXT,
+        dia_inicio TEXT NOT NULL,
+        dia_fim TEXT NOT NULL,
+        concluido_em TIMESTAMP
+    )""")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS recalculo_particoes (
+        recalculo INTEGER NOT NULL REFERENCES recalculos (id),
+        maquina TEXT NOT NULL,
+        dia TEXT NOT NULL,
+        concluida_em TIMESTAMP,
+        PRIMARY KEY (recalculo, maquina, dia)
+    )""")
+
+
+def _dias(dia_inicio, dia_fim):
+    inicio = datetime.strptime(dia_inicio, "%Y-%m-%d")
+    fim = min(datetime.strptime(dia_fim, "%Y-%m-%d"), datetime.now())
+    return [(inicio + timedelta(days=i)).strftime("%Y-%m-%d") for i in range((fim - inicio).days + 1)]
+
+
+def agendar(conexao, dia_inicio, dia_fim, maquinas=None, motivo=None):
+    """Registra o recálculo de [dia_inicio, dia_fim] ('AAAA-MM-DD') para as máquinas (ou todas). Devolve o id."""
+    from relatorios import maquinas_cadastradas  # ProcessPool/multiprocessing fora da partida
+
+    maquinas = list(maquinas) if maquinas is not None else maquinas_cadastradas(conexao)
+    dias = _dias(dia_inicio, dia_fim)
+    with transicoes.transacao(conexao, "agendar_recalculo") as cursor:
+        cursor.execute("INSERT INTO recalculos (pedido_em, motivo, dia_inicio, dia_fim) VALUES (?, ?, ?, ?)",
+                       (datetime.now(), motivo, dia_inicio, dia_fim))
+        recalculo = cursor.lastrowid
+        cursor.executemany("INSERT INTO recalculo_particoes (recalculo, maquina, dia) VALUES (?, ?, ?)",
+                           [(recalculo, maquina, dia) for maquina in maquinas for dia in dias])
+    return recalculo
+
+
+def pendentes(conexao):
+    """Recálculos não concluídos, com o total de partições e quantas faltam."""
+    return conexao.execute("""
+        SELECT r.id, r.pedido_em AS "pedido_em [timestamp]", r.motivo, r.dia_inicio, r.dia_fim,
+               COUNT(p.dia) AS particoes, COUNT(p.dia) - COUNT(p.concluida_em) AS faltam
+        FROM recalculos r LEFT JOIN recalculo_particoes p ON p.recalculo = r.id
+        WHERE r.concluido_em IS NULL GROUP BY r.id ORDER BY r.id
+    """).fetchall()
+
+
+def _tarefas(conexao, recalculo, dias_por_tarefa):
+    por_maquina = defaultdict(list)
+    for row in conexao.execute("""
+        SELECT maquina, dia FROM recalculo_particoes
+        WHERE recalculo = ? AND concluida_em IS NULL ORDER BY maquina, dia
+    """, (recalculo,)):
+        por_maquina[row["maquina"]].append(row["dia"])
+    return [(maquina, dias[i:i + dias_por_tarefa])
+            for maquina, dias in por_maquina.items() for i in range(0, len(dias), dias_por_tarefa)]
+
+
+def _linhas_bloco(cursor, maquina, dias):
+    """Linhas de ``paradas_diario`` da máquina nos ``dias`` do bloco (em ordem, não necessariamente seguidos)."""
+    escolhidos = set(dias)
+    return [linha for linha in linhas_diario(cursor, [maquina], dias[0], dias[-1]) if linha[0] in escolhidos]
+
+
+def _versao_motivos(conexao):
+    row = conexao.execute("SELECT versao FROM versoes_cadastro WHERE tabela = 'motivos_parada'").fetchone()
+    return row and row[0]
+
+
+def _marca(conexao):
+    """Último apontamento e versão do cadastro de motivos: o que o snapshot já contém."""
+    return conexao.execute("SELECT COALESCE(MAX(id), 0) FROM apontamentos").fetchone()[0], _versao_motivos(conexao)
+
+
+def _mudou_depois(cursor, maquina, marca):
+    ultimo, versao_motivos = marca
+    if _versao_motivos(cursor) != versao_motivos:
+        return True
+    marcadores = ", ".join("?" * len(ACOES_SEM_PARADA))
+    return cursor.execute(f"""
+        SELECT 1 FROM apontamentos a JOIN ordens_producao o ON o.op = a.op
+        WHERE a.id > ? AND o.maquina = ? AND a.acao NOT IN ({marcadores}) LIMIT 1
+    """, (ultimo, maquina, *ACOES_SEM_PARADA)).fetchone() is not None
+
+
+def _gravar_bloco(conexao, recalculo, maquina, dias, linhas, marca):
+    """Troca os dias do bloco em ``paradas_diario`` e marca as partições, tudo numa transação."""
+    with transicoes.transacao(conexao, "recalculo_bloco") as cursor:
+        refeito = _mudou_depois(cursor, maquina, marca)
+        if refeito:
+            linhas = _linhas_bloco(cursor, maquina, dias)
+        cursor.executemany("DELETE FROM paradas_diario WHERE dia = ? AND maquina = ?", [(dia, maquina) for dia in dias])
+        somar_diario(cursor, linhas)
+        agora = datetime.now()
+        cursor.executemany("""
+            UPDATE recalculo_particoes SET concluida_em = ? WHERE recalculo = ? AND maquina = ? AND dia = ?
+        """, [(agora, recalculo, maquina, dia) for dia in dias])
+    return refeito
+
+
+_CONEXAO = None
+
+
+def _iniciar_worker(snapshot):
+    global _CONEXAO
+    _CONEXAO = conectar_replica(snapshot)
+
+
+def _calcular_tarefa(tarefa):
+    maquina, dias = tarefa
+    return maquina, dias, _linhas_bloco(_CONEXAO.cursor(), maquina, dias)
+
+
+def executar(conectar, alvo, recalculo, processos=None, dias_por_tarefa=DIAS_POR_TAREFA):
+    """Processa as partições pendentes do recálculo. ``alvo`` é o caminho (ou URI) do banco para o snapshot.
+
+    Devolve (partições gravadas, blocos refeitos no banco vivo, segundos gastos).
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from relatorios import criar_snapshot
+
+    inicio = time.perf_counter()
+    conexao = conectar()
+    if not conexao: return None
+    try:
+        tarefas = _tarefas(conexao, recalculo, dias_por_tarefa)
+        gravadas = refeitos = 0
+        if tarefas:
+            with tempfile.TemporaryDirectory() as temporaria:
+                snapshot = criar_snapshot(alvo, os.path.join(temporaria, "snapshot.db"))
+                leitura = conectar_replica(snapshot)
+                marca = _marca(leitura)
+                leitura.close()
+
+                processos = max(1, min(processos or os.cpu_count() or 1, len(tarefas)))
+                with ProcessPoolExecutor(max_workers=processos, initializer=_iniciar_worker,
+                                         initargs=(snapshot,)) as pool:
+                    for maquina, dias, linhas in pool.map(_calcular_tarefa, tarefas):
+                        refeitos += _gravar_bloco(conexao, recalculo, maquina, dias, linhas, marca)
+                        gravadas += len(dias)
+                        time.sleep(PAUSA_ENTRE_BLOCOS_SEG)
+
+        maquinas = [r[0] for r in conexao.execute(
+            "SELECT DISTINCT maquina FROM recalculo_particoes WHERE recalculo = ?", (recalculo,))]
+        for maquina in maquinas:
+            with transicoes.transacao(conexao, "recalculo_totais") as cursor:
+                recalcular_totais(cursor, [maquina])
+        with transicoes.transacao(conexao, "recalculo_concluido") as cursor:
+            cursor.execute("UPDATE recalculos SET concluido_em = ? WHERE id = ?", (datetime.now(), recalculo))
+        return gravadas, refeitos, time.perf_counter() - inicio
+    finally:
+        conexao.close()
+
+
+def reclassificar_motivo(conexao, motivo, planejada):
+    """Muda o motivo para planejado/não planejado e agenda o recálculo de onde ele aparece. Devolve o id ou None."""
+    with transicoes.transacao(conexao, "reclassificar_motivo") as cursor:
+        if cursor.execute("UPDATE motivos_parada SET planejada = ? WHERE motivo = ? AND planejada != ?",
+                          (int(planejada), motivo, int(planejada))).rowcount == 0:
+            return None
+        alcance = cursor.execute("""
+            SELECT MIN(dia), MAX(dia) FROM paradas_diario WHERE dimensao = 'motivo' AND chave = ?
+        """, (motivo,)).fetchone()
+        maquinas = [r[0] for r in cursor.execute(
+            "SELECT DISTINCT maquina FROM paradas_diario WHERE dimensao = 'motivo' AND chave = ?", (motivo,))]
+    if alcance[0] is None:
+        return None
+    tipo = "planejada" if planejada else "não planejada"
+    return agendar(conexao, alcance[0], alcance[1], maquinas, f"motivo '{motivo}' reclassificado como {tipo}")
+
+
+def corrigir_meta_hora(conexao, produto, meta_hora):
+    """Corrige a meta/hora de todas as OPs do produto. Devolve quantas OPs mudaram."""
+    with transicoes.transacao(conexao, "corrigir_meta_hora") as cursor:
+        return cursor.execute("UPDATE ordens_producao SET meta_hora = ? WHERE produto = ? AND meta_hora != ?",
+                              (meta_hora, produto, meta_hora)).rowcount
+
+
+def main():
+    from codigofinal import BANCO, conectar_db, inicializar_db
+
+    parser = argparse.ArgumentParser(description="Recálculo dos agregados de paradas por máquina e dia.")
+    parser.add_argument("dia_inicio", nargs="?", help="AAAA-MM-DD")
+    parser.add_argument("dia_fim", nargs="?", help="AAAA-MM-DD (padrão: o próprio dia_inicio)")
+    parser.add_argument("--maquinas", nargs="+", default=None)
+    parser.add_argument("--processos", type=int, default=None)
+    parser.add_argument("--reclassificar", metavar="MOTIVO", help="Reclassifica o motivo e recalcula onde ele aparece.")
+    parser.add_argument("--planejada", action="store_true", help="Com --reclassificar: passa a ser planejada.")
+    parser.add_argument("--meta-hora", nargs=2, metavar=("PRODUTO", "VALOR"),
+                        help="Corrige a meta/hora de todas as OPs do produto.")
+    parser.add_argument("--retomar", action="store_true", help="Só continua os recálculos pendentes.")
+    args = parser.parse_args()
+    if args.meta_hora:
+        produto, valor = args.meta_hora
+        if not valor.isdigit() or int(valor) <= 0:
+            parser.error("VALOR de --meta-hora deve ser um inteiro positivo")
+
+    inicializar_db()
+    conexao = conectar_db()
+    if not conexao: return
+    if args.meta_hora:
+        print(f"{corrigir_meta_hora(conexao, produto, int(valor))} OPs de '{produto}' corrigidas.")
+    elif args.reclassificar:
+        if reclassificar_motivo(conexao, args.reclassificar, args.planejada) is None:
+            print(f"Motivo '{args.reclassificar}' sem mudança ou sem paradas somadas.")
+    elif args.dia_inicio:
+        agendar(conexao, args.dia_inicio, args.dia_fim or args.dia_inicio, args.maquinas, "manual")
+    elif not args.retomar:
+        parser.error("informe o período, --reclassificar, --meta-hora ou --retomar")
+    fila = pendentes(conexao)
+    conexao.close()
+
+    for row in fila:
+        print(f"Recálculo {row['id']} ({row['motivo'] or 'sem motivo'}): {row['dia_inicio']} a {row['dia_fim']}, "
+              f"{row['faltam']} de {row['particoes']} partições pendentes")
+        gravadas, refeitos, duracao = executar(conectar_db, BANCO.alvo, row["id"], args.processos)
+        print(f"  {gravadas} partições em {duracao:.1f}s ({refeitos} blocos refeitos no banco vivo)")
+
+
+if __name__ == "__main__":
+    main()
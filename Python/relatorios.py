@@ -0,0 +1,387 @@
+"""Relatórios de turno e de dia por máquina, em HTML e CSV.
+
+Cada relatório traz produção, OEE, paradas por motivo e andamento das OPs,
+por turno (cadastro ``turnos``) e para o dia inteiro. Para regerar um mês
+inteiro, o banco é copiado uma vez para um snapshot somente-leitura e cada
+par (máquina, dia) vira uma tarefa de um pool de processos; os workers só
+leem do snapshot e gravam o HTML da sua tarefa, e o processo principal junta
+os CSVs consolidados e o índice.
+
+As peças de cada período saem do diário ``apontamentos``: cada
+``apontar_producao`` conta no período do seu ``momento`` e o ``estorno``
+desconta no período do apontamento que compensa. O saldo de ``abertura``
+(produção anterior ao diário) não tem instante e não entra em nenhum período.
+
+Com vários sites (``sites.json``), todos entram no mesmo pool: um snapshot
+por site, tarefas (site, máquina, dia) e CSVs consolidados com a coluna ``site``.
+
+Uso: python relatorios.py 2025-06 [--db producao.db] [--pasta relatorios] [--processos N]
+     python relatorios.py 2025-06-14   (um dia só)
+     python relatorios.py 2025-06 --sites sites.json
+"""
+import argparse
+import csv
+import html
+import os
+import re
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+from calendario import Calendario
+from replica import conectar_replica
+from sites import RegistroSites
+
+PASTA_PADRAO = "relatorios"
+ROTULO_DIA = "Dia"
+
+COLUNAS_RESUMO = ("dia", "maquina", "periodo", "inicio", "fim", "pecas", "produzindo_seg", "parada_seg",
+                  "planejado_seg", "disponibilidade", "performance", "oee")
+COLUNAS_PARADAS = ("dia", "maquina", "periodo", "motivo", "planejada", "quantidade", "total_seg")
+COLUNAS_OPS = ("dia", "maquina", "periodo", "op", "produto", "pecas", "produzido", "planejado", "progresso", "status")
+
+
+def criar_snapshot(caminho_db, destino):
+    """Copia o banco com a API de backup para um arquivo que os workers abrem só para leitura."""
+    # Aceita também uma URI pronta (banco em memória compartilhada).
+    uri = caminho_db if caminho_db.startswith("file:") else f"file:{caminho_db}?mode=ro"
+    origem = sqlite3.connect(uri, uri=True)
+    copia = sqlite3.connect(destino)
+    origem.backup(copia)
+    origem.close()
+    # Sem WAL, a cópia abre em mode=ro sem precisar criar -wal/-shm.
+    copia.execute("PRAGMA journal_mode=DELETE")
+    copia.close()
+    return destino
+
+
+def _sobreposicao(a, b, inicio, fim):
+    return max((min(b, fim) - max(a, inicio)).total_seconds(), 0.0)
+
+
+def _estados(cursor, maquina, inicio, fim):
+    """Trechos (status, ini, fim) da máquina em [inicio, fim), a partir de ``maquinas_historico``."""
+    rows = cursor.execute("""
+        SELECT status, inicio AS "inicio [timestamp]" FROM (
+            SELECT status, inicio, id FROM maquinas_historico WHERE maquina = :maquina AND inicio <= :inicio
+            ORDER BY inicio DESC, id DESC LIMIT 1)
+        UNION ALL
+        SELECT status, inicio FROM maquinas_historico WHERE maquina = :maquina AND inicio > :inicio AND inicio < :fim
+        ORDER BY 2
+    """, {"maquina": maquina, "inicio": inicio, "fim": fim}).fetchall()
+    trechos = []
+    for i, row in enumerate(rows):
+        a = max(row["inicio"], inicio)
+        b = rows[i + 1]["inicio"] if i + 1 < len(rows) else fim
+        if b > a:
+            trechos.append((row["status"], a, b))
+    return trechos
+
+
+def _produzindo_seg(trechos, inicio, fim):
+    return sum(_sobreposicao(a, b, inicio, fim) for status, a, b in trechos if status == "PRODUZINDO")
+
+
+def _ops_da_janela(cursor, maquina, inicio, fim, agora):
+    """OPs que estiveram na máquina em [inicio, fim), com o intervalo em que ocuparam a máquina.
+
+    Uma OP iniciada antes da última vez que a máquina ficou LIVRE até ``inicio``
+    já tinha terminado; o corte fica no SQL para a consulta não crescer com o histórico.
+    """
+    rows = cursor.execute("""
+        SELECT o.op, o.produto, o.planejado, o.produzido, o.meta_hora, o.status,
+               o.inicio_producao AS "inicio [timestamp]",
+               (SELECT MIN(h.inicio) FROM maquinas_historico h
+                WHERE h.maquina = o.maquina AND h.status = 'LIVRE' AND h.inicio > o.inicio_producao) AS "fim [timestamp]"
+        FROM ordens_producao o
+        WHERE o.maquina = :maquina AND o.inicio_producao < :fim
+          AND o.inicio_producao >= COALESCE((SELECT MAX(h.inicio) FROM maquinas_historico h
+                                             WHERE h.maquina = :maquina AND h.status = 'LIVRE' AND h.inicio <= :inicio), '')
+    """, {"maquina": maquina, "inicio": inicio, "fim": fim}).fetchall()
+    ops = []
+    for row in rows:
+        termino = row["fim"] or agora
+        if termino > inicio:
+            ops.append((dict(row), row["inicio"], termino))
+    return ops
+
+
+def _pecas_do_diario(cursor, op, inicio, fim):
+    """(momento, peças) dos apontamentos da OP em [inicio, fim); o estorno vale no momento do original."""
+    return cursor.execute("""
+        SELECT COALESCE(o.momento, a.momento) AS "momento [timestamp]", a.pecas
+        FROM apontamentos a
+        LEFT JOIN apontamentos o ON o.id = a.corrige
+        WHERE a.op = ? AND a.acao IN ('apontar_producao', 'estorno') AND a.pecas IS NOT NULL
+          AND COALESCE(o.momento, a.momento) >= ? AND COALESCE(o.momento, a.momento) < ?
+    """, (op, inicio, fim)).fetchall()
+
+
+def _paradas(cursor, maquina, inicio, fim, agora):
+    return cursor.execute("""
+        SELECT p.motivo, p.inicio AS "inicio [timestamp]", COALESCE(p.fim, ?) AS "fim [timestamp]",
+               COALESCE(m.planejada, 0) AS planejada
+        FROM paradas_log p
+        JOIN ordens_producao o ON o.op = p.op
+        LEFT JOIN motivos_parada m ON m.motivo = p.motivo
+        WHERE o.maquina = ? AND p.inicio < ? AND COALESCE(p.fim, ?) > ?
+    """, (agora, maquina, fim, agora, inicio)).fetchall()
+
+
+def relatorio_maquina_dia(conexao, calendario, maquina, dia, agora=None):
+    """Períodos (turnos + dia inteiro) de uma máquina em um dia: resumo, paradas e OPs."""
+    agora = agora or datetime.now()
+    dia = datetime(dia.year, dia.month, dia.day)
+    periodos = calendario.turnos_do_dia(dia) + [(ROTULO_DIA, dia, dia + timedelta(days=1))]
+    janela_inicio = min(p[1] for p in periodos)
+    janela_fim = min(max(p[2] for p in periodos), max(agora, janela_inicio))
+
+    cursor = conexao.cursor()
+    trechos = _estados(cursor, maquina, janela_inicio, janela_fim)
+    paradas = _paradas(cursor, maquina, janela_inicio, janela_fim, agora)
+    ops = []
+    for op_data, op_inicio, op_fim in _ops_da_janela(cursor, maquina, janela_inicio, janela_fim, agora):
+        ops.append((op_data, op_inicio, op_fim, _pecas_do_diario(cursor, op_data["op"], janela_inicio, janela_fim)))
+
+    resumo, por_motivo, progresso = [], [], []
+    dia_txt = dia.strftime("%Y-%m-%d")
+    for rotulo, inicio, fim in periodos:
+        fim = min(fim, max(agora, inicio))
+        duracao = (fim - inicio).total_seconds()
+        produzindo = _produzindo_seg(trechos, inicio, fim)
+        parada = sum(_sobreposicao(a, b, inicio, fim) for status, a, b in trechos if status == "PARADA")
+        planejado = calendario.segundos_planejados(inicio, fim, maquina) if duracao > 0 else 0.0
+
+        pecas_periodo, esperado = 0, 0.0
+        for op_data, op_inicio, op_fim, apontamentos in ops:
+            produzindo_op = _produzindo_seg(trechos, max(inicio, op_inicio), min(fim, op_fim))
+            pecas = sum(n for momento, n in apontamentos if inicio <= momento < fim)
+            if produzindo_op <= 0 and pecas == 0:
+                continue
+            pecas_periodo += pecas
+            esperado += produzindo_op / 3600 * op_data["meta_hora"]
+            progresso.append({
+                "dia": dia_txt, "maquina": maquina, "periodo": rotulo, "op": op_data["op"],
+                "produto": op_data["produto"], "pecas": pecas, "produzido": op_data["produzido"],
+                "planejado": op_data["planejado"],
+                "progresso": round(op_data["produzido"] / op_data["planejado"] * 100, 1) if op_data["planejado"] else None,
+                "status": op_data["status"],
+            })
+
+        disponivel = duracao - planejado
+        disponibilidade = min(produzindo / disponivel, 1.0) if disponivel > 0 else None
+        performance = min(pecas_periodo / esperado, 1.0) if esperado > 0 else None
+        oee = disponibilidade * performance * 100 if disponibilidade is not None and performance is not None else None
+        resumo.append({
+            "dia": dia_txt, "maquina": maquina, "periodo": rotulo,
+            "inicio": inicio.strftime("%Y-%m-%d %H:%M"), "fim": fim.strftime("%Y-%m-%d %H:%M"),
+            "pecas": pecas_periodo, "produzindo_seg": round(produzindo), "parada_seg": round(parada),
+            "planejado_seg": round(planejado),
+            "disponibilidade": None if disponibilidade is None else round(disponibilidade * 100, 1),
+            "performance": None if performance is None else round(performance * 100, 1),
+            "oee": None if oee is None else round(oee, 1),
+        })
+
+        motivos = {}
+        for p in paradas:
+            segundos = _sobreposicao(p["inicio"], p["fim"], inicio, fim)
+            if segundos <= 0:
+                continue
+            dados = motivos.setdefault(p["motivo"], {"planejada": p["planejada"], "quantidade": 0, "total_seg": 0.0})
+            dados["total_seg"] += segundos
+            if inicio <= p["inicio"] < fim:
+                dados["quantidade"] += 1
+        for motivo, dados in sorted(motivos.items(), key=lambda m: m[1]["total_seg"], reverse=True):
+            por_motivo.append({"dia": dia_txt, "maquina": maquina, "periodo": rotulo, "motivo": motivo,
+                               "planejada": "Sim" if dados["planejada"] else "Não",
+                               "quantidade": dados["quantidade"], "total_seg": round(dados["total_seg"])})
+
+    return {"resumo": resumo, "paradas": por_motivo, "ops": progresso}
+
+
+def _nome_arquivo(maquina):
+    return re.sub(r"[^\w.-]+", "_", maquina)
+
+
+def _tabela_html(titulo, linhas, colunas):
+    if not linhas:
+        return f"<h2>{html.escape(titulo)}</h2><p>Sem registros.</p>"
+    cabecalho = "".join(f"<th>{html.escape(c)}</th>" for c in colunas)
+    corpo = "".join(
+        "<tr>" + "".join(f"<td>{html.escape('--' if l[c] is None else str(l[c]))}</td>" for c in colunas) + "</tr>"
+        for l in linhas)
+    return f"<h2>{html.escape(titulo)}</h2><table><tr>{cabecalho}</tr>{corpo}</table>"
+
+
+ESTILO = ("<style>body{font-family:Arial,sans-serif;margin:20px}table{border-collapse:collapse;margin-bottom:16px}"
+          "th,td{border:1px solid #999;padding:3px 8px;text-align:right}th{background:#ddd}"
+          "td:first-child{text-align:left}</style>")
+
+
+def _pagina(titulo, corpo):
+    return (f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>{html.escape(titulo)}</title>{ESTILO}</head>"
+            f"<body><h1>{html.escape(titulo)}</h1>{corpo}</body></html>")
+
+
+def _caminho_relativo(site, dia, maquina):
+    partes = ([_nome_arquivo(site)] if site else []) + [dia, _nome_arquivo(maquina) + ".html"]
+    return "/".join(partes)
+
+
+def gravar_html(relatorio, maquina, dia, pasta, site=None):
+    caminho = os.path.join(pasta, _caminho_relativo(site, dia.strftime("%Y-%m-%d"), maquina))
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    corpo = (_tabela_html("Produção e OEE", relatorio["resumo"], COLUNAS_RESUMO[2:])
+             + _tabela_html("Paradas por motivo", relatorio["paradas"], COLUNAS_PARADAS[2:])
+             + _tabela_html("Andamento das OPs", relatorio["ops"], COLUNAS_OPS[2:]))
+    titulo = f"{site} / {maquina}" if site else maquina
+    with open(caminho, "w", encoding="utf-8") as arquivo:
+        arquivo.write(_pagina(f"{titulo} - {dia:%d/%m/%Y}", corpo))
+    return caminho
+
+
+_SNAPSHOTS = None
+_CONEXOES = {}
+_PASTA = None
+_AGORA = None
+
+
+def _iniciar_worker(snapshots, pasta, agora):
+    global _SNAPSHOTS, _PASTA, _AGORA
+    _SNAPSHOTS, _PASTA, _AGORA = snapshots, pasta, agora
+
+
+def _abrir_site(site):
+    """Conexão e calendário do snapshot do site, abertos uma vez por worker."""
+    aberto = _CONEXOES.get(site)
+    if aberto is None:
+        conexao = conectar_replica(_SNAPSHOTS[site])
+        aberto = _CONEXOES[site] = (conexao, Calendario.carregar(conexao))
+    return aberto
+
+
+def _gerar_tarefa(tarefa):
+    site, maquina, dia = tarefa
+    conexao, calendario = _abrir_site(site)
+    relatorio = relatorio_maquina_dia(conexao, calendario, maquina, dia, _AGORA)
+    gravar_html(relatorio, maquina, dia, _PASTA, site)
+    if site:
+        for linhas in relatorio.values():
+            for linha in linhas:
+                linha["site"] = site
+    return relatorio
+
+
+def _gravar_csv(caminho, colunas, linhas):
+    with open(caminho, "w", newline="", encoding="utf-8-sig") as arquivo:
+        escritor = csv.DictWriter(arquivo, fieldnames=colunas, delimiter=";")
+        escritor.writeheader()
+        escritor.writerows(linhas)
+
+
+def _gravar_indice(pasta, resumos):
+    linhas = [r for r in resumos if r["periodo"] == ROTULO_DIA]
+    corpo = "<table><tr><th>Dia</th><th>Máquina</th><th>Peças</th><th>OEE</th></tr>"
+    for r in linhas:
+        site = r.get("site")
+        link = _caminho_relativo(site, r["dia"], r["maquina"])
+        nome = f"{site} / {r['maquina']}" if site else r["maquina"]
+        oee = "--" if r["oee"] is None else f"{r['oee']:.1f}%"
+        corpo += (f"<tr><td>{r['dia']}</td><td><a href='{html.escape(link)}'>{html.escape(nome)}</a></td>"
+                  f"<td>{r['pecas']}</td><td>{oee}</td></tr>")
+    corpo += "</table><p>CSV: <a href='resumo.csv'>resumo</a>, <a href='paradas.csv'>paradas</a>, <a href='ops.csv'>OPs</a></p>"
+    with open(os.path.join(pasta, "index.html"), "w", encoding="utf-8") as arquivo:
+        arquivo.write(_pagina("Relatórios de produção", corpo))
+
+
+def maquinas_cadastradas(conexao):
+    return [r[0] for r in conexao.execute(
+        "SELECT maquina FROM maquinas_status UNION SELECT maquina FROM ordens_producao ORDER BY 1")]
+
+
+def _gerar(bancos, dia_inicio, dia_fim, pasta, processos):
+    """``bancos`` é {site ou None: caminho do banco}; um snapshot por banco, um pool para todos."""
+    inicio_execucao = time.perf_counter()
+    agora = datetime.now()
+    os.makedirs(pasta, exist_ok=True)
+    resumos, paradas, ops = [], [], []
+
+    with tempfile.TemporaryDirectory() as temporaria:
+        snapshots, tarefas = {}, []
+        dias = [dia_inicio + timedelta(days=i) for i in range((dia_fim - dia_inicio).days + 1)]
+        for i, (site, caminho_db) in enumerate(bancos.items()):
+            try:
+                snapshots[site] = criar_snapshot(caminho_db, os.path.join(temporaria, f"snapshot_{i}.db"))
+            except sqlite3.Error as e:
+                if site is None:
+                    raise
+                print(f"Site '{site}' fora dos relatórios: {e}")
+                continue
+            conexao = conectar_replica(snapshots[site])
+            maquinas = maquinas_cadastradas(conexao)
+            conexao.close()
+            tarefas += [(site, maquina, dia) for dia in dias if dia <= agora for maquina in maquinas]
+
+        processos = max(1, min(processos or os.cpu_count() or 1, len(tarefas)))
+        with ProcessPoolExecutor(max_workers=processos, initializer=_iniciar_worker,
+                                 initargs=(snapshots, pasta, agora)) as pool:
+            lote = max(1, len(tarefas) // (processos * 4))
+            for relatorio in pool.map(_gerar_tarefa, tarefas, chunksize=lote):
+                resumos += relatorio["resumo"]
+                paradas += relatorio["paradas"]
+                ops += relatorio["ops"]
+
+    prefixo = ("site",) if None not in bancos else ()
+    _gravar_csv(os.path.join(pasta, "resumo.csv"), prefixo + COLUNAS_RESUMO, resumos)
+    _gravar_csv(os.path.join(pasta, "paradas.csv"), prefixo + COLUNAS_PARADAS, paradas)
+    _gravar_csv(os.path.join(pasta, "ops.csv"), prefixo + COLUNAS_OPS, ops)
+    _gravar_indice(pasta, resumos)
+    return len(tarefas), time.perf_counter() - inicio_execucao
+
+
+def gerar_relatorios(caminho_db, dia_inicio, dia_fim, pasta=PASTA_PADRAO, processos=None):
+    """Gera os relatórios de [dia_inicio, dia_fim] para todas as máquinas, em paralelo.
+
+    Devolve (quantidade de relatórios, segundos gastos).
+    """
+    return _gerar({None: caminho_db}, dia_inicio, dia_fim, pasta, processos)
+
+
+def gerar_relatorios_sites(registro, dia_inicio, dia_fim, pasta=PASTA_PADRAO, processos=None):
+    """Como ``gerar_relatorios``, para todos os sites do registro de uma vez."""
+    return _gerar({site.nome: site.caminho for site in registro.sites}, dia_inicio, dia_fim, pasta, processos)
+
+
+def periodo_do_argumento(texto):
+    """'AAAA-MM' vira o mês inteiro; 'AAAA-MM-DD' vira um único dia."""
+    if len(texto) == 7:
+        inicio = datetime.strptime(texto, "%Y-%m")
+        proximo = (inicio + timedelta(days=32)).replace(day=1)
+        return inicio, proximo - timedelta(days=1)
+    dia = datetime.strptime(texto, "%Y-%m-%d")
+    return dia, dia
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Relatórios de turno/dia por máquina (HTML + CSV).")
+    parser.add_argument("periodo", help="AAAA-MM (mês inteiro) ou AAAA-MM-DD (um dia)")
+    parser.add_argument("--db", default="producao.db")
+    parser.add_argument("--pasta", default=PASTA_PADRAO)
+    parser.add_argument("--processos", type=int, default=None)
+    parser.add_argument("--sites", default=None, help="Registro de sites (JSON); gera para todos eles.")
+    args = parser.parse_args()
+
+    dia_inicio, dia_fim = periodo_do_argumento(args.periodo)
+    pasta = os.path.join(args.pasta, args.periodo)
+    if args.sites:
+        registro = RegistroSites.carregar(args.sites)
+        quantidade, duracao = gerar_relatorios_sites(registro, dia_inicio, dia_fim, pasta, args.processos)
+    else:
+        quantidade, duracao = gerar_relatorios(args.db, dia_inicio, dia_fim, pasta, args.processos)
+    print(f"{quantidade} relatórios em {duracao:.1f}s: {os.path.join(pasta, 'index.html')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Réplica somente-leitura do banco para relatórios e painéis.
+
+Uma thread copia o banco principal para um arquivo local com a API de
+backup do sqlite3 sempre que houver escrita nova (``PRAGMA data_version``),
+no máximo a cada ``intervalo`` segundos. A réplica fica em WAL, então quem
+está lendo dela não espera a cópia.
+
+Com o principal em WAL a cópia é um passo só: ela lê um snapshot e não
+bloqueia os apontamentos. Sem WAL (banco em compartilhamento de rede) a
+cópia anda em passos de ``PAGINAS_POR_PASSO`` páginas com uma pausa entre
+eles; cada passo segura o lock de leitura do principal só durante o passo,
+e os apontamentos entram nas pausas. Se o principal muda durante a cópia o sqlite a recomeça; depois de
+``REINICIOS_MAXIMOS`` a cópia é abandonada e a réplica anterior continua
+valendo até a próxima tentativa.
+
+``data_version`` muda com qualquer escrita, inclusive a do ``kpi_snapshot``
+a cada 2 s. Só o diário de apontamentos e os contadores de
+``versoes_cadastro`` disparam a cópia no intervalo normal; o resto (KPIs,
+métricas dos jobs) é levado no máximo a cada ``INTERVALO_SO_DERIVADOS_SEG``.
+"""
+import sqlite3
+import threading
+import time
+
+INTERVALO_PADRAO_SEG = 5.0
+INTERVALO_SO_DERIVADOS_SEG = 60.0
+PAGINAS_POR_PASSO = 256
+PAUSA_PASSO_SEG = 0.01
+REINICIOS_MAXIMOS = 3
+
+# Muda a cada apontamento (diário só cresce) e a cada escrita de cadastro.
+SQL_MARCA = """
+    SELECT (SELECT COALESCE(MAX(id), 0) FROM apontamentos),
+           (SELECT COALESCE(SUM(versao), 0) FROM versoes_cadastro)
+"""
+
+
+class CopiaAbandonada(Exception):
+    pass
+
+
+def conectar_replica(caminho):
+    conexao = sqlite3.connect(
+        f"file:{caminho}?mode=ro",
+        uri=True,
+        timeout=1,
+        detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES
+    )
+    conexao.row_factory = sqlite3.Row
+    return conexao
+
+
+def copiar_banco(origem, destino, paginas=PAGINAS_POR_PASSO, pausa=PAUSA_PASSO_SEG, reinicios=REINICIOS_MAXIMOS):
+    """Copia ``origem`` para ``destino`` em passos de ``paginas``; devolve a duração em segundos."""
+    restantes = [None, 0]
+
+    def progresso(status, restante, total):
+        if restantes[0] is not None and restante > restantes[0]:
+            restantes[1] += 1
+            if restantes[1] > reinicios:
+                raise CopiaAbandonada(f"banco principal mudou durante a cópia {restantes[1]} vezes")
+        restantes[0] = restante
+        if restante:
+            time.sleep(pausa)
+
+    inicio = time.perf_counter()
+    origem.backup(destino, pages=paginas, progress=progresso)
+    return time.perf_counter() - inicio
+
+
+class ReplicadorLeitura(threading.Thread):
+    def __init__(self, conectar_origem, caminho_replica, intervalo=INTERVALO_PADRAO_SEG,
+                 intervalo_derivados=INTERVALO_SO_DERIVADOS_SEG):
+        super().__init__(name="ReplicadorLeitura", daemon=True)
+        self.conectar_origem = conectar_origem
+        self.caminho_replica = caminho_replica
+        self.intervalo = intervalo
+        self.intervalo_derivados = intervalo_derivados
+        self.ultima_copia = None
+        self.duracao_ultima_copia = None
+        self.copias_abandonadas = 0
+        self._acordar = threading.Event()
+        self._parar = threading.Event()
+        self.pronta = threading.Event()
+
+    def atualizar_agora(self):
+        self._acordar.set()
+
+    def parar(self):
+        self._parar.set()
+        self._acordar.set()
+
+    def idade_seg(self):
+        if self.ultima_copia is None:
+            return None
+        return time.time() - self.ultima_copia
+
+    def run(self):
+        origem = self.conectar_origem()
+        if not origem:
+            return
+        destino = sqlite3.connect(self.caminho_replica)
+        destino.execute("PRAGMA journal_mode=WAL")
+        paginas = -1 if origem.execute("PRAGMA journal_mode").fetchone()[0] == "wal" else PAGINAS_POR_PASSO
+
+        ultima_versao = ultima_marca = None
+        while not self._parar.is_set():
+            try:
+                versao = origem.execute("PRAGMA data_version").fetchone()[0]
+                if versao != ultima_versao or self._acordar.is_set():
+                    marca = tuple(origem.execute(SQL_MARCA).fetchone())
+                    if (marca != ultima_marca or self._acordar.is_set()
+                            or time.time() - self.ultima_copia >= self.intervalo_derivados):
+                        self._acordar.clear()
+                        self.duracao_ultima_copia = copiar_banco(origem, destino, paginas)
+                        self.ultima_copia = time.time()
+                        ultima_versao, ultima_marca = versao, marca
+                        self.pronta.set()
+            except CopiaAbandonada as e:
+                self.copias_abandonadas += 1
+                print(f"Réplica não atualizada: {e}")
+            except sqlite3.Error as e:
+                print(f"Erro ao atualizar réplica: {e}")
+
+            self._acordar.wait(self.intervalo)
+
+        destino.close()
+        origem.close()
+
+
+if __name__ == "__main__":
+    from codigofinal import DB_REPLICA, conectar_db
+
+    replicador = ReplicadorLeitura(conectar_db, DB_REPLICA)
+    replicador.start()
+    try:
+        while replicador.is_alive():
+            replicador.join(timeout=1)
+    except KeyboardInterrupt:
+        replicador.parar()
+        replicador.join()
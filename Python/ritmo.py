@@ -0,0 +1,134 @@
+"""Detecção de mudança no ritmo de produção (CUSUM) por OP ativa.
+
+Alerta por limiar fixo não pega degradação lenta (ferramenta gastando, linha
+caindo de 200/h para 160/h ao longo de horas). ``DetectorRitmo`` recebe o
+mesmo fluxo do contador ``produzido`` que o ``EstimadorTaxa`` e acumula, em
+tempo produtivo, quanto a OP ficou devendo (ou adiantou) em relação a uma
+referência:
+
+- a ``meta_hora`` (só para baixo);
+- a base da própria OP, aprendida nos primeiros ``CALIBRACAO_SEG``
+  produtivos e depois seguida devagar só enquanto nada está desviando
+  (para cima e para baixo).
+
+A soma é em minutos de produção da referência, descontada a folga
+``FOLGA`` (fração do tempo produtivo); o alerta acende quando passa de
+``LIMIAR_MIN`` e apaga quando a soma volta a zero. Como ela é linear nas
+peças, tanto faz se o operador aponta peça a peça ou em lotes. Memória
+constante e O(1) por evento.
+"""
+import math
+from datetime import timedelta
+
+FOLGA = 0.05
+LIMIAR_MIN = 10.0
+# Teto da soma: depois que o ritmo volta, o alerta some em tempo parecido com o que levou para aparecer.
+TETO_MIN = 2 * LIMIAR_MIN
+CALIBRACAO_SEG = 30 * 60
+MEIA_VIDA_BASE_SEG = 2 * 3600
+
+
+class _Cusum:
+    __slots__ = ("soma", "desde", "pecas", "tempo", "alerta")
+
+    def __init__(self):
+        self.soma = 0.0
+        self.desde = None
+        self.pecas = 0
+        self.tempo = 0.0
+        self.alerta = False
+
+    def somar(self, excesso, pecas, dt, inicio):
+        if self.soma == 0.0 and excesso > 0:
+            self.desde, self.pecas, self.tempo = inicio, 0, 0.0
+        self.soma = min(max(self.soma + excesso, 0.0), TETO_MIN)
+        self.pecas += pecas
+        self.tempo += dt
+        if self.soma == 0.0:
+            self.desde = None
+            self.alerta = False
+        elif self.soma >= LIMIAR_MIN:
+            self.alerta = True
+
+    def taxa_hora(self):
+        return self.pecas / self.tempo * 3600 if self.tempo > 0 else None
+
+
+class DetectorRitmo:
+    __slots__ = ("meta_hora", "base", "pecas_calibracao", "tempo_calibracao", "meta", "queda", "alta",
+                 "ultimo_contador", "tempo", "marca", "parado")
+
+    def __init__(self, meta_hora):
+        self.meta_hora = meta_hora
+        self.base = None
+        self.pecas_calibracao = 0
+        self.tempo_calibracao = 0.0
+        self.meta = _Cusum()
+        self.queda = _Cusum()
+        self.alta = _Cusum()
+        self.ultimo_contador = None
+        self.tempo = 0.0
+        self.marca = None
+        self.parado = False
+
+    def observar(self, contador, parado, quando, meta_hora=None):
+        """Alimenta o detector com o contador acumulado (``produzido``) da OP."""
+        if meta_hora is not None:
+            self.meta_hora = meta_hora
+        if self.ultimo_contador is None:
+            self.ultimo_contador, self.marca, self.parado = contador, quando, parado
+            return
+
+        if not self.parado:
+            self.tempo += max((quando - self.marca).total_seconds(), 0.0)
+        self.marca, self.parado = quando, parado
+
+        delta = contador - self.ultimo_contador
+        self.ultimo_contador = contador
+        if delta > 0:
+            self._registrar(delta, self.tempo, quando)
+            self.tempo = 0.0
+        elif delta < 0:
+            # Estorno: tira as peças sem consumir tempo.
+            self._registrar(delta, 0.0, quando)
+
+    def _registrar(self, pecas, dt, quando):
+        folga = FOLGA * dt / 60
+        inicio = quando - timedelta(seconds=dt)
+
+        if self.meta_hora and self.meta_hora > 0:
+            self.meta.somar(-_adiantado_min(pecas, dt, self.meta_hora) - folga, pecas, dt, inicio)
+
+        if self.base is None:
+            self.pecas_calibracao += pecas
+            self.tempo_calibracao += dt
+            if self.tempo_calibracao >= CALIBRACAO_SEG and self.pecas_calibracao > 0:
+                self.base = self.pecas_calibracao / self.tempo_calibracao * 3600
+            return
+
+        adiantado = _adiantado_min(pecas, dt, self.base)
+        self.queda.somar(-adiantado - folga, pecas, dt, inicio)
+        self.alta.somar(adiantado - folga, pecas, dt, inicio)
+        if dt > 0 and self.queda.soma == 0.0 and self.alta.soma == 0.0:
+            peso = 1 - math.exp(-dt * math.log(2) / MEIA_VIDA_BASE_SEG)
+            self.base += peso * (pecas / dt * 3600 - self.base)
+
+    def alerta(self):
+        """Texto do alerta ativo mais relevante, ou None."""
+        for cusum, texto, referencia, valor in ((self.queda, "Queda de ritmo", "base", self.base),
+                                                (self.meta, "Abaixo da meta", "meta", self.meta_hora),
+                                                (self.alta, "Alta de ritmo", "base", self.base)):
+            if cusum.alerta:
+                taxa = cusum.taxa_hora()
+                ritmo = f"{_fmt(taxa)} " if taxa is not None else ""
+                return f"{texto}: {ritmo}desde {cusum.desde:%H:%M} ({referencia} {_fmt(valor)})"
+        return None
+
+
+def _adiantado_min(pecas, dt, taxa_hora):
+    """Minutos de produção à ``taxa_hora`` que as ``pecas`` feitas em ``dt`` segundos adiantaram."""
+    return pecas * 60 / taxa_hora - dt / 60
+
+
+def _fmt(taxa):
+    return f"{taxa:.0f}/h"
@@ -0,0 +1,302 @@
+"""Sequenciamento das OPs pendentes por máquina.
+
+Cada máquina tem uma fila de prioridade (heap) ordenada por prazo e, em
+caso de empate ou OP sem prazo, pela menor duração nominal
+(``restante / meta_hora``). A chave não depende da disponibilidade da
+máquina: uma parada registrada só muda o fator de escala daquela máquina e
+as previsões são recalculadas na leitura, sem reordenar nada.
+
+Incluir ou tirar uma OP empurra (ou marca como removida) uma entrada no
+heap e insere/remove a entrada na lista ordenada com ``bisect``; as somas
+acumuladas das durações só são refeitas a partir da posição alterada.
+``sincronizar`` lê só as OPs que os gatilhos anotaram em ``ops_alteradas``
+depois da última marca, e ``ordem_global`` intercala os planos das
+máquinas sob demanda, montando só as sugestões pedidas.
+"""
+import heapq
+import math
+from bisect import bisect_left
+from collections import namedtuple
+from datetime import datetime, timedelta
+from itertools import accumulate, islice
+
+DISPONIBILIDADE_MINIMA = 0.2
+# OPs relidas por consulta em ``sincronizar`` (limite de variáveis do SQLite).
+LOTE_LEITURA = 500
+COLUNAS_SEQUENCIAMENTO = ("status", "produzido", "planejado", "meta_hora", "prazo", "maquina")
+
+Sugestao = namedtuple("Sugestao", "op maquina inicio_previsto fim_previsto prazo atrasada")
+
+
+def criar_tabela_sequenciador(cursor):
+    """``ops_alteradas``: última alteração de cada OP, numerada em ordem pelos gatilhos."""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS ops_alteradas (
+        op TEXT PRIMARY KEY,
+        seq INTEGER NOT NULL
+    )""")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ops_alteradas_seq ON ops_alteradas (seq)")
+    proxima = "(SELECT COALESCE(MAX(seq), 0) + 1 FROM ops_alteradas)"
+    for nome, evento, op in (
+            ("trg_seq_ops_insert", "INSERT", "NEW.op"),
+            ("trg_seq_ops_update", "UPDATE OF " + ", ".join(COLUNAS_SEQUENCIAMENTO), "NEW.op"),
+            ("trg_seq_ops_delete", "DELETE", "OLD.op")):
+        cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {nome} AFTER {evento} ON ordens_producao
+        BEGIN INSERT OR REPLACE INTO ops_alteradas (op, seq) VALUES ({op}, {proxima}); END""")
+
+
+class _FilaMaquina:
+    __slots__ = ("heap", "vivos", "ordem", "acumulado", "parado_seg", "produtivo_seg", "ocupada_horas")
+
+    def __init__(self):
+        self.heap = []
+        self.vivos = {}
+        self.ordem = []
+        self.acumulado = []
+        self.parado_seg = 0.0
+        self.produtivo_seg = 0.0
+        self.ocupada_horas = 0.0
+
+    def disponibilidade(self):
+        total = self.produtivo_seg + self.parado_seg
+        if total <= 0:
+            return 1.0
+        return max(self.produtivo_seg / total, DISPONIBILIDADE_MINIMA)
+
+    def incluir(self, entrada):
+        self.vivos[entrada[2]] = entrada
+        heapq.heappush(self.heap, entrada)
+        i = bisect_left(self.ordem, entrada)
+        self.ordem.insert(i, entrada)
+        self.acumulado.insert(i, 0.0)
+        self._somar_desde(i)
+
+    def retirar(self, op):
+        # No heap a remoção é preguiçosa; a lista ordenada perde a entrada na hora.
+        entrada = self.vivos.pop(op)
+        i = bisect_left(self.ordem, entrada)
+        del self.ordem[i]
+        del self.acumulado[i]
+        self._somar_desde(i)
+        if len(self.heap) > 2 * len(self.vivos) + 16:
+            self.heap = list(self.ordem)
+
+    def montar(self):
+        """Ordena tudo de uma vez (carga inicial, com ``vivos`` já preenchido)."""
+        self.ordem = sorted(self.vivos.values())
+        self.heap = list(self.ordem)
+        self.acumulado = list(accumulate(entrada[1] for entrada in self.ordem))
+
+    def _somar_desde(self, i):
+        soma = self.acumulado[i - 1] if i > 0 else 0.0
+        for j in range(i, len(self.ordem)):
+            soma += self.ordem[j][1]
+            self.acumulado[j] = soma
+
+
+class Sequenciador:
+    def __init__(self):
+        self.filas = {}
+        self.ops = {}
+        self.carregado = False
+        self.marca = 0
+        self.ultimo_id_parada = 0
+        self.paradas_contadas = set()
+        self.produzido = {}
+        self.ocupacao = {}
+        self._carregando = False
+
+    def _fila(self, maquina):
+        fila = self.filas.get(maquina)
+        if fila is None:
+            fila = self.filas[maquina] = _FilaMaquina()
+        return fila
+
+    def adicionar_op(self, op, maquina, restante, meta_hora, prazo=None):
+        self.remover_op(op)
+        horas = restante / meta_hora if meta_hora > 0 else 0.0
+        chave_prazo = prazo.timestamp() if prazo else math.inf
+        entrada = (chave_prazo, horas, op, prazo)
+        if self._carregando:
+            self._fila(maquina).vivos[op] = entrada
+        else:
+            self._fila(maquina).incluir(entrada)
+        self.ops[op] = (maquina, restante, meta_hora, prazo)
+
+    def remover_op(self, op):
+        dados = self.ops.pop(op, None)
+        if dados is None:
+            return
+        self.filas[dados[0]].retirar(op)
+
+    def registrar_parada(self, maquina, duracao_seg):
+        self._fila(maquina).parado_seg += duracao_seg
+
+    def registrar_producao(self, maquina, pecas, meta_hora):
+        if meta_hora > 0:
+            self._fila(maquina).produtivo_seg += pecas * 3600 / meta_hora
+
+    def definir_ocupacao(self, maquina, restante, meta_hora):
+        """Horas nominais que a OP em andamento ainda vai ocupar a máquina."""
+        self._fila(maquina).ocupada_horas = restante / meta_hora if meta_hora > 0 else 0.0
+
+    def proxima(self, maquina):
+        fila = self.filas.get(maquina)
+        if not fila:
+            return None
+        while fila.heap and fila.vivos.get(fila.heap[0][2]) is not fila.heap[0]:
+            heapq.heappop(fila.heap)
+        return fila.heap[0][2] if fila.heap else None
+
+    def _sugestoes(self, maquina, agora):
+        fila = self.filas.get(maquina)
+        if not fila:
+            return
+        escala = 1 / fila.disponibilidade()
+        base = fila.ocupada_horas * escala
+        anterior = 0.0
+        for entrada, acumulado in zip(fila.ordem, fila.acumulado):
+            inicio = agora + timedelta(hours=base + anterior * escala)
+            fim = agora + timedelta(hours=base + acumulado * escala)
+            prazo = entrada[3]
+            yield Sugestao(entrada[2], maquina, inicio, fim, prazo, bool(prazo and fim > prazo))
+            anterior = acumulado
+
+    def plano(self, maquina, limite=None, agora=None):
+        return list(islice(self._sugestoes(maquina, agora or datetime.now()), limite))
+
+    def proximas(self, maquina, n=5, agora=None):
+        return self.plano(maquina, limite=n, agora=agora)
+
+    def pendentes(self, maquina):
+        fila = self.filas.get(maquina)
+        return len(fila.ordem) if fila else 0
+
+    def atrasadas(self, maquina, agora=None):
+        """Quantas OPs da fila terminam depois do prazo, sem montar as sugestões."""
+        fila = self.filas.get(maquina)
+        if not fila:
+            return 0
+        agora = (agora or datetime.now()).timestamp()
+        escala = 1 / fila.disponibilidade()
+        base = fila.ocupada_horas * escala
+        return sum(1 for entrada, acumulado in zip(fila.ordem, fila.acumulado)
+                   if agora + (base + acumulado * escala) * 3600 > entrada[0])
+
+    def carga_horas(self):
+        carga = {}
+        for maquina, fila in self.filas.items():
+            nominal = fila.ocupada_horas + (fila.acumulado[-1] if fila.acumulado else 0.0)
+            carga[maquina] = nominal / fila.disponibilidade()
+        return carga
+
+    def ordem_global(self, limite=None, agora=None):
+        """As OPs pendentes ordenadas pelo início previsto em sua máquina (só as ``limite`` primeiras são montadas)."""
+        agora = agora or datetime.now()
+        fluxos = [self._sugestoes(maquina, agora) for maquina in self.filas]
+        return list(islice(heapq.merge(*fluxos, key=lambda s: (s.inicio_previsto, s.op)), limite))
+
+    def sincronizar(self, conexao):
+        """Aplica ao plano só as OPs alteradas (``ops_alteradas``) e as paradas fechadas desde a última chamada."""
+        cursor = conexao.cursor()
+        if not self.carregado:
+            self.marca = cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM ops_alteradas").fetchone()[0]
+            self._carregar_historico(cursor)
+            self._carregando = True
+            self._aplicar(cursor.execute("""
+                SELECT op, maquina, planejado, produzido, meta_hora, status, prazo
+                FROM ordens_producao WHERE status NOT IN ('FINALIZADA', 'CANCELADA')
+            """).fetchall())
+            self._carregando = False
+            for fila in self.filas.values():
+                fila.montar()
+            self.carregado = True
+        else:
+            alteradas = cursor.execute("SELECT op, seq FROM ops_alteradas WHERE seq > ? ORDER BY seq",
+                                       (self.marca,)).fetchall()
+            if alteradas:
+                self.marca = alteradas[-1]["seq"]
+                ops = [r["op"] for r in alteradas]
+                for i in range(0, len(ops), LOTE_LEITURA):
+                    lote = ops[i:i + LOTE_LEITURA]
+                    linhas = cursor.execute(f"""
+                        SELECT op, maquina, planejado, produzido, meta_hora, status, prazo
+                        FROM ordens_producao WHERE op IN ({",".join("?" * len(lote))})
+                    """, lote).fetchall()
+                    self._aplicar(linhas, lote)
+
+        self._ler_paradas_fechadas(cursor)
+
+    def _aplicar(self, linhas, alteradas=()):
+        """Atualiza filas e ocupação com as ``linhas`` de OPs; ``alteradas`` sem linha foram apagadas."""
+        vistas = set()
+        for row in linhas:
+            op = row["op"]
+            vistas.add(op)
+            maquina_anterior = self.ocupacao.pop(op, None)
+            if maquina_anterior is not None:
+                self.definir_ocupacao(maquina_anterior, 0, 0)
+            if row["status"] in ("FINALIZADA", "CANCELADA"):
+                self.remover_op(op)
+                self.produzido.pop(op, None)
+                continue
+
+            anterior = self.produzido.get(op)
+            if anterior is not None and row["produzido"] > anterior:
+                self.registrar_producao(row["maquina"], row["produzido"] - anterior, row["meta_hora"])
+            self.produzido[op] = row["produzido"]
+
+            restante = max(row["planejado"] - row["produzido"], 0)
+            if row["status"] == "PENDENTE":
+                dados = (row["maquina"], restante, row["meta_hora"], row["prazo"])
+                if self.ops.get(op) != dados:
+                    self.adicionar_op(op, *dados)
+            else:
+                self.remover_op(op)
+                self.definir_ocupacao(row["maquina"], restante, row["meta_hora"])
+                self.ocupacao[op] = row["maquina"]
+
+        for op in alteradas:
+            if op not in vistas:
+                self.remover_op(op)
+                self.produzido.pop(op, None)
+                maquina = self.ocupacao.pop(op, None)
+                if maquina is not None:
+                    self.definir_ocupacao(maquina, 0, 0)
+
+    def _carregar_historico(self, cursor):
+        for row in cursor.execute("""
+            SELECT maquina, SUM(produzido * 3600.0 / meta_hora) AS produtivo
+            FROM ordens_producao WHERE meta_hora > 0 GROUP BY maquina
+        """).fetchall():
+            self._fila(row["maquina"]).produtivo_seg = row["produtivo"] or 0.0
+
+        # Marca d'água: todas as paradas com id <= ultimo_id_parada já estão fechadas e contadas.
+        self.ultimo_id_parada = self._limite_paradas_fechadas(cursor)
+        for row in cursor.execute("""
+            SELECT o.maquina, SUM(p.duracao_seg) AS parado
+            FROM paradas_log p JOIN ordens_producao o ON o.op = p.op
+            WHERE p.id <= ? GROUP BY o.maquina
+        """, (self.ultimo_id_parada,)).fetchall():
+            self._fila(row["maquina"]).parado_seg = row["parado"] or 0.0
+
+    def _limite_paradas_fechadas(self, cursor):
+        aberta = cursor.execute("SELECT MIN(id) FROM paradas_log WHERE fim IS NULL").fetchone()[0]
+        if aberta is not None:
+            return aberta - 1
+        return cursor.execute("SELECT COALESCE(MAX(id), 0) FROM paradas_log").fetchone()[0]
+
+    def _ler_paradas_fechadas(self, cursor):
+        for row in cursor.execute("""
+            SELECT p.id, o.maquina, p.duracao_seg FROM paradas_log p
+            JOIN ordens_producao o ON o.op = p.op
+            WHERE p.id > ? AND p.fim IS NOT NULL ORDER BY p.id
+        """, (self.ultimo_id_parada,)).fetchall():
+            if row["id"] in self.paradas_contadas:
+                continue
+            self.registrar_parada(row["maquina"], row["duracao_seg"] or 0)
+            self.paradas_contadas.add(row["id"])
+
+        self.ultimo_id_parada = max(self.ultimo_id_parada, self._limite_paradas_fechadas(cursor))
+        self.paradas_contadas = {i for i in self.paradas_contadas if i > self.ultimo_id_parada}
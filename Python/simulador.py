@@ -0,0 +1,262 @@
+"""Simulação Monte Carlo da capacidade da planta.
+
+Roda offline sobre um snapshot do banco: ajusta, por máquina, a frequência
+das paradas (intervalos exponenciais em horas produtivas) e a duração por
+motivo (reamostragem do histórico de ``paradas_log``), e então simula a
+fila de cada máquina na ordem sugerida pelo sequenciador. As replicações
+são divididas entre todos os núcleos com um pool de processos.
+
+Paradas de motivo planejado (refeição etc.) ficam fora do sorteio: esse
+tempo vem do calendário. A fila é simulada em horas disponíveis e cada
+término é levado para o relógio de parede somando as janelas planejadas e
+paradas programadas da máquina até ``HORIZONTE_DIAS``.
+
+Uso: python simulador.py [--db producao.db] [--replicacoes 5000] [--csv saida.csv]
+"""
+import argparse
+import csv
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+from calendario import Calendario
+from sequenciador import Sequenciador
+
+MIN_PARADAS_MAQUINA = 5
+PERCENTIS = (50, 80, 95)
+# Os términos são acumulados em histogramas com esta resolução (horas), para
+# que milhares de replicações x milhares de OPs não virem listas gigantes.
+RESOLUCAO_HORAS = 0.25
+# Até onde as janelas do calendário são aplicadas; depois disso o tempo corre sem pausas.
+HORIZONTE_DIAS = 120
+
+
+def abrir_snapshot(caminho_db, destino):
+    """Copia o banco com a API de backup e devolve uma conexão para a cópia."""
+    origem = sqlite3.connect(f"file:{caminho_db}?mode=ro", uri=True)
+    copia = sqlite3.connect(destino, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
+    origem.backup(copia)
+    origem.close()
+    copia.row_factory = sqlite3.Row
+    return copia
+
+
+def _ajustar_paradas(linhas):
+    """Distribuição empírica das durações (horas).
+
+    Sortear uniformemente a lista inteira equivale a sortear o motivo pela
+    frequência observada e depois uma duração daquele motivo.
+    """
+    return [row["duracao_seg"] / 3600 for row in linhas]
+
+
+def ajustar_modelo(conexao, agora=None):
+    """Monta o modelo serializável (máquinas, filas, distribuições de parada)."""
+    agora = agora or datetime.now()
+    cursor = conexao.cursor()
+
+    # Só motivos cadastrados e não planejados: o tempo planejado já entra pelo calendário.
+    paradas = cursor.execute("""
+        SELECT o.maquina, p.motivo, p.duracao_seg FROM paradas_log p
+        JOIN ordens_producao o ON o.op = p.op
+        JOIN motivos_parada m ON m.motivo = p.motivo
+        WHERE p.fim IS NOT NULL AND p.duracao_seg > 0 AND m.planejada = 0
+    """).fetchall()
+
+    produtivo = {r["maquina"]: (r["horas"] or 0.0) for r in cursor.execute("""
+        SELECT maquina, SUM(produzido * 1.0 / meta_hora) AS horas
+        FROM ordens_producao WHERE meta_hora > 0 GROUP BY maquina
+    """)}
+    horas_totais = sum(produtivo.values())
+
+    por_maquina = defaultdict(list)
+    for p in paradas:
+        por_maquina[p["maquina"]].append(p)
+    global_ajuste = _ajustar_paradas(paradas)
+    taxa_global = len(paradas) / horas_totais if horas_totais > 0 else 0.0
+
+    sequenciador = Sequenciador()
+    sequenciador.sincronizar(conexao)
+    calendario = Calendario.carregar(conexao)
+
+    maquinas = {}
+    for maquina in sorted(sequenciador.filas):
+        historico = por_maquina.get(maquina, [])
+        if len(historico) >= MIN_PARADAS_MAQUINA and produtivo.get(maquina, 0) > 0:
+            taxa = len(historico) / produtivo[maquina]
+            ajuste = _ajustar_paradas(historico)
+        else:
+            taxa, ajuste = taxa_global, global_ajuste
+
+        fila = sequenciador.filas[maquina]
+        ops = [(s.op, fila.vivos[s.op][1], s.prazo) for s in sequenciador.plano(maquina, agora=agora)]
+        maquinas[maquina] = {
+            "ocupada_horas": fila.ocupada_horas,
+            "taxa_paradas_hora": taxa,
+            "paradas": ajuste,
+            "ops": ops,
+            "trabalhos": [fila.ocupada_horas] + [horas for _, horas, _ in ops],
+            "pausas": _pausas(calendario, maquina, agora),
+        }
+    return {"agora": agora, "maquinas": maquinas}
+
+
+def _pausas(calendario, maquina, agora):
+    """Janelas planejadas da máquina como (horas disponíveis antes de cada uma, horas pausadas até o fim dela)."""
+    disponiveis, pausadas = [], []
+    total = 0.0
+    for inicio, fim in calendario.intervalos_planejados(agora, agora + timedelta(days=HORIZONTE_DIAS), maquina):
+        a, b = (max(inicio, agora) - agora).total_seconds() / 3600, (fim - agora).total_seconds() / 3600
+        disponiveis.append(a - total)
+        total += b - a
+        pausadas.append(total)
+    return disponiveis, pausadas
+
+
+def relogio_parede(horas, pausas):
+    """Converte horas disponíveis desde ``agora`` em horas de relógio, pulando as janelas planejadas."""
+    disponiveis, pausadas = pausas
+    i = bisect_left(disponiveis, horas)
+    return horas + (pausadas[i - 1] if i else 0.0)
+
+
+def simular_maquina(rng, dados):
+    """Uma replicação da fila de uma máquina; devolve as horas (disponíveis) de término de cada OP."""
+    taxa = dados["taxa_paradas_hora"]
+    paradas = dados["paradas"]
+    if not paradas:
+        taxa = 0.0
+    expovariate = rng.expovariate
+    sortear = rng.random
+    relogio = 0.0
+    proxima_falha = expovariate(taxa) if taxa > 0 else float("inf")
+    terminos = []
+
+    for trabalho in dados["trabalhos"]:
+        while trabalho > proxima_falha:
+            relogio += proxima_falha + paradas[int(sortear() * len(paradas))]
+            trabalho -= proxima_falha
+            proxima_falha = expovariate(taxa)
+        relogio += trabalho
+        proxima_falha -= trabalho
+        terminos.append(relogio)
+    # O primeiro trabalho é o restante da OP em andamento, que não entra no resultado.
+    return terminos[1:]
+
+
+_MODELO = None
+
+
+def _iniciar_worker(modelo):
+    global _MODELO
+    _MODELO = modelo
+
+
+def _rodar_lote(semente, replicacoes):
+    rng = random.Random(semente)
+    histogramas = {}
+    for dados in _MODELO["maquinas"].values():
+        contadores = [histogramas.setdefault(op, Counter()) for op, _, _ in dados["ops"]]
+        pausas = dados["pausas"]
+        for _ in range(replicacoes):
+            for contador, horas in zip(contadores, simular_maquina(rng, dados)):
+                contador[int(relogio_parede(horas, pausas) / RESOLUCAO_HORAS)] += 1
+    return histogramas
+
+
+def simular(modelo, replicacoes=5000, processos=None, semente=None):
+    """Executa as replicações em paralelo; devolve, por OP, o histograma das horas de término."""
+    processos = processos or os.cpu_count() or 1
+    semente = semente if semente is not None else time.time_ns()
+    lotes = [replicacoes // processos + (1 if i < replicacoes % processos else 0) for i in range(processos)]
+    lotes = [n for n in lotes if n > 0]
+
+    histogramas = defaultdict(Counter)
+    with ProcessPoolExecutor(max_workers=len(lotes), initializer=_iniciar_worker, initargs=(modelo,)) as pool:
+        futuros = [pool.submit(_rodar_lote, semente + i, n) for i, n in enumerate(lotes)]
+        for futuro in futuros:
+            for op, histograma in futuro.result().items():
+                histogramas[op].update(histograma)
+    return histogramas
+
+
+def _percentis(histograma, percentis, limite_horas=None):
+    total = sum(histograma.values())
+    alvos = [p / 100 * total for p in percentis]
+    resultado = [None] * len(percentis)
+    no_prazo = 0
+    acumulado = 0
+    for faixa in sorted(histograma):
+        acumulado += histograma[faixa]
+        horas = (faixa + 1) * RESOLUCAO_HORAS
+        for i, alvo in enumerate(alvos):
+            if resultado[i] is None and acumulado >= alvo:
+                resultado[i] = horas
+        if limite_horas is not None and horas <= limite_horas:
+            no_prazo = acumulado
+    return resultado, (no_prazo / total if limite_horas is not None else None)
+
+
+def resumir(modelo, histogramas):
+    agora = modelo["agora"]
+    linhas = []
+    for maquina, dados in modelo["maquinas"].items():
+        for op, _, prazo in dados["ops"]:
+            histograma = histogramas.get(op)
+            if not histograma:
+                continue
+            limite = (prazo - agora).total_seconds() / 3600 if prazo else None
+            valores, prob = _percentis(histograma, PERCENTIS, limite)
+            linha = {"op": op, "maquina": maquina, "prazo": prazo}
+            for p, horas in zip(PERCENTIS, valores):
+                linha[f"p{p}"] = agora + timedelta(hours=horas)
+            linha["prob_no_prazo"] = prob
+            linhas.append(linha)
+    return linhas
+
+
+def _formatar(data):
+    return data.strftime("%d/%m %H:%M") if data else "--"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulação Monte Carlo da carteira de OPs.")
+    parser.add_argument("--db", default="producao.db")
+    parser.add_argument("--replicacoes", type=int, default=5000)
+    parser.add_argument("--processos", type=int, default=None)
+    parser.add_argument("--semente", type=int, default=None)
+    parser.add_argument("--csv", default=None, help="Grava o resumo por OP neste arquivo.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as pasta:
+        conexao = abrir_snapshot(args.db, os.path.join(pasta, "snapshot.db"))
+        modelo = ajustar_modelo(conexao)
+        conexao.close()
+
+    inicio = time.perf_counter()
+    histogramas = simular(modelo, args.replicacoes, args.processos, args.semente)
+    linhas = resumir(modelo, histogramas)
+    duracao = time.perf_counter() - inicio
+
+    print(f"{'OP':<16}{'Máquina':<12}{'P50':>13}{'P80':>13}{'P95':>13}{'Prazo':>13}{'No prazo':>10}")
+    for linha in linhas:
+        prob = "--" if linha["prob_no_prazo"] is None else f"{linha['prob_no_prazo'] * 100:.0f}%"
+        print(f"{linha['op']:<16}{linha['maquina']:<12}{_formatar(linha['p50']):>13}{_formatar(linha['p80']):>13}"
+              f"{_formatar(linha['p95']):>13}{_formatar(linha['prazo']):>13}{prob:>10}")
+    print(f"\n{args.replicacoes} replicações em {duracao:.1f}s.")
+
+    if args.csv:
+        with open(args.csv, "w", newline="", encoding="utf-8") as arquivo:
+            escritor = csv.DictWriter(arquivo, fieldnames=["op", "maquina", "prazo"] + [f"p{p}" for p in PERCENTIS] + ["prob_no_prazo"])
+            escritor.writeheader()
+            escritor.writerows(linhas)
+
+
+if __name__ == "__main__":
+    main()
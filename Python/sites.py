@@ -0,0 +1,179 @@
+"""Registro de sites (plantas) e leitura federada sobre os bancos de cada um.
+
+Cada site tem o seu próprio ``producao.db``, perto das máquinas; todos os
+apontamentos gravam só no banco do site local. O registro vem de um JSON:
+
+    {"local": "Matriz",
+     "sites": [{"nome": "Matriz", "caminho": "producao.db"},
+               {"nome": "Filial Sul", "caminho": "//srv-sul/producao/producao.db"}]}
+
+Sem o arquivo, há um único site com o banco padrão. As consultas
+corporativas abrem cada banco somente-leitura e rodam em paralelo, uma
+thread por site (o sqlite3 solta o GIL enquanto a consulta executa); os
+resultados são juntados aqui, então o tempo de uma consulta corporativa é o
+do site mais lento, não a soma. Um site fora do ar não derruba a visão:
+o erro volta separado e os demais sites são mostrados.
+"""
+import json
+import os
+import sqlite3
+
+from analise_paradas import pareto
+from kpi_snapshot import ler_kpi
+from replica import conectar_replica
+
+ARQUIVO_PADRAO = "sites.json"
+NOME_SITE_PADRAO = "Local"
+# Espera máxima por um site antes de considerá-lo indisponível nesta consulta.
+TIMEOUT_SITE_SEG = 10.0
+
+
+class Site:
+    __slots__ = ("nome", "caminho")
+
+    def __init__(self, nome, caminho):
+        self.nome = nome
+        self.caminho = caminho
+
+    def __repr__(self):
+        return f"Site({self.nome!r}, {self.caminho!r})"
+
+
+class RegistroSites:
+    def __init__(self, sites, local=None):
+        if not sites:
+            raise ValueError("O registro precisa de pelo menos um site.")
+        self.sites = list(sites)
+        nomes = [s.nome for s in self.sites]
+        if len(set(nomes)) != len(nomes):
+            raise ValueError("Nomes de site repetidos no registro.")
+        self.local = self.site(local) if local else self.sites[0]
+
+    @classmethod
+    def carregar(cls, arquivo=ARQUIVO_PADRAO, caminho_padrao="producao.db"):
+        if not os.path.exists(arquivo):
+            return cls([Site(NOME_SITE_PADRAO, caminho_padrao)])
+        with open(arquivo, encoding="utf-8") as f:
+            dados = json.load(f)
+        # Caminhos relativos são relativos ao próprio arquivo de registro.
+        base = os.path.dirname(os.path.abspath(arquivo))
+        sites = [Site(s["nome"], os.path.join(base, s["caminho"])) for s in dados["sites"]]
+        return cls(sites, dados.get("local"))
+
+    def site(self, nome):
+        for site in self.sites:
+            if site.nome == nome:
+                return site
+        raise KeyError(f"Site desconhecido: {nome}")
+
+    def federado(self):
+        return len(self.sites) > 1
+
+
+class LeituraFederada:
+    def __init__(self, registro, max_threads=None):
+        from concurrent.futures import ThreadPoolExecutor  # só instalações federadas pagam o import
+
+        self.registro = registro
+        self.pool = ThreadPoolExecutor(max_workers=max_threads or min(32, len(registro.sites)),
+                                       thread_name_prefix="LeituraFederada")
+
+    def mapear(self, funcao, *args, sites=None):
+        """Roda ``funcao(conexao, *args)`` em todos os sites ao mesmo tempo.
+
+        Devolve ``(resultados, erros)``, ambos ``{nome do site: ...}``.
+        """
+        sites = sites or self.registro.sites
+        futuros = {site.nome: self.pool.submit(_executar, site, funcao, args) for site in sites}
+        resultados, erros = {}, {}
+        for nome, futuro in futuros.items():
+            try:
+                resultados[nome] = futuro.result(timeout=TIMEOUT_SITE_SEG)
+            except Exception as e:
+                erros[nome] = e
+        return resultados, erros
+
+    def consultar(self, sql, parametros=(), sites=None):
+        """A mesma consulta em todos os sites; linhas como dict com a chave ``site``."""
+        resultados, erros = self.mapear(_consultar, sql, parametros, sites=sites)
+        linhas = []
+        for site in self.registro.sites:
+            for row in resultados.get(site.nome, ()):
+                linha = {"site": site.nome}
+                linha.update(row)
+                linhas.append(linha)
+        return linhas, erros
+
+    def fechar(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _executar(site, funcao, args):
+    if not os.path.exists(site.caminho):
+        raise sqlite3.OperationalError(f"banco do site '{site.nome}' não encontrado: {site.caminho}")
+    conexao = conectar_replica(site.caminho)
+    try:
+        return funcao(conexao, *args)
+    finally:
+        conexao.close()
+
+
+def _consultar(conexao, sql, parametros):
+    return [dict(row) for row in conexao.execute(sql, parametros).fetchall()]
+
+
+def kpi_corporativo(federacao):
+    """Snapshot de KPIs de todas as máquinas de todos os sites."""
+    resultados, erros = federacao.mapear(ler_kpi)
+    linhas = []
+    for site in federacao.registro.sites:
+        for row in resultados.get(site.nome, ()):
+            row["site"] = site.nome
+            linhas.append(row)
+    return linhas, erros
+
+
+def resumo_sites(federacao):
+    """Por site: máquinas por status e OPs por status."""
+    maquinas, erros_m = federacao.consultar(
+        "SELECT status, COUNT(*) AS quantidade FROM maquinas_status GROUP BY status")
+    ops, erros_o = federacao.consultar(
+        "SELECT status, COUNT(*) AS quantidade FROM ordens_producao GROUP BY status")
+    resumo = {site.nome: {"maquinas": {}, "ops": {}} for site in federacao.registro.sites}
+    for row in maquinas:
+        resumo[row["site"]]["maquinas"][row["status"]] = row["quantidade"]
+    for row in ops:
+        resumo[row["site"]]["ops"][row["status"]] = row["quantidade"]
+    erros = dict(erros_m, **erros_o)
+    for nome in erros:
+        resumo.pop(nome, None)
+    return resumo, erros
+
+
+def pareto_corporativo(federacao, dimensao, dia_inicio=None, dia_fim=None):
+    """Pareto de paradas somando os agregados de todos os sites.
+
+    Na dimensão "maquina" a chave vira "site / máquina", já que nomes de linha
+    se repetem entre plantas.
+    """
+    resultados, erros = federacao.mapear(pareto, dimensao, dia_inicio, dia_fim)
+    somados = {}
+    for nome, linhas in resultados.items():
+        for r in linhas:
+            chave = f"{nome} / {r['chave']}" if dimensao == "maquina" else r["chave"]
+            atual = somados.setdefault(chave, {"chave": chave, "quantidade": 0, "total_seg": 0.0})
+            atual["quantidade"] += r["quantidade"]
+            atual["total_seg"] += r["total_seg"]
+
+    resultado = list(somados.values())
+    if dimensao == "hora":
+        resultado.sort(key=lambda r: r["chave"])
+    else:
+        resultado.sort(key=lambda r: r["total_seg"], reverse=True)
+    total = sum(r["total_seg"] for r in resultado) or 1
+    acumulado = 0.0
+    for r in resultado:
+        acumulado += r["total_seg"]
+        r["pct"] = r["total_seg"] / total * 100
+        r["pct_acumulado"] = acumulado / total * 100
+    return resultado, erros
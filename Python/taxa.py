@@ -0,0 +1,107 @@
+"""Estimador incremental da taxa de produção e da previsão de término da OP.
+
+A taxa é uma média com decaimento exponencial (meia-vida configurável) das
+peças por hora, calculada só sobre o tempo produtivo: enquanto a máquina
+está parada o relógio do estimador fica pausado. Cada evento custa O(1).
+"""
+import math
+from datetime import timedelta
+
+MEIA_VIDA_PADRAO_SEG = 15 * 60
+# Abaixo disso a taxa ainda é ruído de poucos apontamentos.
+TEMPO_MINIMO_SEG = 60
+
+
+class EstimadorTaxa:
+    __slots__ = ("tau", "pecas", "tempo", "ultimo_evento", "ultimo_contador", "parado", "parado_desde")
+
+    def __init__(self, meia_vida_seg=MEIA_VIDA_PADRAO_SEG):
+        self.tau = meia_vida_seg / math.log(2)
+        self.pecas = 0.0
+        self.tempo = 0.0
+        self.ultimo_evento = None
+        self.ultimo_contador = None
+        self.parado = False
+        self.parado_desde = None
+
+    def _tempo_produtivo_desde_ultimo(self, quando):
+        if self.ultimo_evento is None:
+            return 0.0
+        fim = self.parado_desde if self.parado else quando
+        return max((fim - self.ultimo_evento).total_seconds(), 0.0)
+
+    def _avancar(self, quando):
+        dt = self._tempo_produtivo_desde_ultimo(quando)
+        if dt > 0:
+            decaimento = math.exp(-dt / self.tau)
+            self.pecas *= decaimento
+            self.tempo = self.tempo * decaimento + self.tau * (1 - decaimento)
+        self.ultimo_evento = quando
+
+    def registrar(self, pecas, quando):
+        """Soma ``pecas`` produzidas no instante ``quando``."""
+        if self.ultimo_evento is None:
+            self.ultimo_evento = quando
+        self._avancar(quando)
+        self.pecas += pecas
+
+    def pausar(self, quando):
+        if not self.parado:
+            self._avancar(quando)
+            self.parado = True
+            self.parado_desde = quando
+
+    def retomar(self, quando):
+        if self.parado:
+            self.parado = False
+            self.parado_desde = None
+            self.ultimo_evento = quando
+
+    def observar(self, contador, parado, quando):
+        """Alimenta o estimador a partir do contador acumulado (``produzido``)."""
+        if parado:
+            self.pausar(quando)
+        else:
+            self.retomar(quando)
+
+        if self.ultimo_contador is None:
+            self.ultimo_contador = contador
+            self.ultimo_evento = quando
+            return
+
+        delta = contador - self.ultimo_contador
+        self.ultimo_contador = contador
+        if delta > 0:
+            self.registrar(delta, quando)
+
+    def taxa_hora(self, quando):
+        """Peças por hora no instante ``quando`` (None até haver tempo observado)."""
+        if self.ultimo_evento is None:
+            return None
+        dt = self._tempo_produtivo_desde_ultimo(quando)
+        decaimento = math.exp(-dt / self.tau)
+        tempo = self.tempo * decaimento + self.tau * (1 - decaimento)
+        if tempo < TEMPO_MINIMO_SEG:
+            return None
+        return self.pecas * decaimento / tempo * 3600
+
+    def previsao_termino(self, restante, quando):
+        """Data/hora prevista para produzir ``restante`` peças na taxa atual."""
+        if restante <= 0:
+            return quando
+        taxa = self.taxa_hora(quando)
+        if not taxa:
+            return None
+        return quando + timedelta(hours=restante / taxa)
+
+
+def formatar_taxa(taxa):
+    return "--" if taxa is None else f"{taxa:.0f}/h"
+
+
+def formatar_previsao(previsao, agora):
+    if previsao is None:
+        return "--"
+    if previsao.date() == agora.date():
+        return previsao.strftime("%H:%M")
+    return previsao.strftime("%d/%m %H:%M")
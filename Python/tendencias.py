@@ -0,0 +1,188 @@
+"""Minigráficos de tendência (peças/h, OEE e estado) por máquina.
+
+Cada série guarda as últimas ``capacidade`` amostras num ``Anel`` (array de
+tamanho fixo) e guarda num segundo anel os ids dos itens do canvas. A cada
+amostra nova, os itens da série são deslocados um passo para a esquerda,
+o segmento mais antigo é apagado e só o segmento novo é criado. Memória e
+itens no canvas ficam limitados pela capacidade, qualquer que seja o tempo
+que o painel passa aberto; o redesenho completo só acontece quando a escala
+muda (troca de OP) ou o layout é refeito.
+
+O módulo não importa o tkinter: recebe o canvas pronto.
+"""
+import math
+from array import array
+from itertools import count
+
+ESTADOS = ("LIVRE", "PRODUZINDO", "PARADA")
+SEM_ESTADO = -1
+
+
+class Anel:
+    """Buffer circular de tamanho fixo sobre ``array``."""
+    __slots__ = ("dados", "inicio", "tamanho")
+
+    def __init__(self, capacidade, tipo="d", vazio=math.nan):
+        self.dados = array(tipo, [vazio]) * capacidade
+        self.inicio = 0
+        self.tamanho = 0
+
+    @property
+    def capacidade(self):
+        return len(self.dados)
+
+    def anexar(self, valor):
+        """Acrescenta ``valor``; devolve o valor descartado (ou None se ainda havia espaço)."""
+        capacidade = len(self.dados)
+        if self.tamanho < capacidade:
+            self.dados[(self.inicio + self.tamanho) % capacidade] = valor
+            self.tamanho += 1
+            return None
+        descartado = self.dados[self.inicio]
+        self.dados[self.inicio] = valor
+        self.inicio = (self.inicio + 1) % capacidade
+        return descartado
+
+    def ultimo(self):
+        if not self.tamanho:
+            return None
+        return self.dados[(self.inicio + self.tamanho - 1) % len(self.dados)]
+
+    def __len__(self):
+        return self.tamanho
+
+    def __iter__(self):
+        capacidade = len(self.dados)
+        for i in range(self.tamanho):
+            yield self.dados[(self.inicio + i) % capacidade]
+
+
+_tags = count()
+
+
+class _Serie:
+    """Série desenhada da direita para a esquerda numa área fixa do canvas.
+
+    As subclasses definem ``_desenhar(anterior, valor, x)``, que devolve o item criado (ou None).
+    """
+
+    def __init__(self, canvas, capacidade, itens_max, tipo, vazio):
+        self.canvas = canvas
+        self.valores = Anel(capacidade, tipo, vazio)
+        self.itens = Anel(itens_max, "q", 0)
+        self.tag = f"serie{next(_tags)}"
+        self.x = self.y = self.largura = self.altura = 0
+        self.passo = 1.0
+
+    def posicionar(self, x, y, largura, altura):
+        self.x, self.y, self.largura, self.altura = x, y, largura, altura
+        self.passo = largura / (self.valores.capacidade - 1)
+        self.redesenhar()
+
+    def anexar(self, valor):
+        anterior = self.valores.ultimo()
+        self.valores.anexar(valor)
+        self.canvas.move(self.tag, -self.passo, 0)
+        self._guardar(self._desenhar(anterior, valor, self.x + self.largura))
+
+    def redesenhar(self):
+        self.canvas.delete(self.tag)
+        self.itens = Anel(self.itens.capacidade, "q", 0)
+        anterior = None
+        n = len(self.valores)
+        for i, valor in enumerate(self.valores):
+            self._guardar(self._desenhar(anterior, valor, self.x + self.largura - (n - 1 - i) * self.passo))
+            anterior = valor
+
+    def apagar(self):
+        self.canvas.delete(self.tag)
+
+    def _guardar(self, item):
+        descartado = self.itens.anexar(item or 0)
+        if descartado:
+            self.canvas.delete(descartado)
+
+
+class Sparkline(_Serie):
+    """Linha entre ``minimo`` e ``maximo``; valores None/NaN viram falhas na linha."""
+
+    def __init__(self, canvas, capacidade, minimo, maximo, cor):
+        # Um segmento liga cada amostra à anterior: capacidade - 1 segmentos cobrem a largura.
+        super().__init__(canvas, capacidade, capacidade - 1, "d", math.nan)
+        self.minimo, self.maximo, self.cor = minimo, maximo, cor
+
+    def anexar(self, valor):
+        super().anexar(math.nan if valor is None else valor)
+
+    def ajustar_escala(self, minimo, maximo):
+        if (minimo, maximo) != (self.minimo, self.maximo):
+            self.minimo, self.maximo = minimo, maximo
+            self.redesenhar()
+
+    def _y(self, valor):
+        faixa = (self.maximo - self.minimo) or 1
+        proporcao = min(max((valor - self.minimo) / faixa, 0.0), 1.0)
+        return self.y + self.altura - proporcao * self.altura
+
+    def _desenhar(self, anterior, valor, x):
+        if anterior is None or math.isnan(anterior) or math.isnan(valor):
+            return None
+        return self.canvas.create_line(x - self.passo, self._y(anterior), x, self._y(valor),
+                                       fill=self.cor, tags=(self.tag,))
+
+
+class FaixaEstado(_Serie):
+    """Faixa de retângulos coloridos pelo estado da máquina em cada amostra."""
+
+    def __init__(self, canvas, capacidade, cores):
+        super().__init__(canvas, capacidade, capacidade, "b", SEM_ESTADO)
+        self.cores = cores
+
+    def anexar(self, estado):
+        super().anexar(ESTADOS.index(estado) if estado in ESTADOS else SEM_ESTADO)
+
+    def _desenhar(self, anterior, valor, x):
+        if valor == SEM_ESTADO:
+            return None
+        return self.canvas.create_rectangle(x - self.passo, self.y, x, self.y + self.altura, width=0,
+                                            fill=self.cores.get(ESTADOS[valor], "gray"), tags=(self.tag,))
+
+
+class TendenciaMaquina:
+    """Acumula as leituras entre amostras e alimenta as três séries de uma máquina."""
+
+    def __init__(self, canvas, capacidade, cores):
+        self.taxa = Sparkline(canvas, capacidade, 0, 1, "#1565C0")
+        self.oee = Sparkline(canvas, capacidade, 0, 100, "#2E7D32")
+        self.estado = FaixaEstado(canvas, capacidade, cores)
+        self.soma_taxa = self.soma_oee = 0.0
+        self.n_taxa = self.n_oee = 0
+        self.ultimo_estado = None
+
+    def series(self):
+        return (self.taxa, self.oee, self.estado)
+
+    def observar(self, kpi):
+        """Soma uma leitura do ``kpi_snapshot`` à amostra em andamento."""
+        if kpi.get("taxa_hora") is not None:
+            self.soma_taxa += kpi["taxa_hora"]
+            self.n_taxa += 1
+        if kpi.get("oee") is not None:
+            self.soma_oee += kpi["oee"]
+            self.n_oee += 1
+        self.ultimo_estado = kpi.get("status_maquina")
+        if kpi.get("meta_hora"):
+            # Escala da taxa presa à meta da OP: muda só quando a OP muda.
+            self.taxa.ajustar_escala(0, kpi["meta_hora"] * 1.5)
+
+    def amostrar(self):
+        """Fecha a amostra (médias do intervalo) e desenha o segmento novo de cada série."""
+        self.taxa.anexar(self.soma_taxa / self.n_taxa if self.n_taxa else None)
+        self.oee.anexar(self.soma_oee / self.n_oee if self.n_oee else None)
+        self.estado.anexar(self.ultimo_estado)
+        self.soma_taxa = self.soma_oee = 0.0
+        self.n_taxa = self.n_oee = 0
+
+    def apagar(self):
+        for serie in self.series():
+            serie.apagar()
@@ -0,0 +1,50 @@
+"""Cada teste roda num banco em memória próprio (``BancoProducao.isolado``),
+copiado de um modelo que passou uma vez pelo ``inicializar_db``."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import codigofinal  # noqa: E402
+from banco import BancoProducao  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def modelo():
+    banco = BancoProducao.isolado("modelo")
+    anterior, codigofinal.BANCO = codigofinal.BANCO, banco
+    try:
+        codigofinal.inicializar_db()
+    finally:
+        codigofinal.BANCO = anterior
+    yield banco
+    banco.fechar()
+
+
+@pytest.fixture
+def banco(modelo, monkeypatch):
+    banco = BancoProducao.isolado(origem=modelo)
+    monkeypatch.setattr(codigofinal, "BANCO", banco)
+    yield banco
+    banco.fechar()
+
+
+@pytest.fixture
+def conexao(banco):
+    conexao = banco.conectar()
+    yield conexao
+    conexao.close()
+
+
+@pytest.fixture
+def nova_op(conexao):
+    def criar(op, maquina, planejado=100, meta_hora=60):
+        conexao.execute("""
+            INSERT INTO ordens_producao (op, produto, planejado, maquina, meta_hora, status)
+            VALUES (?, 'PRODUTO-TESTE', ?, ?, ?, 'PENDENTE')
+        """, (op, planejado, maquina, meta_hora))
+        conexao.commit()
+        return op
+    return criar
@@ -0,0 +1,95 @@
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+import transicoes
+from apontamentos import verificar_projecao
+from diario_local import DiarioLocal, SincronizadorDiario, aplicar_lote, conectar_diario
+from transicoes import TransicaoInvalida
+
+
+def _evento(tipo, op, quando, pecas=None, motivo=None):
+    return {"uuid": uuid.uuid4().hex, "tipo": tipo, "op": op, "pecas": pecas, "motivo": motivo,
+            "operador": "op1", "quando": quando}
+
+
+def _central(conexao, op):
+    row = conexao.execute("SELECT status, produzido FROM ordens_producao WHERE op = ?", (op,)).fetchone()
+    apontamentos = conexao.execute("SELECT COUNT(*) FROM apontamentos WHERE op = ?", (op,)).fetchone()[0]
+    return row["status"], row["produzido"], apontamentos
+
+
+def test_lote_reaplicado_nao_duplica(conexao, nova_op):
+    nova_op("T-1", "TESTE-1")
+    inicio = datetime(2026, 1, 5, 8)
+    eventos = [
+        _evento("iniciar", "T-1", inicio),
+        _evento("apontar_producao", "T-1", inicio + timedelta(minutes=1), pecas=4),
+        _evento("parar", "T-1", inicio + timedelta(minutes=2), motivo="Outros"),
+        _evento("retomar", "T-1", inicio + timedelta(minutes=5)),
+        _evento("apontar_producao", "T-1", inicio + timedelta(minutes=6), pecas=3),
+    ]
+    primeira = aplicar_lote(conexao, "T1", eventos)
+    assert [situacao for _, situacao, _ in primeira] == ["APLICADO"] * len(eventos)
+    depois = _central(conexao, "T-1")
+    assert depois == ("PRODUZINDO", 7, 5)
+
+    # O terminal caiu antes de marcar o lote como enviado e manda tudo de novo.
+    assert aplicar_lote(conexao, "T1", eventos) == primeira
+    assert _central(conexao, "T-1") == depois
+    assert conexao.execute("SELECT COUNT(*) FROM paradas_log").fetchone()[0] == 1
+    assert verificar_projecao(conexao) == []
+
+
+def test_conflito_reaplicado_nao_muda_nada(conexao, nova_op):
+    nova_op("T-1", "TESTE-1")
+    eventos = [_evento("parar", "T-1", datetime(2026, 1, 5, 8), motivo="Outros")]
+    (_, situacao, detalhe), = aplicar_lote(conexao, "T1", eventos)
+    assert situacao == "CONFLITO"
+    assert aplicar_lote(conexao, "T1", eventos) == [(eventos[0]["uuid"], situacao, detalhe)]
+    assert _central(conexao, "T-1") == ("PENDENTE", 0, 0)
+
+
+@pytest.fixture
+def terminal(banco, conexao, nova_op):
+    nova_op("T-1", "TESTE-1")
+    caminho = banco.derivado("diario", None).alvo
+    diario = DiarioLocal(caminho, "T1")
+    sincronizador = SincronizadorDiario(caminho, banco.conectar, "T1")
+    local = conectar_diario(caminho)
+    sincronizador.sincronizar(local)
+    yield diario, sincronizador, local
+    local.close()
+    diario.fechar()
+
+
+def test_terminal_offline_sincroniza_uma_vez(conexao, terminal):
+    diario, sincronizador, local = terminal
+    diario.iniciar("T-1")
+    diario.apontar_producao("T-1", 4)
+    diario.apontar_producao("T-1", 2)
+    diario.estornar_producao("T-1")
+    with pytest.raises(TransicaoInvalida):
+        diario.iniciar("T-1")
+    assert diario.pendentes() == 4
+
+    sincronizador.sincronizar(local)
+    sincronizador.sincronizar(local)
+    assert diario.pendentes() == 0
+    assert _central(conexao, "T-1") == ("PRODUZINDO", 4, 4)
+    assert verificar_projecao(conexao) == []
+
+
+def test_terminal_segue_as_mesmas_pre_condicoes(conexao, terminal):
+    diario, sincronizador, local = terminal
+    with pytest.raises(TransicaoInvalida):
+        diario.apontar_producao("T-1")
+    diario.iniciar("T-1")
+    diario.apontar_producao("T-1", 3)
+    diario.finalizar("T-1")
+    # Como no central: peças de OP finalizada ainda podem ser desfeitas.
+    assert diario.estornar_producao("T-1") == (0, 100)
+    sincronizador.sincronizar(local)
+    assert _central(conexao, "T-1") == ("FINALIZADA", 0, 4)
+    assert transicoes.PRE_CONDICOES["estornar_producao"][0] == ("PRODUZINDO", "FINALIZADA")
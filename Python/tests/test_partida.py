@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+
+import transicoes
+from apontamentos import verificar_paradas
+from partida import MOTIVO_QUEDA, MOTIVO_RECUPERACAO, SESSAO_VIVA, abrir_sessao, recuperar
+
+
+def _paradas_abertas(conexao):
+    return [tuple(r) for r in conexao.execute("SELECT op, motivo FROM paradas_log WHERE fim IS NULL ORDER BY id")]
+
+
+def _maquina(conexao, maquina):
+    return conexao.execute("SELECT status FROM maquinas_status WHERE maquina = ?", (maquina,)).fetchone()[0]
+
+
+def test_maquina_parada_sem_registro_ganha_parada(conexao, nova_op):
+    nova_op("T-1", "TESTE-1")
+    transicoes.iniciar(conexao, "T-1")
+    # Queda entre gravar o estado da máquina e abrir a parada.
+    conexao.execute("UPDATE maquinas_status SET status = 'PARADA' WHERE maquina = 'TESTE-1'")
+    conexao.commit()
+
+    assert len(recuperar(conexao, "T1", sessao_caiu=False)) == 1
+    assert _paradas_abertas(conexao) == [("T-1", MOTIVO_RECUPERACAO)]
+    assert recuperar(conexao, "T1", sessao_caiu=False) == []
+    transicoes.retomar(conexao, "T-1")
+    assert verificar_paradas(conexao) == []
+
+
+def test_parada_aberta_de_maquina_produzindo_e_fechada(conexao, nova_op):
+    nova_op("T-1", "TESTE-1")
+    transicoes.iniciar(conexao, "T-1")
+    transicoes.parar(conexao, "T-1", "Outros", "op1")
+    conexao.execute("UPDATE maquinas_status SET status = 'PRODUZINDO' WHERE maquina = 'TESTE-1'")
+    conexao.commit()
+
+    assert len(recuperar(conexao, "T1", sessao_caiu=False)) == 1
+    assert _paradas_abertas(conexao) == []
+    assert recuperar(conexao, "T1", sessao_caiu=False) == []
+    assert verificar_paradas(conexao) == []
+
+
+def test_maquina_produzindo_sem_op_volta_a_livre(conexao):
+    conexao.execute("INSERT OR REPLACE INTO maquinas_status (maquina, status) VALUES ('TESTE-9', 'PRODUZINDO')")
+    conexao.commit()
+    recuperar(conexao, "T1", sessao_caiu=False)
+    assert _maquina(conexao, "TESTE-9") == "LIVRE"
+
+
+def test_queda_do_terminal_para_a_op(conexao, nova_op):
+    nova_op("T-1", "TESTE-1")
+    partida = datetime.now()
+    assert abrir_sessao(conexao, "T1", agora=partida - 2 * SESSAO_VIVA) is False
+    transicoes.iniciar(conexao, "T-1", terminal="T1")
+    transicoes.apontar_producao(conexao, "T-1", 2, terminal="T1")
+
+    # Sem encerrar_sessao: na próxima partida a sessão anterior caiu.
+    caiu = abrir_sessao(conexao, "T1", agora=partida)
+    assert caiu is True
+    assert recuperar(conexao, "T1", caiu, agora=partida) != []
+    assert _paradas_abertas(conexao) == [("T-1", MOTIVO_QUEDA)]
+    assert _maquina(conexao, "TESTE-1") == "PARADA"
+    assert recuperar(conexao, "T1", False, agora=partida + timedelta(seconds=1)) == []
+    assert verificar_paradas(conexao) == []
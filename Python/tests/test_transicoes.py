@@ -0,0 +1,75 @@
+import pytest
+
+import operacoes_lote
+import transicoes
+from transicoes import TransicaoInvalida
+
+
+def _estado(conexao, op):
+    row = conexao.execute("""
+        SELECT o.status, o.produzido, COALESCE(m.status, 'LIVRE') AS maquina
+        FROM ordens_producao o LEFT JOIN maquinas_status m ON m.maquina = o.maquina WHERE o.op = ?
+    """, (op,)).fetchone()
+    return row["status"], row["produzido"], row["maquina"]
+
+
+def _contar(conexao, tabela):
+    return conexao.execute(f"SELECT COUNT(*) FROM {tabela}").fetchone()[0]
+
+
+def test_iniciar_exige_maquina_livre(conexao, nova_op):
+    nova_op("T-1", "TESTE-1")
+    nova_op("T-2", "TESTE-1")
+    transicoes.iniciar(conexao, "T-1")
+    with pytest.raises(TransicaoInvalida):
+        transicoes.iniciar(conexao, "T-2")
+    with pytest.raises(TransicaoInvalida):
+        transicoes.iniciar(conexao, "T-1")
+    assert _estado(conexao, "T-2") == ("PENDENTE", 0, "PRODUZINDO")
+
+
+def test_apontar_exige_maquina_produzindo(conexao, nova_op):
+    nova_op("T-1", "TESTE-1")
+    with pytest.raises(TransicaoInvalida):
+        transicoes.apontar_producao(conexao, "T-1")
+    transicoes.iniciar(conexao, "T-1")
+    transicoes.parar(conexao, "T-1", "Outros", "op1")
+    with pytest.raises(TransicaoInvalida):
+        transicoes.apontar_producao(conexao, "T-1")
+    with pytest.raises(TransicaoInvalida):
+        transicoes.parar(conexao, "T-1", "Outros", "op1")
+    transicoes.retomar(conexao, "T-1")
+    assert transicoes.apontar_producao(conexao, "T-1", 5) == (5, 100)
+
+
+def test_recusa_nao_deixa_rastro(conexao, nova_op):
+    nova_op("T-1", "TESTE-1")
+    antes = [_contar(conexao, t) for t in ("apontamentos", "maquinas_historico", "paradas_log")]
+    with pytest.raises(TransicaoInvalida):
+        transicoes.parar(conexao, "T-1", "Outros", "op1")
+    with pytest.raises(TransicaoInvalida):
+        transicoes.finalizar(conexao, "T-1")
+    assert [_contar(conexao, t) for t in ("apontamentos", "maquinas_historico", "paradas_log")] == antes
+    assert _estado(conexao, "T-1") == ("PENDENTE", 0, "LIVRE")
+
+
+def test_estorno_vale_com_op_finalizada(conexao, nova_op):
+    nova_op("T-1", "TESTE-1")
+    transicoes.iniciar(conexao, "T-1", terminal="T1")
+    transicoes.apontar_producao(conexao, "T-1", 5, terminal="T1")
+    transicoes.apontar_producao(conexao, "T-1", 3, terminal="T1")
+    transicoes.finalizar(conexao, "T-1", terminal="T2")
+    assert transicoes.estornar_producao(conexao, "T-1", terminal="T1") == (5, 100)
+    # Só os apontamentos do próprio terminal podem ser desfeitos.
+    with pytest.raises(TransicaoInvalida):
+        transicoes.estornar_producao(conexao, "T-1", terminal="T2")
+
+
+def test_estorno_recusado_com_op_cancelada(conexao, nova_op):
+    nova_op("T-1", "TESTE-1")
+    transicoes.iniciar(conexao, "T-1", terminal="T1")
+    transicoes.apontar_producao(conexao, "T-1", 5, terminal="T1")
+    operacoes_lote.cancelar(conexao, ["T-1"], "gestor")
+    with pytest.raises(TransicaoInvalida):
+        transicoes.estornar_producao(conexao, "T-1", terminal="T1")
+    assert _estado(conexao, "T-1")[:2] == ("CANCELADA", 5)
@@ -0,0 +1,291 @@
+"""Máquina de estados do apontamento (OP e máquina).
+
+Cada transição é uma única transação ``BEGIN IMMEDIATE``: o lock de
+escrita é pego antes da primeira leitura, as condições de estado ficam no
+``WHERE`` dos próprios ``UPDATE ... RETURNING`` e nada de interface roda
+com o lock na mão. Dois terminais disputando a mesma máquina não perdem
+atualização: o segundo encontra o estado já mudado e recebe
+``TransicaoInvalida``.
+
+Toda transição aplicada também é anotada em ``apontamentos`` (ver o módulo
+``apontamentos``), na mesma transação: quem, o quê, quando e de qual terminal.
+A mudança de estado da máquina vai para ``maquinas_historico`` com o mesmo
+``agora``, para a linha do tempo bater com ``paradas_log``.
+
+    LIVRE --iniciar--> PRODUZINDO --parar--> PARADA --retomar--> PRODUZINDO
+    PRODUZINDO --finalizar--> LIVRE
+"""
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+
+from analise_paradas import registrar_parada_fechada
+from linha_tempo import registrar_estado
+
+# Transações que seguram o lock por mais que isso são avisadas no console.
+ALERTA_RETENCAO_US = 50_000
+
+
+class TransicaoInvalida(Exception):
+    """A transição pedida não vale para o estado atual da OP ou da máquina."""
+
+
+_medicoes = defaultdict(lambda: {"quantidade": 0, "espera_us": 0, "retencao_us": 0, "max_retencao_us": 0})
+_trava_medicoes = threading.Lock()
+
+
+def estatisticas():
+    """Espera pelo lock e tempo com o lock, em microssegundos, por transição."""
+    with _trava_medicoes:
+        resultado = {}
+        for nome, m in _medicoes.items():
+            n = m["quantidade"] or 1
+            resultado[nome] = {"quantidade": m["quantidade"], "espera_media_us": m["espera_us"] // n,
+                               "retencao_media_us": m["retencao_us"] // n, "max_retencao_us": m["max_retencao_us"]}
+        return resultado
+
+
+def _medir(nome, espera_us, retencao_us):
+    with _trava_medicoes:
+        m = _medicoes[nome]
+        m["quantidade"] += 1
+        m["espera_us"] += espera_us
+        m["retencao_us"] += retencao_us
+        m["max_retencao_us"] = max(m["max_retencao_us"], retencao_us)
+    if retencao_us > ALERTA_RETENCAO_US:
+        print(f"Transição '{nome}' segurou o lock de escrita por {retencao_us} µs")
+
+
+# Estados aceitos (OP, máquina) por cada transição e o texto usado nas recusas.
+PRE_CONDICOES = {
+    "iniciar": (("PENDENTE",), "LIVRE"),
+    "apontar_producao": (("PRODUZINDO",), "PRODUZINDO"),
+    "parar": (("PRODUZINDO",), "PRODUZINDO"),
+    "retomar": (("PRODUZINDO",), "PARADA"),
+    "finalizar": (("PRODUZINDO",), "PRODUZINDO"),
+    # Correção de contagem vale com a máquina em qualquer estado e mesmo com a
+    # OP já finalizada (em outro terminal, inclusive).
+    "estornar_producao": (("PRODUZINDO", "FINALIZADA"), None),
+}
+# Estado que a máquina assume em cada transição que a muda.
+NOVO_STATUS_MAQUINA = {"iniciar": "PRODUZINDO", "parar": "PARADA", "retomar": "PRODUZINDO", "finalizar": "LIVRE"}
+ACOES = {
+    "iniciar": "iniciar a OP",
+    "apontar_producao": "apontar produção",
+    "parar": "apontar parada",
+    "retomar": "retomar a produção",
+    "finalizar": "finalizar a OP",
+    "estornar_producao": "desfazer o apontamento",
+}
+
+
+@contextmanager
+def transacao(conexao, nome):
+    """Transação ``BEGIN IMMEDIATE`` medida: commit na saída, rollback em qualquer exceção."""
+    if conexao.in_transaction:
+        conexao.commit()
+    pedido = time.perf_counter_ns()
+    conexao.execute("BEGIN IMMEDIATE")
+    obtido = time.perf_counter_ns()
+    try:
+        yield conexao.cursor()
+        conexao.commit()
+    except BaseException:
+        conexao.rollback()
+        raise
+    finally:
+        _medir(nome, (obtido - pedido) // 1000, (time.perf_counter_ns() - obtido) // 1000)
+
+
+def recusa(op, nome, status_op, maquina, status_maquina):
+    return TransicaoInvalida(f"Não é possível {ACOES[nome]}: a OP {op} está {status_op} "
+                             f"e a máquina '{maquina}' está {status_maquina}.")
+
+
+def _recusar(cursor, op, nome):
+    """Monta a mensagem de recusa a partir do estado atual (ainda dentro da transação)."""
+    row = cursor.execute("""
+        SELECT o.status AS status_op, o.maquina, COALESCE(m.status, 'LIVRE') AS status_maquina
+        FROM ordens_producao o LEFT JOIN maquinas_status m ON m.maquina = o.maquina WHERE o.op = ?
+    """, (op,)).fetchone()
+    if row is None:
+        raise TransicaoInvalida(f"A OP '{op}' não existe.")
+    raise recusa(op, nome, row["status_op"], row["maquina"], row["status_maquina"])
+
+
+def _iniciar(cursor, op, agora):
+    row = cursor.execute("""
+        UPDATE ordens_producao SET status = 'PRODUZINDO', inicio_producao = ?
+        WHERE op = ? AND status = 'PENDENTE'
+          AND COALESCE((SELECT status FROM maquinas_status m WHERE m.maquina = ordens_producao.maquina), 'LIVRE') = 'LIVRE'
+        RETURNING maquina
+    """, (agora, op)).fetchone()
+    if row is None:
+        _recusar(cursor, op, "iniciar")
+    cursor.execute("""
+        INSERT INTO maquinas_status (maquina, status) VALUES (?, 'PRODUZINDO')
+        ON CONFLICT (maquina) DO UPDATE SET status = excluded.status
+    """, (row["maquina"],))
+    return row["maquina"]
+
+
+def _apontar_producao(cursor, op, pecas):
+    row = cursor.execute("""
+        UPDATE ordens_producao SET produzido = produzido + ?
+        WHERE op = ? AND status = 'PRODUZINDO'
+          AND (SELECT status FROM maquinas_status m WHERE m.maquina = ordens_producao.maquina) = 'PRODUZINDO'
+        RETURNING produzido, planejado
+    """, (pecas, op)).fetchone()
+    if row is None:
+        _recusar(cursor, op, "apontar_producao")
+    return row["produzido"], row["planejado"]
+
+
+def _parar(cursor, op, motivo, operador, agora):
+    row = cursor.execute("""
+        UPDATE maquinas_status SET status = 'PARADA'
+        WHERE status = 'PRODUZINDO'
+          AND maquina = (SELECT maquina FROM ordens_producao WHERE op = ? AND status = 'PRODUZINDO')
+        RETURNING maquina
+    """, (op,)).fetchone()
+    if row is None:
+        _recusar(cursor, op, "parar")
+    cursor.execute("INSERT INTO paradas_log (op, motivo, inicio, operador) VALUES (?, ?, ?, ?)",
+                   (op, motivo, agora, operador))
+    return row["maquina"], cursor.lastrowid
+
+
+def _retomar(cursor, op, agora):
+    row = cursor.execute("""
+        UPDATE maquinas_status SET status = 'PRODUZINDO'
+        WHERE status = 'PARADA'
+          AND maquina = (SELECT maquina FROM ordens_producao WHERE op = ? AND status = 'PRODUZINDO')
+        RETURNING maquina
+    """, (op,)).fetchone()
+    if row is None:
+        _recusar(cursor, op, "retomar")
+    maquina = row["maquina"]
+
+    parada = cursor.execute("""
+        UPDATE paradas_log SET fim = :agora,
+            duracao_seg = CAST(ROUND((julianday(:agora) - julianday(inicio)) * 86400) AS INTEGER)
+        WHERE id = (SELECT id FROM paradas_log WHERE op = :op AND fim IS NULL ORDER BY id DESC LIMIT 1)
+        RETURNING id, inicio AS "inicio [timestamp]", motivo, operador, duracao_seg,
+            COALESCE((SELECT planejada FROM motivos_parada m WHERE m.motivo = paradas_log.motivo), 0) AS planejada
+    """, {"agora": agora, "op": op}).fetchone()
+    if parada is None:
+        return (maquina, None), None
+    registrar_parada_fechada(cursor, maquina, parada["motivo"], parada["operador"],
+                             parada["inicio"], agora, parada["planejada"])
+    return (maquina, parada["duracao_seg"]), parada["id"]
+
+
+def _finalizar(cursor, op):
+    row = cursor.execute("""
+        UPDATE maquinas_status SET status = 'LIVRE'
+        WHERE status = 'PRODUZINDO'
+          AND maquina = (SELECT maquina FROM ordens_producao WHERE op = ? AND status = 'PRODUZINDO')
+        RETURNING maquina
+    """, (op,)).fetchone()
+    if row is None:
+        _recusar(cursor, op, "finalizar")
+    op_row = cursor.execute(
+        "UPDATE ordens_producao SET status = 'FINALIZADA' WHERE op = ? RETURNING produzido", (op,)
+    ).fetchone()
+    return row["maquina"], op_row["produzido"]
+
+
+def _estornar_producao(cursor, op, terminal):
+    """Desfaz o último apontamento de peças deste terminal na OP que ainda não foi estornado."""
+    original = cursor.execute("""
+        SELECT id, pecas FROM apontamentos a
+        WHERE op = ? AND acao = 'apontar_producao' AND terminal IS ?
+          AND NOT EXISTS (SELECT 1 FROM apontamentos e WHERE e.corrige = a.id AND e.acao = 'estorno')
+        ORDER BY id DESC LIMIT 1
+    """, (op, terminal)).fetchone()
+    if original is None:
+        raise TransicaoInvalida(f"Não há apontamento de produção deste terminal para desfazer na OP {op}.")
+    row = cursor.execute("""
+        UPDATE ordens_producao SET produzido = produzido - ?
+        WHERE op = ? AND status IN ('PRODUZINDO', 'FINALIZADA') RETURNING produzido, planejado
+    """, (original["pecas"], op)).fetchone()
+    if row is None:
+        _recusar(cursor, op, "estornar_producao")
+    return (row["produzido"], row["planejado"]), original["id"], original["pecas"]
+
+
+def anotar(cursor, acao, op, agora, pecas=None, motivo=None, operador=None, terminal=None, uuid=None,
+           parada_id=None, corrige=None, observacao=None):
+    """Acrescenta uma linha ao diário de apontamentos (não faz commit). Devolve o id."""
+    cursor.execute("""
+        INSERT INTO apontamentos (uuid, momento, registrado_em, terminal, operador, acao, op, pecas, motivo,
+                                  parada_id, corrige, observacao)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (uuid, agora, datetime.now(), terminal, operador, acao, op, pecas, motivo, parada_id, corrige, observacao))
+    return cursor.lastrowid
+
+
+def aplicar(cursor, nome, op, pecas=1, motivo=None, operador=None, agora=None, terminal=None, uuid=None):
+    """Executa a transição ``nome`` dentro de uma transação já aberta (ex.: lote de sincronização)."""
+    agora = agora or datetime.now()
+    anotacao = {}
+    if nome in NOVO_STATUS_MAQUINA:
+        # Se a transição for recusada, a transação (ou o savepoint) desfaz este registro junto.
+        registrar_estado(cursor, op, NOVO_STATUS_MAQUINA[nome], agora)
+    if nome == "iniciar":
+        resultado = _iniciar(cursor, op, agora)
+    elif nome == "apontar_producao":
+        resultado = _apontar_producao(cursor, op, pecas)
+        anotacao["pecas"] = pecas
+    elif nome == "parar":
+        resultado, anotacao["parada_id"] = _parar(cursor, op, motivo, operador, agora)
+        anotacao["motivo"] = motivo
+    elif nome == "retomar":
+        resultado, anotacao["parada_id"] = _retomar(cursor, op, agora)
+    elif nome == "finalizar":
+        resultado = _finalizar(cursor, op)
+    elif nome == "estornar_producao":
+        resultado, anotacao["corrige"], estornadas = _estornar_producao(cursor, op, terminal)
+        nome, anotacao["pecas"] = "estorno", -estornadas
+    else:
+        raise ValueError(f"Transição desconhecida: {nome}")
+    anotar(cursor, nome, op, agora, operador=operador, terminal=terminal, uuid=uuid, **anotacao)
+    return resultado
+
+
+def iniciar(conexao, op, agora=None, operador=None, terminal=None):
+    """PENDENTE/LIVRE -> PRODUZINDO. Devolve a máquina."""
+    with transacao(conexao, "iniciar") as cursor:
+        return aplicar(cursor, "iniciar", op, operador=operador, agora=agora, terminal=terminal)
+
+
+def apontar_producao(conexao, op, pecas=1, operador=None, terminal=None):
+    """Soma peças à OP em produção. Devolve (produzido, planejado)."""
+    with transacao(conexao, "apontar_producao") as cursor:
+        return aplicar(cursor, "apontar_producao", op, pecas=pecas, operador=operador, terminal=terminal)
+
+
+def parar(conexao, op, motivo, operador, agora=None, terminal=None):
+    """PRODUZINDO -> PARADA, abrindo o registro em ``paradas_log``. Devolve a máquina."""
+    with transacao(conexao, "parar") as cursor:
+        return aplicar(cursor, "parar", op, motivo=motivo, operador=operador, agora=agora, terminal=terminal)
+
+
+def retomar(conexao, op, agora=None, operador=None, terminal=None):
+    """PARADA -> PRODUZINDO, fechando a parada aberta. Devolve (máquina, duração em segundos ou None)."""
+    with transacao(conexao, "retomar") as cursor:
+        return aplicar(cursor, "retomar", op, operador=operador, agora=agora, terminal=terminal)
+
+
+def finalizar(conexao, op, operador=None, terminal=None):
+    """PRODUZINDO -> FINALIZADA / LIVRE. Devolve (máquina, produzido)."""
+    with transacao(conexao, "finalizar") as cursor:
+        return aplicar(cursor, "finalizar", op, operador=operador, terminal=terminal)
+
+
+def estornar_producao(conexao, op, operador=None, terminal=None):
+    """Desfaz o último apontamento de peças do terminal na OP. Devolve (produzido, planejado)."""
+    with transacao(conexao, "estornar_producao") as cursor:
+        return aplicar(cursor, "estornar_producao", op, operador=operador, terminal=terminal)